@@ -4,16 +4,171 @@ MechDog IoT ESP32-C3-Mini-1 Communication Interface
 Communicates with the ESP32-C3 module via serial port
 """
 
+import os
 import serial
 import time
 import struct
+import queue
+import threading
+import contextlib
+import collections
+
+import binframe
+import decoder
+
+
+# Setters whose latest value is all that matters (warning flags, color,
+# distance, rgb, buzzer); actions and queries are never superseded
+SUPERSEDED_TYPES = {1, 2, 3, 4, 5}
+# Frames kept for read_response()/read_record() while the reader runs;
+# beyond this the oldest go, so a late read never returns ancient frames
+RESPONSE_QUEUE_SIZE = 64
+
+
+def _on(args):
+    """'on' (or nothing) -> 1, 'off' -> 0, anything else is an error"""
+    word = args[0].lower() if args else 'on'
+    if word not in ('on', 'off'):
+        raise ValueError(f"expected on/off, got {args[0]!r}")
+    return 1 if word == 'on' else 0
+
+
+# Command words of interactive_mode (and mission.py):
+# verb -> (cmd_type, params) or raw text
+VERBS = {
+    'face': lambda a: (1, (_on(a), 0, 0)),
+    'obj': lambda a: (1, (0, _on(a), 0)),
+    'impact': lambda a: (1, (0, 0, _on(a))),
+    'color': lambda a: (2, (_on(a),)),
+    'distance': lambda a: (3, (_on(a),)),
+    'rgb': lambda a: (4, (int(a[0]), int(a[1]), int(a[2]))),
+    'buzz': lambda a: (5, (_on(a),)),
+    'action': lambda a: (6, (int(a[0]), int(a[1]))),
+    'query': lambda a: (7, ()),
+    'raw': lambda a: ' '.join(a),
+}
+
+
+def parse_command(line):
+    """
+    One command line ('rgb 255 0 0') -> (cmd_type, params), or the text for
+    'raw'; raises ValueError for an unknown command or bad arguments
+    """
+    words = line.split()
+    verb = VERBS.get(words[0].lower()) if words else None
+    if verb is None:
+        raise ValueError(f"Unknown command {words[0] if words else line!r}")
+    try:
+        return verb(words[1:])
+    except (IndexError, ValueError):
+        raise ValueError(f"Bad arguments in {line.strip()!r}") from None
+
+
+def build_iot_command(cmd_type, *params):
+    """Build an IoT command string: CMD|type|param1|param2|...|$"""
+    cmd_str = f"CMD|{cmd_type}|"
+    cmd_str += '|'.join(str(p) for p in params)
+    cmd_str += "|$"
+    return cmd_str
+
+
+def parse_iot_frame(frame):
+    """
+    Split a CMD|type|...|$ frame (bytes) into (cmd_type, [fields])
+    Raises ValueError if the type field is not a number
+    """
+    fields = frame[4:-1].decode('ascii', errors='ignore').split('|')
+    if fields and fields[-1] == '':
+        fields.pop()
+    return int(fields[0]), fields[1:]
+
+
+def parse_binary_frame(frame):
+    """Binary counterpart of parse_iot_frame: (cmd_type, [fields]) of a binframe frame"""
+    cmd_type, values = binframe.decode(frame, binframe.REPLIES)
+    return cmd_type, [str(v) for v in values]
+
+
+class FrameBuffer:
+    """
+    Incrementally split CMD|...|$ frames out of a serial byte stream
+    Bytes are appended to one reusable bytearray and every byte is only
+    scanned once for the '$' terminator, no matter how the stream is chunked.
+    Text outside of frames (debug prints, NIOT echoes) is discarded.
+    """
+
+    def __init__(self, max_size=4096):
+        self.buffer = bytearray()
+        self.max_size = max_size
+        self.overflows = 0
+        self._scan = 0
+
+    def feed(self, data):
+        """Append received bytes and return the list of complete frames"""
+        buf = self.buffer
+        buf += data
+        frames = []
+        start = 0
+        while True:
+            end = buf.find(b'$', self._scan)
+            if end < 0:
+                break
+            head = buf.rfind(b'CMD|', start, end)
+            if head >= 0:
+                frames.append(bytes(buf[head:end + 1]))
+            start = self._scan = end + 1
+        if start:
+            del buf[:start]
+        if len(buf) > self.max_size:
+            # No terminator in sight, drop the garbage instead of growing
+            del buf[:]
+            self.overflows += 1
+        self._scan = len(buf)
+        return frames
+
 
 class MechDogIoT:
-    def __init__(self, port='/dev/ttyUSB0', baudrate=115200):
-        """Initialize serial connection to ESP32-C3-Mini-1"""
-        self.serial = serial.Serial(port, baudrate, timeout=1)
+    def __init__(self, port='/dev/ttyUSB0', baudrate=115200, verbose=True):
+        """
+        Initialize serial connection to ESP32-C3-Mini-1
+        verbose=False keeps the send path free of console output
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.metrics = None
+        self.serial = self._open(port, baudrate)
+        self.verbose = verbose
+        self._batch = None
+        self._batch_depth = 0
+        self._batch_keys = {}
+        self._batch_max_bytes = 0
+        self._batch_size = 0
+        self.commands_dropped = 0
+        self._flow = None
+        self._recorder = None
+        self.frames = FrameBuffer()
+        self.binary = False
+        self._parse = parse_iot_frame
+        # (binary, done event) while negotiate_protocol() waits for its ack
+        self._switch = None
+        self._switch_acked = False
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.callback_errors = 0
+        self._subscribers = {}
+        self._responses = None
+        self._reader = None
+        self._reading = False
+        self._record_decoder = decoder.RecordDecoder()
+        self._records = collections.deque()
+        if self.verbose:
+            print(f"Connected to MechDog IoT on {self.serial.port} at {baudrate} baud")
+    
+    def _open(self, port, baudrate):
+        """Open the connection (overridden by mechdogd.MechDogClient)"""
+        ser = serial.Serial(port, baudrate, timeout=1)
         time.sleep(2)  # Wait for connection to stabilize
-        print(f"Connected to MechDog IoT on {port} at {baudrate} baud")
+        return ser
     
     def setup_wifi_hotspot(self, ssid="MechDog", password="12345678"):
         """
@@ -39,17 +194,292 @@ class MechDogIoT:
         """Send a command string to the ESP32-C3"""
         if not cmd.endswith('\n'):
             cmd += '\n'
-        self.serial.write(cmd.encode('utf-8'))
+        self._write(cmd.encode('utf-8'), cmd.strip())
+
+    def _send_bytes(self, data):
+        self.serial.write(data)
         self.serial.flush()
-        print(f"Sent: {cmd.strip()}")
+        if self.metrics is not None:
+            self.metrics.bytes_out += len(data)
+
+    def _write(self, data, text, key=None):
+        """Write one command, or add it to the open batch (see batch())"""
+        if self._batch is None:
+            if self._flow is not None:
+                queued = self._flow.put(data, key)
+                if self.verbose:
+                    print(f"Queued: {text}" if queued else f"Dropped (send queue full): {text}")
+                return
+            self._send_bytes(data)
+            if self.verbose:
+                print(f"Sent: {text}")
+            return
+        if key is not None:
+            index = self._batch_keys.get(key)
+            if index is not None:
+                # A newer value supersedes the one still waiting in the batch
+                self._batch_size -= len(self._batch[index][0])
+                self._batch[index] = None
+                self.commands_dropped += 1
+            self._batch_keys[key] = len(self._batch)
+        self._batch.append((data, text, key))
+        self._batch_size += len(data)
+        if self._batch_max_bytes and self._batch_size >= self._batch_max_bytes:
+            self.flush_batch()
+
+    @contextlib.contextmanager
+    def batch(self, max_bytes=0):
+        """
+        Gather commands and write them with a single write + flush on exit
+        Within the batch only the last value of a setter command
+        (SUPERSEDED_TYPES) is sent; commands_dropped counts the others.
+        max_bytes > 0 flushes early once that much data is pending.
+        Batches nest; the outermost one writes.
+        """
+        if self._batch_depth == 0:
+            self._batch = []
+            self._batch_keys = {}
+            self._batch_size = 0
+            self._batch_max_bytes = max_bytes
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush_batch()
+                self._batch = None
+
+    def flush_batch(self):
+        """Write everything gathered in the current batch"""
+        if not self._batch:
+            return
+        pending = [entry for entry in self._batch if entry is not None]
+        self._batch.clear()
+        self._batch_keys.clear()
+        self._batch_size = 0
+        if self._flow is not None:
+            # Paced one by one, still coalescing with what is already queued
+            for data, text, key in pending:
+                queued = self._flow.put(data, key)
+                if self.verbose:
+                    print(f"Queued: {text}" if queued else f"Dropped (send queue full): {text}")
+            return
+        self._send_bytes(b''.join(data for data, text, key in pending))
+        if self.verbose:
+            for data, text, key in pending:
+                print(f"Sent: {text}")
     
+    def start_reader(self):
+        """
+        Start a background thread that consumes serial input continuously
+        Complete frames are handed to subscribers (see subscribe()) and to
+        read_response()/read_sensor_data(), so nothing piles up in between.
+        """
+        if self._reader is not None:
+            return
+        self._responses = self.subscribe(None, queue.Queue(RESPONSE_QUEUE_SIZE))
+        self._reading = True
+        self._reader = threading.Thread(target=self._reader_loop, daemon=True)
+        self._reader.start()
+
+    def stop_reader(self):
+        """Stop the background reader thread"""
+        if self._reader is None:
+            return
+        self._reading = False
+        if hasattr(self.serial, 'cancel_read'):
+            self.serial.cancel_read()
+        self._reader.join()
+        self._reader = None
+        self.unsubscribe(None, self._responses)
+        self._responses = None
+
+    def subscribe(self, cmd_type, target):
+        """
+        Deliver every frame of cmd_type (None = all types) to target
+        target is a callable taking (cmd_type, fields, frame) or a queue
+        receiving the same tuple. Callbacks run on the reader thread.
+        """
+        subscribers = dict(self._subscribers)
+        subscribers[cmd_type] = subscribers.get(cmd_type, ()) + (target,)
+        self._subscribers = subscribers
+        return target
+
+    def unsubscribe(self, cmd_type, target):
+        """Remove a target registered with subscribe()"""
+        subscribers = dict(self._subscribers)
+        targets = tuple(t for t in subscribers.get(cmd_type, ()) if t is not target)
+        if targets:
+            subscribers[cmd_type] = targets
+        else:
+            subscribers.pop(cmd_type, None)
+        self._subscribers = subscribers
+
+    def attach_recorder(self, recorder):
+        """
+        Record every received frame and every IoT command sent
+        recorder is a telemetry_recorder.TelemetryRecorder (or anything with
+        on_frame/on_command); starts the background reader if needed.
+        """
+        self.detach_recorder()
+        self.start_reader()
+        self._recorder = recorder
+        self.subscribe(None, recorder.on_frame)
+
+    def detach_recorder(self):
+        """Stop recording"""
+        if self._recorder is not None:
+            self.unsubscribe(None, self._recorder.on_frame)
+            self._recorder = None
+
+    def enable_metrics(self, registry=None, device=None):
+        """
+        Count traffic, frames and round trips in a metrics.DeviceMetrics
+        (registry defaults to metrics.REGISTRY, device to the port name).
+        Frames are only counted while the reader thread runs.
+        """
+        import metrics
+
+        registry = registry if registry is not None else metrics.REGISTRY
+        self.metrics = registry.device(device or os.path.basename(str(self.port)))
+        if self._flow is not None:
+            self._flow.metrics = self.metrics
+        return self.metrics
+
+    def enable_flow_control(self, policy='coalesce', maxsize=32, interval=None, skip_repeats=False):
+        """
+        Send commands through a flow_control.SendQueue paced to wifi_main's
+        intake rate instead of writing them straight away
+        policy: 'block', 'drop-oldest' or 'coalesce' (latest value of a
+        setter replaces a waiting one, see SUPERSEDED_TYPES)
+        skip_repeats: don't write a command identical to the previous one
+        """
+        import flow_control
+
+        if self._flow is not None:
+            self._flow.close()
+        self._flow = flow_control.SendQueue(self._send_bytes, maxsize, policy,
+                                            interval or flow_control.PACING_INTERVAL, self.metrics,
+                                            skip_repeats)
+        return self._flow
+
+    def reconnect(self):
+        """Close and reopen the connection, restarting the reader if it ran"""
+        reading = self._reader is not None
+        self.stop_reader()
+        if self.serial.is_open:
+            self.serial.close()
+        self.serial = self._open(self.port, self.baudrate)
+        self.frames = binframe.FrameDecoder() if self.binary else FrameBuffer()
+        if self.metrics is not None:
+            self.metrics.reconnects += 1
+        if reading:
+            self.start_reader()
+
+    def _reader_loop(self):
+        chunk = bytearray(1024)
+        view = memoryview(chunk)
+        while self._reading:
+            try:
+                # Block for the first byte (up to the port timeout), then
+                # take whatever else has already arrived
+                size = min(max(self.serial.in_waiting, 1), len(chunk))
+                n = self.serial.readinto(view[:size])
+            except (serial.SerialException, OSError, TypeError):
+                # TypeError: pyserial's fd is gone after close()
+                break
+            if n:
+                if self.metrics is not None:
+                    self.metrics.bytes_in += n
+                self._feed(view[:n])
+
+    def read_available(self):
+        """
+        Read what has arrived and dispatch its frames like the reader thread,
+        for callers running their own event loop on serial.fileno()
+        Returns the number of bytes read.
+        """
+        data = self.serial.read(self.serial.in_waiting or 1)
+        if data:
+            if self.metrics is not None:
+                self.metrics.bytes_in += len(data)
+            self._feed(data)
+        return len(data)
+
+    def _feed(self, data):
+        """Split received bytes into frames and dispatch them"""
+        switch = self._switch
+        if switch is None:
+            for frame in self.frames.feed(data):
+                self._dispatch_frame(frame)
+            return
+        # A protocol switch is pending: go byte by byte, so whatever follows
+        # the ack in this chunk reaches the new decoder and not the old one
+        for i in range(len(data)):
+            for frame in self.frames.feed(data[i:i + 1]):
+                self._dispatch_frame(frame)
+            if self._switch_acked:
+                binary, done = switch
+                self.frames = binframe.FrameDecoder() if binary else FrameBuffer()
+                self._parse = parse_binary_frame if binary else parse_iot_frame
+                self.binary = binary
+                self._switch = None
+                self._switch_acked = False
+                done.set()
+                self._feed(data[i + 1:])
+                return
+
+    def _dispatch_frame(self, frame):
+        try:
+            cmd_type, fields = self._parse(frame)
+        except ValueError:
+            if self.metrics is not None:
+                self.metrics.parse_errors += 1
+            return
+        self.frames_received += 1
+        if self.metrics is not None:
+            self.metrics.frame_received(cmd_type)
+        subscribers = self._subscribers
+        for target in subscribers.get(cmd_type, ()) + subscribers.get(None, ()):
+            if callable(target):
+                try:
+                    target(cmd_type, fields, frame)
+                except Exception as e:
+                    # A broken callback must not take the reader thread down
+                    self.callback_errors += 1
+                    print(f"Subscriber {getattr(target, '__name__', target)!r} failed on {frame!r}: {e!r}")
+                continue
+            try:
+                target.put_nowait((cmd_type, fields, frame))
+            except queue.Full:
+                if target is self._responses:
+                    # Keep the newest frames for read_response()
+                    try:
+                        target.get_nowait()
+                        target.put_nowait((cmd_type, fields, frame))
+                    except (queue.Empty, queue.Full):
+                        pass
+                    continue
+                self.frames_dropped += 1
+                if self.metrics is not None:
+                    self.metrics.frames_dropped += 1
+
     def read_response(self, timeout=1):
         """Read response from ESP32-C3"""
+        if self._responses is not None:
+            try:
+                cmd_type, fields, frame = self._responses.get(timeout=timeout)
+            except queue.Empty:
+                return ""
+            return build_iot_command(cmd_type, *fields)
         start_time = time.time()
         response = ""
         while (time.time() - start_time) < timeout:
             if self.serial.in_waiting > 0:
                 data = self.serial.read(self.serial.in_waiting)
+                if self.metrics is not None:
+                    self.metrics.bytes_in += len(data)
                 response += data.decode('utf-8', errors='ignore')
                 if '\n' in response:
                     break
@@ -70,10 +500,56 @@ class MechDogIoT:
         0x06: Action control
         0x07: ESP32S3 type query
         """
-        cmd_str = f"CMD|{cmd_type}|"
-        cmd_str += '|'.join(str(p) for p in params)
-        cmd_str += "|$"
-        self.send_command(cmd_str)
+        if self._recorder is not None:
+            self._recorder.on_command(cmd_type, params)
+        if self.metrics is not None:
+            self.metrics.command_sent(cmd_type)
+        text = build_iot_command(cmd_type, *params)
+        key = cmd_type if cmd_type in SUPERSEDED_TYPES else None
+        if self.binary:
+            frame = binframe.encode(cmd_type, params, binframe.COMMANDS)
+            self._write(frame, f"{text} ({len(frame)} byte frame)", key)
+        else:
+            self._write(f"{text}\n".encode('utf-8'), text, key)
+
+    def encode_iot_command(self, cmd_type, *params):
+        """Wire bytes of an IoT command in the active protocol, for send_encoded()"""
+        if self.binary:
+            return binframe.encode(cmd_type, params, binframe.COMMANDS)
+        return f"{build_iot_command(cmd_type, *params)}\n".encode('utf-8')
+
+    def send_encoded(self, data, text=None):
+        """Write prepared command bytes as they are (see encode_iot_command())"""
+        self._write(data, text if text is not None else data.decode('utf-8', errors='replace').strip())
+
+    def negotiate_protocol(self, binary=True, timeout=0.5):
+        """
+        Switch between the CMD|..|$ text protocol and compact binary frames
+        Sends CMD|8|<1=binary, 0=text>|$; the MechDog acks in the protocol
+        it is leaving and switches. Firmware without binframe support never
+        acks, so the current protocol stays in use. Returns the active mode.
+        """
+        if binary == self.binary:
+            return self.binary
+        self.start_reader()
+        acked = threading.Event()
+
+        def on_ack(cmd_type, fields, frame):
+            if fields and int(fields[0]) == int(binary):
+                # _feed() swaps the decoder once this frame's feed returns
+                self._switch_acked = True
+
+        self._switch_acked = False
+        self._switch = (binary, acked)
+        self.subscribe(binframe.CMD_PROTOCOL, on_ack)
+        try:
+            self.send_iot_command(binframe.CMD_PROTOCOL, int(binary))
+            if not acked.wait(timeout):
+                print(f"No protocol ack, staying on {'binary' if self.binary else 'text'} protocol")
+        finally:
+            self.unsubscribe(binframe.CMD_PROTOCOL, on_ack)
+            self._switch = None
+        return self.binary
     
     def enable_face_detection(self, enable=True):
         """Enable/disable face detection warning"""
@@ -115,105 +591,115 @@ class MechDogIoT:
         """Query ESP32S3 camera type"""
         self.send_iot_command(7)
     
+    def read_record(self, timeout=1):
+        """
+        Next frame as a decoder record (WarningFlags, ColorResult, Distance,
+        Battery, CameraType or Frame), None if nothing arrives in time
+        """
+        if self._responses is not None:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    cmd_type, fields, frame = self._responses.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    return None
+                record = decoder.from_fields(cmd_type, fields)
+                if record is not None:
+                    return record
+        # No reader thread: decode straight from the port
+        deadline = time.monotonic() + timeout
+        while not self._records:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            data = self.serial.read(max(1, self.serial.in_waiting))
+            if data:
+                if self.metrics is not None:
+                    self.metrics.bytes_in += len(data)
+                self._records.extend(self._record_decoder.feed(data))
+        return self._records.popleft()
+
     def read_sensor_data(self):
-        """Read and parse sensor data from responses"""
-        response = self.read_response()
-        if response:
-            print(f"Received: {response}")
-            return response
-        return None
+        """Read the next frame as a record (see read_record()) and print it"""
+        record = self.read_record()
+        if record is not None:
+            print(f"Received: {record}")
+        return record
     
     def interactive_mode(self):
-        """Interactive command line interface"""
-        print("\n=== MechDog IoT Interactive Mode ===")
-        print("Commands:")
-        print("  wifi SSID [PASS]  - Setup WiFi hotspot (default: MechDog/12345678)")
-        print("  face [on/off]     - Face detection")
-        print("  obj [on/off]      - Object detection")
-        print("  impact [on/off]   - Impact detection")
-        print("  color [on/off]    - Color detection")
-        print("  distance [on/off] - Distance sensor")
-        print("  rgb R G B         - Set LED color (0-255)")
-        print("  buzz [on/off]     - Buzzer control")
-        print("  action TYPE NUM   - Run action")
-        print("  query             - Query ESP32S3 type")
-        print("  read              - Read sensor data")
-        print("  raw TEXT          - Send raw command")
-        print("  quit              - Exit")
-        print()
-        
+        """Interactive command line interface (see console.py)"""
+        from console import MechDogConsole
+
         try:
-            while True:
-                cmd = input("IoT> ").strip().lower()
-                
-                if not cmd:
-                    continue
-                    
-                parts = cmd.split()
-                
-                if parts[0] == 'quit':
-                    break
-                elif parts[0] == 'wifi':
-                    ssid = parts[1] if len(parts) > 1 else "MechDog"
-                    password = parts[2] if len(parts) > 2 else "12345678"
-                    self.setup_wifi_hotspot(ssid, password)
-                elif parts[0] == 'face':
-                    self.enable_face_detection(parts[1] == 'on' if len(parts) > 1 else True)
-                elif parts[0] == 'obj':
-                    self.enable_object_detection(parts[1] == 'on' if len(parts) > 1 else True)
-                elif parts[0] == 'impact':
-                    self.enable_impact_detection(parts[1] == 'on' if len(parts) > 1 else True)
-                elif parts[0] == 'color':
-                    self.enable_color_detection(parts[1] == 'on' if len(parts) > 1 else True)
-                elif parts[0] == 'distance':
-                    self.enable_sensor_distance(parts[1] == 'on' if len(parts) > 1 else True)
-                elif parts[0] == 'rgb' and len(parts) == 4:
-                    self.set_rgb_led(int(parts[1]), int(parts[2]), int(parts[3]))
-                elif parts[0] == 'buzz':
-                    self.set_buzzer(parts[1] == 'on' if len(parts) > 1 else True)
-                elif parts[0] == 'action' and len(parts) == 3:
-                    self.run_action(int(parts[1]), int(parts[2]))
-                elif parts[0] == 'query':
-                    self.query_esp32s3_type()
-                elif parts[0] == 'read':
-                    self.read_sensor_data()
-                elif parts[0] == 'raw':
-                    self.send_command(' '.join(parts[1:]))
-                else:
-                    print("Unknown command. Type 'quit' to exit.")
-                
-                # Check for any responses
-                time.sleep(0.1)
-                while self.serial.in_waiting > 0:
-                    data = self.serial.read(self.serial.in_waiting)
-                    print(f"Response: {data.decode('utf-8', errors='ignore')}")
-                    time.sleep(0.05)
-                    
-        except KeyboardInterrupt:
-            print("\nExiting...")
+            MechDogConsole(self).run()
         finally:
             self.close()
     
+    def execute(self, line, wait=True):
+        """
+        Run one interactive command line, returns False for 'quit'
+        wait=False only sends (query, wifi) instead of waiting for the
+        reply, for callers that show incoming frames themselves.
+        Raises ValueError for an unknown command or bad arguments.
+        """
+        words = line.split()
+        if not words:
+            return True
+        verb = words[0].lower()
+        if verb == 'quit':
+            return False
+        if verb == 'wifi':
+            ssid = words[1] if len(words) > 1 else "MechDog"
+            password = words[2] if len(words) > 2 else "12345678"
+            if wait:
+                self.setup_wifi_hotspot(ssid, password)
+            elif len(password) < 8:
+                raise ValueError("Password must be at least 8 characters")
+            else:
+                self.send_command(f"NIOT_{ssid}|||{password}$$$")
+        elif verb == 'read':
+            self.read_sensor_data()
+        elif verb == 'query' and wait:
+            self.query_esp32s3_type()
+        else:
+            command = parse_command(line)
+            if isinstance(command, str):
+                self.send_command(command)
+            else:
+                self.send_iot_command(command[0], *command[1])
+        return True
+    
     def close(self):
         """Close serial connection"""
+        if self._flow is not None:
+            self._flow.close(timeout=5)
+            self._flow = None
+        self.stop_reader()
         if self.serial.is_open:
             self.serial.close()
-            print("Connection closed")
+            if self.verbose:
+                print("Connection closed")
 
 
 if __name__ == "__main__":
     import sys
     
-    # Check if port is specified
-    port = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyUSB0'
+    import discovery
+    import mechdogd
+    
+    # Check if port is specified, otherwise use the first MechDog found
+    port = sys.argv[1] if len(sys.argv) > 1 else None
     
     try:
-        iot = MechDogIoT(port=port)
+        if os.path.exists(mechdogd.SOCKET_PATH):
+            # mechdogd owns the ports, share its connection
+            iot = mechdogd.MechDogClient(os.path.basename(port) if port else None)
+        else:
+            port = port or discovery.find_mechdog() or '/dev/ttyUSB0'
+            iot = MechDogIoT(port=port)
         iot.interactive_mode()
     except serial.SerialException as e:
         print(f"Error: {e}")
         print(f"Make sure the ESP32-C3 is connected to {port}")
-        print("Available ports:")
-        import glob
-        for p in glob.glob('/dev/ttyUSB*') + glob.glob('/dev/ttyACM*'):
-            print(f"  {p}")
+        print("Probing ports:")
+        discovery.print_devices(discovery.discover(refresh=True))
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+MechDog IoT asyncio client
+Same command surface as MechDogIoT, but many commands can be in flight at
+once and each CMD|<type>|...|$ reply is matched to the call awaiting it.
+"""
+
+import asyncio
+import collections
+
+import serial
+
+from IoT import build_iot_command
+from decoder import RecordDecoder
+
+
+class AsyncMechDogIoT:
+    def __init__(self, port='/dev/ttyUSB0', baudrate=115200, telemetry_size=256):
+        """
+        Open the serial port without blocking the event loop
+        Call `await connect()` (or use `async with`) before sending commands
+        """
+        self.port = port
+        self.serial = serial.Serial(port, baudrate, timeout=0)
+        self.frames = RecordDecoder()
+        # Futures waiting for a reply, per command type, in send order
+        self._waiters = collections.defaultdict(collections.deque)
+        # Frames nobody asked for (periodic warnings, color, distance)
+        self.telemetry = asyncio.Queue(maxsize=telemetry_size)
+        self.telemetry_dropped = 0
+        self._loop = None
+
+    async def connect(self, settle=2):
+        """Start reading and wait for the connection to stabilize"""
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self.serial.fileno(), self._on_readable)
+        await asyncio.sleep(settle)
+        return self
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def _on_readable(self):
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except serial.SerialException:
+            self.close()
+            return
+        for record in self.frames.feed(data):
+            self._dispatch(record)
+
+    def _dispatch(self, record):
+        waiters = self._waiters.get(record.cmd_type)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(record)
+                return
+        if self.telemetry.full():
+            # Keep the newest readings, telemetry is only useful while fresh
+            self.telemetry.get_nowait()
+            self.telemetry_dropped += 1
+        self.telemetry.put_nowait(record)
+
+    def send_command(self, cmd):
+        """Send a command string to the ESP32-C3"""
+        if not cmd.endswith('\n'):
+            cmd += '\n'
+        self.serial.write(cmd.encode('utf-8'))
+
+    def send_iot_command(self, cmd_type, *params):
+        """Send IoT command without waiting for a reply"""
+        self.send_command(build_iot_command(cmd_type, *params))
+
+    async def request(self, cmd_type, *params, timeout=1.0):
+        """
+        Send an IoT command and wait for the next reply of the same type
+        Returns the reply record (see decoder.py), raises asyncio.TimeoutError
+        """
+        future = self.expect_reply(cmd_type)
+        self.send_iot_command(cmd_type, *params)
+        return await self.wait_reply(cmd_type, future, timeout)
+
+    def expect_reply(self, cmd_type):
+        """
+        Future for the next reply of cmd_type, for callers that send the
+        command themselves; await it with wait_reply()
+        """
+        future = self._loop.create_future()
+        self._waiters[cmd_type].append(future)
+        return future
+
+    async def wait_reply(self, cmd_type, future, timeout=1.0):
+        """Wait for a future from expect_reply(), raises asyncio.TimeoutError"""
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if future.cancelled():
+                self.cancel_reply(cmd_type, future)
+
+    def cancel_reply(self, cmd_type, future):
+        """Give up on a future from expect_reply() that will not be awaited"""
+        future.cancel()
+        try:
+            self._waiters[cmd_type].remove(future)
+        except ValueError:
+            pass
+
+    async def setup_wifi_hotspot(self, ssid="MechDog", password="12345678", settle=3):
+        """Configure WiFi hotspot on ESP32-C3 (NIOT_<ssid>|||<password>$$$)"""
+        if len(password) < 8:
+            print("Error: Password must be at least 8 characters")
+            return False
+        self.send_command(f"NIOT_{ssid}|||{password}$$$")
+        await asyncio.sleep(settle)
+        return True
+
+    async def enable_face_detection(self, enable=True):
+        """Enable/disable face detection warning"""
+        self.send_iot_command(1, 1 if enable else 0, 0, 0)
+
+    async def enable_object_detection(self, enable=True):
+        """Enable/disable unknown object detection"""
+        self.send_iot_command(1, 0, 1 if enable else 0, 0)
+
+    async def enable_impact_detection(self, enable=True):
+        """Enable/disable impact detection"""
+        self.send_iot_command(1, 0, 0, 1 if enable else 0)
+
+    async def enable_color_detection(self, enable=True):
+        """Enable/disable color detection"""
+        self.send_iot_command(2, 1 if enable else 0)
+
+    async def enable_sensor_distance(self, enable=True):
+        """Enable/disable distance sensor readings"""
+        self.send_iot_command(3, 1 if enable else 0)
+
+    async def set_rgb_led(self, r, g, b):
+        """Set RGB LED color (0-255 for each channel)"""
+        self.send_iot_command(4, r, g, b)
+
+    async def set_buzzer(self, enable=True):
+        """Enable/disable buzzer"""
+        self.send_iot_command(5, 1 if enable else 0)
+
+    async def run_action(self, action_type, action_num):
+        """
+        Run a MechDog action
+        action_type: 1=predefined action, 2=movement
+        action_num: specific action ID
+        """
+        self.send_iot_command(6, action_type, action_num)
+
+    async def query_esp32s3_type(self, timeout=1.0):
+        """Query ESP32S3 camera type: 0=none, 1=face, 2=color"""
+        record = await self.request(7, timeout=timeout)
+        return record.values()[0] if record.values() else 0
+
+    async def read_sensor_data(self, timeout=1.0):
+        """Wait for the next telemetry frame, returns its record (Distance, ...) or None"""
+        try:
+            return await asyncio.wait_for(self.telemetry.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        """Close serial connection and fail pending requests"""
+        if self._loop is not None and self.serial.is_open:
+            self._loop.remove_reader(self.serial.fileno())
+        for waiters in self._waiters.values():
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+        if self.serial.is_open:
+            self.serial.close()
+
+
+async def _main(ports):
+    dogs = [AsyncMechDogIoT(port) for port in ports]
+    await asyncio.gather(*(dog.connect() for dog in dogs))
+    results = await asyncio.gather(*(dog.query_esp32s3_type() for dog in dogs),
+                                   return_exceptions=True)
+    for dog, result in zip(dogs, results):
+        if isinstance(result, Exception):
+            print(f"{dog.port}: no reply ({type(result).__name__})")
+        else:
+            print(f"{dog.port}: ESP32S3 type {result}")
+        dog.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    asyncio.run(_main(sys.argv[1:] or ['/dev/ttyUSB0']))
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Host round-trip latency and throughput benchmark
+Drives MechDogIoT against a local fake_dog.py stand-in and reports, per
+command type, the send cost, the time until the device applied the command
+and (for replies) the full round trip, plus the highest sustained command
+rate before replies start going missing. Results are written as JSON.
+
+Usage:
+  python3 bench_iot.py [--samples 200] [--latency 0.002] [--output bench.json]
+"""
+
+import argparse
+import json
+import platform
+import queue
+import select
+import sys
+import threading
+import time
+
+import binframe
+from IoT import MechDogIoT, build_iot_command
+from fake_dog import FakeDog
+
+# Representative parameters per command type
+COMMANDS = {
+    1: (1, 0, 0),
+    2: (0,),
+    3: (0,),
+    4: (255, 128, 0),
+    5: (0,),
+    6: (1, 3),
+    7: (),
+}
+
+
+def percentiles(samples):
+    """p50/p95/p99/max of a list of seconds, in milliseconds"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {'count': len(ordered), 'p50_ms': pick(50), 'p95_ms': pick(95),
+            'p99_ms': pick(99), 'max_ms': ordered[-1] * 1000}
+
+
+def bench_apply(iot, dog, samples, timeout=1.0):
+    """Send cost and host -> device latency for every command type"""
+    applied = threading.Event()
+    dog.on_command = lambda cmd_type, args: applied.set()
+    results = {}
+    for cmd_type, params in COMMANDS.items():
+        send, one_way, lost = [], [], 0
+        for _ in range(samples):
+            applied.clear()
+            start = time.perf_counter()
+            iot.send_iot_command(cmd_type, *params)
+            sent = time.perf_counter()
+            if applied.wait(timeout):
+                one_way.append(time.perf_counter() - start)
+            else:
+                lost += 1
+            send.append(sent - start)
+        results[cmd_type] = {'send': percentiles(send), 'applied': percentiles(one_way), 'lost': lost}
+    dog.on_command = None
+    return results
+
+
+def _drain(iot, replies):
+    """Throw away input and replies left over from earlier samples"""
+    if iot._reader is None:
+        iot.serial.reset_input_buffer()
+    while True:
+        try:
+            replies.get_nowait()
+        except queue.Empty:
+            break
+
+
+def bench_round_trip(iot, dog, samples, timeout=1.0):
+    """
+    CMD|7 query -> CMD|7 reply, with the reader thread if it runs, else by
+    polling read_available(). The fake dog answers each query with a fresh
+    token as its camera type, so a late reply to an earlier query is never
+    taken for the current one.
+    """
+    replies = iot.subscribe(7, queue.Queue())
+    rtt, lost = [], 0
+    try:
+        for i in range(samples):
+            _drain(iot, replies)
+            if dog.intake_interval:
+                # wifi_main ignores a repeat of the previous command
+                iot.send_iot_command(3, 0)
+                time.sleep(dog.intake_interval * 1.5)
+            token = i % 256
+            dog.esp32s3_type = token
+            start = time.perf_counter()
+            iot.query_esp32s3_type()
+            deadline = start + timeout
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    lost += 1
+                    break
+                if iot._reader is None:
+                    if select.select([iot.serial], [], [], remaining)[0]:
+                        iot.read_available()
+                    wait = 0
+                else:
+                    wait = remaining
+                try:
+                    cmd_type, fields, frame = replies.get(timeout=wait) if wait else replies.get_nowait()
+                except queue.Empty:
+                    continue
+                if fields and int(fields[0]) == token:
+                    rtt.append(time.perf_counter() - start)
+                    break
+    finally:
+        iot.unsubscribe(7, replies)
+    return {'round_trip': percentiles(rtt), 'lost': lost}
+
+
+def sweep_rates(start=50):
+    """50, 100, 250, 500, 1000, 2500, ... until the caller stops"""
+    rate = start
+    while True:
+        for step in (1, 2, 5):
+            yield rate * step
+        rate *= 10
+
+
+def bench_throughput(iot, dog, rates=None, window=1.0, threshold=0.99, settle=0.2):
+    """
+    Send CMD|7 queries at increasing rates (reader thread running) and
+    return the highest rate where at least threshold of replies arrived.
+    The sweep runs until replies go missing or the host cannot send any
+    faster; the latter is reported as limit 'sender'.
+    """
+    replies = iot.subscribe(7, queue.Queue())
+    steps, best, limit = [], 0, None
+    for step, rate in enumerate(rates or sweep_rates()):
+        _drain(iot, replies)
+        token = step % 256
+        dog.esp32s3_type = token
+        interval = 1.0 / rate
+        count = int(rate * window)
+        start = time.perf_counter()
+        for i in range(count):
+            target = start + i * interval
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            iot.query_esp32s3_type()
+        elapsed = time.perf_counter() - start
+        # Count replies to this step only, until they stop coming
+        received = 0
+        while received < count:
+            try:
+                cmd_type, fields, frame = replies.get(timeout=settle)
+            except queue.Empty:
+                break
+            if fields and int(fields[0]) == token:
+                received += 1
+        ratio = received / count
+        achieved = count / elapsed
+        steps.append({'target_rate': rate, 'achieved_rate': achieved,
+                      'sent': count, 'replies': received, 'reply_ratio': ratio})
+        if ratio < threshold:
+            limit = 'replies'
+            break
+        best = rate
+        if achieved < 0.9 * rate:
+            limit = 'sender'
+            best = int(achieved)
+            break
+    iot.unsubscribe(7, replies)
+    return {'max_sustained_rate': best, 'limit': limit, 'steps': steps}
+
+
+def wire_bytes():
+    """Bytes on the wire per command type, text and binary framing"""
+    result = {}
+    for cmd_type, params in COMMANDS.items():
+        result[cmd_type] = {
+            'text': len(build_iot_command(cmd_type, *params)) + 1,  # + '\n'
+            'binary': len(binframe.encode(cmd_type, params, binframe.COMMANDS)),
+        }
+    return result
+
+
+def run(samples=200, latency=0.0, jitter=0.0, drop=0.0, intake=0.0, rates=None):
+    with FakeDog(latency=latency, jitter=jitter, drop_rate=drop, intake_interval=intake, seed=1) as dog:
+        iot = MechDogIoT(dog.port, verbose=False)
+        try:
+            report = {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'device': {'latency': latency, 'jitter': jitter, 'drop_rate': drop, 'intake_interval': intake},
+                'samples': samples,
+                'wire_bytes': wire_bytes(),
+                # No reader thread: select() + read_available()
+                'polling': bench_round_trip(iot, dog, samples),
+            }
+            iot.start_reader()
+            report['reader'] = bench_round_trip(iot, dog, samples)
+            if not intake:
+                report['apply'] = bench_apply(iot, dog, samples)
+            report['throughput'] = bench_throughput(iot, dog, rates)
+        finally:
+            iot.close()
+    return report
+
+
+def print_summary(report):
+    def fmt(stats):
+        if not stats:
+            return "n/a"
+        return f"p50 {stats['p50_ms']:.3f} / p95 {stats['p95_ms']:.3f} / p99 {stats['p99_ms']:.3f} ms"
+
+    print(f"CMD|7 round trip, polling: {fmt(report['polling']['round_trip'])}", file=sys.stderr)
+    print(f"CMD|7 round trip, reader:  {fmt(report['reader']['round_trip'])}", file=sys.stderr)
+    for cmd_type, entry in report.get('apply', {}).items():
+        wire = report['wire_bytes'][cmd_type]
+        print(f"CMD|{cmd_type} applied: {fmt(entry['applied'])} "
+              f"({wire['text']} B text, {wire['binary']} B binary)", file=sys.stderr)
+    throughput = report['throughput']
+    print(f"Max sustained query rate: {throughput['max_sustained_rate']} cmd/s "
+          f"(limited by {throughput['limit']})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MechDogIoT latency/throughput benchmark against fake_dog.py")
+    parser.add_argument('--samples', type=int, default=200, help="samples per command type")
+    parser.add_argument('--latency', type=float, default=0.0, help="fake device latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="fake device jitter in seconds")
+    parser.add_argument('--drop', type=float, default=0.0, help="fake device drop probability")
+    parser.add_argument('--intake', type=float, default=0.0, help="fake device polling interval (e.g. 0.1)")
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.samples, args.latency, args.jitter, args.drop, args.intake)
+    print_summary(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
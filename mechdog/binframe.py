@@ -0,0 +1,110 @@
+# MechDog compact binary frames
+# Optional alternative to the CMD|type|...|$ text protocol, negotiated with
+# CMD|8|1|$ (binary) / CMD|8|0|$ (text). Runs on CPython and MicroPython:
+# upload next to main.py to enable binary mode on the MechDog.
+#
+# Frame layout:  SYNC | length | type | payload (length bytes) | checksum
+# checksum = XOR of length, type and every payload byte
+
+import struct
+
+SYNC = 0xA5
+HEADER_SIZE = 3
+MAX_PAYLOAD = 16
+
+CMD_PROTOCOL = 8
+PROTOCOL_TEXT = 0
+PROTOCOL_BINARY = 1
+
+# Payload formats, host -> MechDog
+COMMANDS = {
+  1: 'BBB',    # warnings on/off: face, unknown object, impact
+  2: 'B',      # color detection on/off
+  3: 'B',      # distance readings on/off
+  4: 'BBB',    # rgb
+  5: 'B',      # buzzer on/off
+  6: '<BH',    # action type, action number
+  7: '',       # esp32s3 type query
+  8: 'B',      # protocol select
+}
+
+# Payload formats, MechDog -> host
+REPLIES = {
+  1: 'BBB',    # warning flags: face, unknown object, impact
+  2: 'B',      # detected color
+  3: '<H',     # distance
+  6: '<H',     # battery
+  7: 'B',      # esp32s3 type
+  8: 'B',      # protocol ack
+}
+
+
+def checksum(data, start, end):
+  value = 0
+  for i in range(start, end):
+    value ^= data[i]
+  return value
+
+
+def encode(cmd_type, values, formats):
+  payload = struct.pack(formats[cmd_type], *values)
+  frame = bytearray([SYNC, len(payload), cmd_type]) + payload
+  frame.append(checksum(frame, 1, len(frame)))
+  return bytes(frame)
+
+
+def decode(frame, formats):
+  """(type, values) of one complete frame as returned by FrameDecoder"""
+  cmd_type = frame[2]
+  fmt = formats.get(cmd_type)
+  if fmt is None or struct.calcsize(fmt) != len(frame) - 4:
+    raise ValueError("unknown frame type")
+  return cmd_type, struct.unpack(fmt, frame[3:-1])
+
+
+def next_frame(data, pos=0):
+  """
+  Locate the next valid frame in data[pos:]
+  Returns (start, end); end is -1 when the frame at start is still
+  incomplete, start is -1 when there is no frame at all
+  """
+  size = len(data)
+  while pos < size:
+    if data[pos] != SYNC:
+      pos += 1
+      continue
+    if size - pos < HEADER_SIZE:
+      return pos, -1
+    length = data[pos + 1]
+    end = pos + HEADER_SIZE + length + 1
+    if length <= MAX_PAYLOAD:
+      if end > size:
+        return pos, -1
+      if checksum(data, pos + 1, end - 1) == data[end - 1]:
+        return pos, end
+    # Not a frame after all (or corrupted), resync on the next byte
+    pos += 1
+  return -1, -1
+
+
+class FrameDecoder:
+  """Incrementally pull checked frames out of a byte stream (host side)"""
+
+  def __init__(self):
+    self.buffer = bytearray()
+
+  def feed(self, data):
+    buf = self.buffer
+    buf += data
+    frames = []
+    pos = 0
+    while True:
+      start, end = next_frame(buf, pos)
+      if end < 0:
+        pos = len(buf) if start < 0 else start
+        break
+      frames.append(bytes(buf[start:end]))
+      pos = end
+    if pos:
+      del buf[:pos]
+    return frames
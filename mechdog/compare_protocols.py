@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Compare the CMD|..|$ text protocol with binframe binary frames
+Prints bytes on the wire and parse time for every command and reply type.
+Parse times are CPython numbers; the ratio is what carries over to the MechDog.
+"""
+
+import sys
+import timeit
+
+import binframe
+from IoT import build_iot_command, parse_binary_frame, parse_iot_frame
+
+# Representative parameters per command type (host -> MechDog)
+COMMAND_SAMPLES = {
+    1: (1, 1, 0),
+    2: (1,),
+    3: (1,),
+    4: (255, 128, 0),
+    5: (1,),
+    6: (1, 16),
+    7: (),
+}
+
+# Representative replies (MechDog -> host)
+REPLY_SAMPLES = {
+    1: (0, 1, 0),
+    2: (3,),
+    3: (237,),
+    6: (7400,),
+    7: (2,),
+}
+
+
+def parse_text_command(data):
+    """Text parsing as done by wifi_parse() on the MechDog"""
+    rec = data.decode('utf-8')
+    start = rec.find("CMD|")
+    end = rec.find("$", start)
+    cmd = rec[start + 4:end].split('|')
+    return int(cmd[0]), [int(x) for x in cmd[1:] if x]
+
+
+def parse_binary_command(data):
+    """Binary parsing as done by wifi_parse() on the MechDog"""
+    start, end = binframe.next_frame(data)
+    return binframe.decode(data[start:end], binframe.COMMANDS)
+
+
+def time_per_call(func, arg, number):
+    return min(timeit.repeat(lambda: func(arg), number=number, repeat=5)) / number * 1e6
+
+
+def compare(number=20000):
+    rows = []
+    for cmd_type, params in COMMAND_SAMPLES.items():
+        text = build_iot_command(cmd_type, *params).encode('utf-8')
+        binary = binframe.encode(cmd_type, params, binframe.COMMANDS)
+        rows.append((f"cmd {cmd_type}", len(text), len(binary),
+                     time_per_call(parse_text_command, text, number),
+                     time_per_call(parse_binary_command, binary, number)))
+    for cmd_type, values in REPLY_SAMPLES.items():
+        text = build_iot_command(cmd_type, *values).encode('utf-8')
+        binary = binframe.encode(cmd_type, values, binframe.REPLIES)
+        rows.append((f"reply {cmd_type}", len(text), len(binary),
+                     time_per_call(parse_iot_frame, text, number),
+                     time_per_call(parse_binary_frame, binary, number)))
+    return rows
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{'type':<10} {'text B':>7} {'bin B':>6} {'text us':>8} {'bin us':>7}")
+    for name, text_bytes, bin_bytes, text_us, bin_us in compare(number):
+        print(f"{name:<10} {text_bytes:>7} {bin_bytes:>6} {text_us:>8.2f} {bin_us:>7.2f}")
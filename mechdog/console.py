@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Non-blocking MechDog console
+One selectors loop multiplexes the keyboard and the serial port: frames are
+printed above the prompt the moment they arrive, typed commands go out at
+once, and a status line under the output shows the CMD|7 round trip and
+the frame rate. A query is sent every few seconds, but never twice in a
+row: wifi_main ignores a command identical to the previous one, so the
+round trip is refreshed whenever other commands are sent in between.
+MechDogIoT.interactive_mode() runs this console.
+
+Usage:
+  python3 console.py [/dev/ttyUSB0] [--probe 2.0]
+"""
+
+import collections
+import os
+import selectors
+import sys
+import termios
+import time
+import tty
+
+import serial
+
+import decoder
+
+HELP = """=== MechDog IoT Interactive Mode ===
+Commands:
+  wifi SSID [PASS]  - Setup WiFi hotspot (default: MechDog/12345678)
+  face [on/off]     - Face detection
+  obj [on/off]      - Object detection
+  impact [on/off]   - Impact detection
+  color [on/off]    - Color detection
+  distance [on/off] - Distance sensor
+  rgb R G B         - Set LED color (0-255)
+  buzz [on/off]     - Buzzer control
+  action TYPE NUM   - Run action
+  query             - Query ESP32S3 type
+  read              - Show the latest frame of each type
+  raw TEXT          - Send raw command
+  help              - Show this list
+  quit              - Exit (or Ctrl+D)
+"""
+PROMPT = "IoT> "
+# A query without a reply after this long counts as lost
+QUERY_TIMEOUT = 2.0
+
+
+class MechDogConsole:
+    def __init__(self, iot, probe_interval=2.0, out=None):
+        """
+        iot: a MechDogIoT (or mechdogd.MechDogClient)
+        probe_interval: seconds between status CMD|7 queries (0 = only typed ones)
+        """
+        self.iot = iot
+        self.probe_interval = probe_interval
+        self.out = out or sys.stdout
+        self.line = ''
+        self.running = False
+        self.rtt = None
+        self.rtt_at = None
+        self.query_sent = None
+        self.last_was_query = False
+        self.query_shown = False  # replies to our own probes are not printed
+        self.latest = {}          # cmd_type -> latest record
+        self.frame_times = collections.deque()
+        self._escape = False
+        self._drawn = False
+        self._dirty = False
+
+    def run(self):
+        """Run until quit, Ctrl+D, Ctrl+C or a lost connection"""
+        iot = self.iot
+        iot.stop_reader()  # frames are read here, in the loop
+        handler = iot.subscribe(None, self._on_frame)
+        verbose, iot.verbose = iot.verbose, False
+        stdin = sys.stdin.fileno()
+        self.tty = os.isatty(stdin)
+        saved = termios.tcgetattr(stdin) if self.tty else None
+        selector = selectors.DefaultSelector()
+        selector.register(stdin, selectors.EVENT_READ, self._on_stdin)
+        selector.register(iot.serial.fileno(), selectors.EVENT_READ, iot.read_available)
+        self.running = True
+        next_probe = next_status = time.perf_counter()
+        try:
+            if self.tty:
+                tty.setcbreak(stdin)  # keys one at a time, no echo
+            self._print(HELP)
+            while self.running:
+                for key, mask in selector.select(0.25):
+                    key.data()
+                now = time.perf_counter()
+                if self.query_sent is not None and now - self.query_sent > QUERY_TIMEOUT:
+                    self.query_sent = None
+                    self.rtt = None
+                    self._dirty = True
+                if (self.probe_interval and now >= next_probe and self.query_sent is None
+                        and not self.last_was_query):
+                    next_probe = now + self.probe_interval
+                    self._query(shown=False)
+                if now >= next_status:
+                    next_status = now + 0.5
+                    self._dirty = True
+                if self._dirty:
+                    self._redraw()
+        except KeyboardInterrupt:
+            pass
+        except (serial.SerialException, OSError) as e:
+            self._print(f"Connection lost: {e}")
+        finally:
+            if saved is not None:
+                termios.tcsetattr(stdin, termios.TCSADRAIN, saved)
+            selector.close()
+            iot.unsubscribe(None, handler)
+            iot.verbose = verbose
+            self.out.write('\n' if self._drawn else '')
+            self.out.flush()
+
+    def _on_stdin(self):
+        data = os.read(sys.stdin.fileno(), 1024)
+        if not data:
+            self.running = False  # end of piped input
+            return
+        for ch in data.decode('utf-8', errors='ignore'):
+            if self._escape:
+                # Skip arrow keys and other escape sequences
+                self._escape = not (ch.isalpha() or ch == '~')
+            elif ch == '\x1b':
+                self._escape = True
+            elif ch in '\r\n':
+                line, self.line = self.line, ''
+                self._submit(line)
+            elif ch in '\x7f\x08':
+                self.line = self.line[:-1]
+            elif ch == '\x15':  # Ctrl+U
+                self.line = ''
+            elif ch == '\x04':  # Ctrl+D
+                if not self.line:
+                    self.running = False
+            elif ch.isprintable():
+                self.line += ch
+        self._dirty = True
+
+    def _submit(self, line):
+        if self.tty:
+            self._print(PROMPT + line)
+        words = line.split()
+        if not words:
+            return
+        verb = words[0].lower()
+        if verb == 'help':
+            self._print(HELP)
+        elif verb == 'read':
+            if not self.latest:
+                self._print("No frames yet")
+            for cmd_type in sorted(self.latest):
+                self._print(f"  {self.latest[cmd_type]!r}")
+        elif verb == 'query':
+            if not self.last_was_query:
+                self._query(shown=True)
+            elif self.query_sent is not None:
+                self.query_shown = True  # the pending reply gets printed
+            elif 7 in self.latest:
+                # wifi_main would ignore a second identical query, so there
+                # is nothing newer to ask for until another command goes out
+                self._print(f"  {self.latest[7]!r} (latest reply)")
+            else:
+                self._print("No reply to the last query; send another command first")
+        else:
+            try:
+                self.running = self.iot.execute(line, wait=False)
+                self.last_was_query = False
+            except ValueError as e:
+                self._print(f"{e}. Type 'help' for the commands.")
+
+    def _query(self, shown):
+        self.iot.send_iot_command(7)
+        self.query_sent = time.perf_counter()
+        self.query_shown = shown
+        self.last_was_query = True
+
+    def _frame_rate(self, now):
+        times = self.frame_times
+        while times and now - times[0] > 1.0:
+            times.popleft()
+        return len(times)
+
+    def _on_frame(self, cmd_type, fields, frame):
+        now = time.perf_counter()
+        self.frame_times.append(now)
+        self._frame_rate(now)
+        record = decoder.from_fields(cmd_type, fields)
+        if record is None:
+            return
+        self.latest[cmd_type] = record
+        if cmd_type == 7 and self.query_sent is not None:
+            self.rtt = now - self.query_sent
+            self.rtt_at = now
+            self.query_sent = None
+            if not self.query_shown:
+                self._dirty = True
+                return
+        self._print(f"[{time.strftime('%H:%M:%S')}] {record!r}")
+
+    def _status(self):
+        now = time.perf_counter()
+        rtt = "-"
+        if self.rtt is not None:
+            rtt = f"{self.rtt * 1000:.1f} ms ({now - self.rtt_at:.0f} s ago)"
+        return f"-- rtt {rtt} | {self._frame_rate(now)} frames/s | {self.iot.frames_received} frames --"
+
+    def _print(self, text):
+        """Print above the status and prompt lines"""
+        write = self.out.write
+        if self._drawn:
+            write('\r\x1b[K\x1b[1A\x1b[K')  # clear prompt, then status line
+            self._drawn = False
+        write(text if text.endswith('\n') else text + '\n')
+        self._dirty = True
+
+    def _redraw(self):
+        self._dirty = False
+        if not self.tty:
+            self.out.flush()
+            return
+        if self._drawn:
+            self.out.write('\r\x1b[K\x1b[1A')
+        self.out.write(f"\r\x1b[K{self._status()}\n\r\x1b[K{PROMPT}{self.line}")
+        self.out.flush()
+        self._drawn = True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from IoT import MechDogIoT
+
+    parser = argparse.ArgumentParser(description="Live MechDog console")
+    parser.add_argument('port', nargs='?', default=os.environ.get('MECHDOG_PORT', '/dev/ttyUSB0'),
+                        help="serial port (default: %(default)s)")
+    parser.add_argument('--probe', type=float, default=2.0,
+                        help="seconds between round-trip queries, 0 = off (default: %(default)s)")
+    args = parser.parse_args()
+
+    iot = MechDogIoT(args.port)
+    try:
+        MechDogConsole(iot, args.probe).run()
+    finally:
+        iot.close()
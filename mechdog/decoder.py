@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Typed decoder for CMD|<type>|...|$ frames
+Frames are parsed straight out of a bytes/bytearray/memoryview buffer: a
+compiled pattern finds each frame and the numbers are accumulated digit by
+digit from the buffer, so no intermediate str or bytes objects are made.
+Every frame becomes a small __slots__ record:
+
+  CMD|1|face|obj|impact|$  WarningFlags      CMD|6|value|$   Battery
+  CMD|2|color|$            ColorResult       CMD|7|type|$    CameraType
+  CMD|3|cm|$               Distance          other types     Frame
+
+Usage:
+  python3 decoder.py [--frames 200000]      # frames/sec microbenchmark
+"""
+
+import re
+
+FRAME = re.compile(rb'CMD\|([0-9|-]*)\$')
+# start_main1 reports this after five out-of-range sonar reads
+DISTANCE_SENTINEL = 500
+CAMERA_NAMES = {0: 'none', 1: 'face', 2: 'color'}
+
+
+class Record:
+    """Base of the frame records"""
+
+    __slots__ = ()
+
+    def values(self):
+        return ()
+
+    def encode(self):
+        """Back to CMD|type|...|$ text"""
+        return f"CMD|{self.cmd_type}|" + '|'.join(str(v) for v in self.values()) + "|$"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.cmd_type == other.cmd_type and self.values() == other.values()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(str(v) for v in self.values())})"
+
+
+class Frame(Record):
+    """Frame of a type without its own record"""
+
+    __slots__ = ('cmd_type', 'args')
+
+    def __init__(self, cmd_type, args):
+        self.cmd_type = cmd_type
+        self.args = tuple(args)
+
+    def values(self):
+        return self.args
+
+    def __repr__(self):
+        return f"Frame({self.cmd_type}, {self.args})"
+
+
+class WarningFlags(Record):
+    __slots__ = ('face', 'obj', 'impact')
+    cmd_type = 1
+
+    def __init__(self, face=0, obj=0, impact=0):
+        self.face = face
+        self.obj = obj
+        self.impact = impact
+
+    def values(self):
+        return (self.face, self.obj, self.impact)
+
+
+class ColorResult(Record):
+    __slots__ = ('color',)
+    cmd_type = 2
+
+    def __init__(self, color=0):
+        self.color = color
+
+    @property
+    def detected(self):
+        return self.color != 0
+
+    def values(self):
+        return (self.color,)
+
+
+class Distance(Record):
+    __slots__ = ('cm',)
+    cmd_type = 3
+
+    def __init__(self, cm=DISTANCE_SENTINEL):
+        self.cm = cm
+
+    @property
+    def dropout(self):
+        """True when the sonar had no valid reading"""
+        return self.cm >= DISTANCE_SENTINEL
+
+    def values(self):
+        return (self.cm,)
+
+
+class Battery(Record):
+    __slots__ = ('value',)
+    cmd_type = 6
+
+    def __init__(self, value=0):
+        self.value = value
+
+    def values(self):
+        return (self.value,)
+
+
+class CameraType(Record):
+    __slots__ = ('camera_type',)
+    cmd_type = 7
+
+    def __init__(self, camera_type=0):
+        self.camera_type = camera_type
+
+    @property
+    def name(self):
+        return CAMERA_NAMES.get(self.camera_type, 'unknown')
+
+    def values(self):
+        return (self.camera_type,)
+
+
+RECORDS = {cls.cmd_type: cls for cls in (WarningFlags, ColorResult, Distance, Battery, CameraType)}
+
+
+def make_record(cmd_type, args):
+    """Record for a type and its integer arguments"""
+    cls = RECORDS.get(cmd_type)
+    if cls is not None:
+        try:
+            return cls(*args)
+        except TypeError:
+            pass  # more arguments than the record has
+    return Frame(cmd_type, args)
+
+
+def from_fields(cmd_type, fields):
+    """Record from MechDogIoT's (cmd_type, [str fields]), None if not numeric"""
+    try:
+        return make_record(cmd_type, [int(x) for x in fields if x != ''])
+    except ValueError:
+        return None
+
+
+def decode(buf, records=None):
+    """
+    Decode every complete frame in buf (bytes, bytearray or memoryview)
+    Returns (records, end): end is the index just past the last frame, so a
+    partial frame at the end can be kept for the next read.
+    """
+    if records is None:
+        records = []
+    append = records.append
+    end = 0
+    for match in FRAME.finditer(buf):
+        end = match.end()
+        args = []
+        value = digits = 0
+        negative = False
+        for i in range(match.start(1), match.end(1)):
+            c = buf[i]
+            if c == 124:  # '|'
+                if digits:
+                    args.append(-value if negative else value)
+                value = digits = 0
+                negative = False
+            elif c == 45:  # '-'
+                negative = True
+            else:
+                value = value * 10 + c - 48
+                digits += 1
+        if digits:
+            args.append(-value if negative else value)
+        if args:
+            append(make_record(args[0], args[1:]))
+    return records, end
+
+
+class RecordDecoder:
+    """
+    Incremental decode() for a serial stream, like IoT.FrameBuffer but
+    returning records; the tail after the last frame is kept between feeds
+    """
+
+    def __init__(self, max_size=4096):
+        self.buffer = bytearray()
+        self.max_size = max_size
+        self.overflows = 0
+
+    def feed(self, data):
+        """Append received bytes and return the records of all complete frames"""
+        buf = self.buffer
+        if buf:
+            buf += data
+            records, end = decode(buf)
+            del buf[:end]
+        else:
+            # Nothing pending: decode straight from the caller's buffer
+            records, end = decode(data)
+            buf += data[end:]
+        # Keep only what can still become a frame
+        head = buf.rfind(b'CMD|')
+        if head > 0:
+            del buf[:head]
+        elif head < 0:
+            del buf[:-3]
+        if len(buf) > self.max_size:
+            del buf[:]
+            self.overflows += 1
+        return records
+
+
+def benchmark(frames=200000):
+    """Frames/sec of decode() against FrameBuffer + parse_iot_frame"""
+    import time
+
+    from IoT import FrameBuffer, parse_iot_frame
+
+    sample = [b'CMD|1|0|1|0|$', b'CMD|2|3|$', b'CMD|3|123|$', b'Checking _ARM_ACTION: 0\r\n', b'CMD|7|1|$']
+    data = b''.join(sample * (frames // 4))
+    count = frames // 4 * 4
+    results = {}
+
+    start = time.perf_counter()
+    records, _ = decode(memoryview(data))
+    results['decode'] = count / (time.perf_counter() - start)
+    assert len(records) == count
+
+    start = time.perf_counter()
+    decoder = RecordDecoder()
+    for i in range(0, len(data), 4096):
+        decoder.feed(data[i:i + 4096])
+    results['RecordDecoder (4 KiB reads)'] = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    parsed = []
+    for frame in FrameBuffer().feed(data):
+        cmd_type, fields = parse_iot_frame(frame)
+        parsed.append(from_fields(cmd_type, fields))
+    results['FrameBuffer + parse_iot_frame'] = count / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Microbenchmark of the typed frame decoder")
+    parser.add_argument('--frames', type=int, default=200000, help="frames to decode")
+    args = parser.parse_args()
+    for name, rate in benchmark(args.frames).items():
+        print(f"{name:<32} {rate / 1e6:6.2f} M frames/s")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Find MechDogs on the serial ports
+Every candidate port is opened in its own thread and sent a CMD|7 type
+query, so probing many ports takes one timeout window. Answers are
+classified (ESP32-C3 bridge present, ESP32S3 camera type) and cached in
+~/.cache/mechdog/ports.json; later lookups within the TTL skip probing.
+
+Usage:
+  python3 discovery.py [--refresh] [--timeout 0.5] [ports...]
+"""
+
+import concurrent.futures
+import glob
+import json
+import os
+import time
+
+import serial
+import serial.tools.list_ports
+
+from IoT import FrameBuffer, build_iot_command, parse_iot_frame
+
+CACHE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                          'mechdog', 'ports.json')
+CACHE_TTL = 300
+# CMD|7 reply value -> ESP32S3 camera
+CAMERA_TYPES = {0: 'none', 1: 'face', 2: 'color'}
+
+
+def candidate_ports():
+    """Serial ports that may have a MechDog -> USB serial number (or None)"""
+    ports = {p.device: p.serial_number for p in serial.tools.list_ports.comports() if p.vid is not None}
+    # Fall back to the usual device names where pyserial can't see USB details
+    for device in glob.glob('/dev/ttyUSB*') + glob.glob('/dev/ttyACM*'):
+        ports.setdefault(device, None)
+    return dict(sorted(ports.items()))
+
+
+def probe(port, timeout=0.5, baudrate=115200):
+    """
+    Send a CMD|7 query to one port and classify the answer:
+      bridge  - something sent CMD| frames (ESP32-C3 bridge and MechDog up)
+      camera  - 'none' / 'face' / 'color' from the CMD|7 reply, None if no reply
+    """
+    info = {'port': port, 'bridge': False, 'camera': None, 'camera_type': None, 'rtt': None, 'error': None}
+    frames = FrameBuffer()
+    try:
+        with serial.Serial(port, baudrate, timeout=timeout) as ser:
+            ser.reset_input_buffer()
+            start = time.monotonic()
+            ser.write((build_iot_command(7) + '\n').encode('ascii'))
+            deadline = start + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                ser.timeout = remaining
+                for frame in frames.feed(ser.read(max(1, ser.in_waiting))):
+                    try:
+                        cmd_type, fields = parse_iot_frame(frame)
+                    except ValueError:
+                        continue
+                    info['bridge'] = True
+                    if cmd_type == 7 and fields and fields[0].isdigit():
+                        info['rtt'] = time.monotonic() - start
+                        info['camera_type'] = int(fields[0])
+                        info['camera'] = CAMERA_TYPES.get(info['camera_type'], 'unknown')
+                        return info
+    except (serial.SerialException, OSError) as e:
+        info['error'] = str(e)
+    return info
+
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache, path=CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, path)
+
+
+def discover(ports=None, timeout=0.5, ttl=CACHE_TTL, refresh=False, cache_path=CACHE_PATH):
+    """
+    Return {port: info} for the given ports (default: candidate_ports())
+    Cached answers younger than ttl are reused as long as the port still has
+    the same USB serial number; the rest (including ports that did not
+    answer last time) are probed, concurrently.
+    """
+    known = candidate_ports()
+    if ports is None:
+        ports = list(known)
+    cache = {} if refresh else load_cache(cache_path)
+    now = time.time()
+    result, stale = {}, []
+    for port in ports:
+        entry = cache.get(port)
+        if (entry and entry['bridge'] and now - entry['checked'] < ttl
+                and entry.get('serial_number') == known.get(port) and os.path.exists(port)):
+            result[port] = entry
+        else:
+            stale.append(port)
+    if stale:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(stale)) as pool:
+            for info in pool.map(lambda port: probe(port, timeout), stale):
+                info['serial_number'] = known.get(info['port'])
+                info['checked'] = now
+                result[info['port']] = cache[info['port']] = info
+        save_cache(cache, cache_path)
+    return result
+
+
+def find_mechdog(**kwargs):
+    """Port of the first MechDog that answered the type query, or None"""
+    for port, info in discover(**kwargs).items():
+        if info['camera'] is not None:
+            return port
+    return None
+
+
+def print_devices(devices):
+    for port, info in devices.items():
+        if info['error']:
+            status = f"error: {info['error']}"
+        elif info['camera'] is not None:
+            status = f"MechDog, camera {info['camera']} ({info['rtt'] * 1000:.0f} ms)"
+        elif info['bridge']:
+            status = "ESP32-C3 bridge, no type reply"
+        else:
+            status = "no response"
+        print(f"  {port:<20} {status}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Probe serial ports for MechDogs")
+    parser.add_argument('ports', nargs='*', help="ports to probe (default: all candidates)")
+    parser.add_argument('--timeout', type=float, default=0.5, help="probe timeout in seconds")
+    parser.add_argument('--refresh', action='store_true', help="ignore the cache")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    devices = discover(args.ports or None, args.timeout, refresh=args.refresh)
+    print(f"{len(devices)} port(s) in {time.monotonic() - start:.2f} s:")
+    print_devices(devices)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Stand-in for a MechDog + ESP32-C3 on a pseudo-terminal
+Speaks the real serial protocol (NIOT_ provisioning, CMD|1..8 commands,
+periodic CMD|1/2/3 telemetry like wifi_main) so the host tools can be run
+and measured without hardware. Latency, jitter and drop rate are configurable.
+
+Usage:
+  python3 fake_dog.py [--link /tmp/mechdog0] [--latency 0.005] [--jitter 0.002] [--drop 0.01]
+  python3 IoT.py /tmp/mechdog0
+"""
+
+import heapq
+import os
+import random
+import re
+import select
+import threading
+import time
+import tty
+
+import binframe
+from IoT import FrameBuffer, build_iot_command, parse_iot_frame
+
+NIOT_PATTERN = re.compile(rb'NIOT_(.*?)\|\|\|(.*?)\$\$\$')
+
+
+class FakeDog:
+    def __init__(self, link=None, latency=0.0, jitter=0.0, drop_rate=0.0,
+                 camera_type=1, intake_interval=0.0, seed=None):
+        """
+        latency/jitter: seconds added to every frame the dog sends
+        (latency + uniform(0, jitter))
+        drop_rate: probability that a received command or a sent frame is lost
+        intake_interval: > 0 models wifi_main's I2C polling: commands are only
+        picked up every interval, the newest one wins and a repeat of the
+        previous command is ignored
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.intake_interval = intake_interval
+        self.random = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.link = link
+        if link:
+            if os.path.islink(link):
+                os.unlink(link)
+            os.symlink(self.port, link)
+            self.port = link
+
+        # wifi_main state
+        self.esp32s3_type = camera_type
+        self.ssid = None
+        self.password = None
+        self.onoff_face = False
+        self.onoff_undef_obj = False
+        self.onoff_hit = False
+        self.color_detec_flag = False
+        self.sensor_flag = False
+        self.buzzer_flag = False
+        self.rgb = (0, 0, 0)
+        self.actions = []
+        self.binary_mode = False
+        self.distance = 40.0
+        self.color = 0
+
+        self.commands_received = 0
+        self.commands_dropped = 0
+        self.commands_lost = 0
+        self.parse_errors = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+        self._frames = FrameBuffer()
+        self._binary = binframe.FrameDecoder()
+        self._outgoing = []  # heap of (due, seq, bytes)
+        self._seq = 0
+        self._slot = None
+        self._last_intake = None
+        self._last_command = None
+        self._running = False
+        self._thread = None
+        # Optional callback(cmd_type, args) after a command is applied
+        self.on_command = None
+
+    def start(self):
+        """Run the device in a background thread"""
+        self._running = True
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        os.close(self.master)
+        os.close(self.slave)
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def send_frame(self, cmd_type, *values):
+        """Queue a reply/telemetry frame with the configured latency"""
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.frames_dropped += 1
+            return
+        if self.binary_mode:
+            data = binframe.encode(cmd_type, values, binframe.REPLIES)
+        else:
+            data = build_iot_command(cmd_type, *values).encode('ascii')
+        self._send(data)
+
+    def _send(self, data):
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        self._seq += 1
+        heapq.heappush(self._outgoing, (time.monotonic() + delay, self._seq, data))
+
+    def _receive(self, data):
+        for match in NIOT_PATTERN.finditer(data):
+            self.ssid = match.group(1).decode('utf-8', errors='ignore')
+            self.password = match.group(2).decode('utf-8', errors='ignore')
+            # The ESP32-C3 echoes the configuration line back
+            self._send(match.group(0) + b'\r\n')
+        if self.binary_mode:
+            for frame in self._binary.feed(data):
+                try:
+                    cmd_type, values = binframe.decode(frame, binframe.COMMANDS)
+                except ValueError:
+                    # Unknown type or wrong length: skip it, the decoder has
+                    # already moved on to the next sync byte
+                    self.parse_errors += 1
+                    continue
+                self._command(cmd_type, values)
+        for frame in self._frames.feed(data):
+            try:
+                cmd_type, fields = parse_iot_frame(frame)
+                args = [int(x) for x in fields if x]
+            except ValueError:
+                self.parse_errors += 1
+                continue
+            self._command(cmd_type, args)
+
+    def _command(self, cmd_type, args):
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.commands_dropped += 1
+            return
+        if self.intake_interval:
+            if self._slot is not None:
+                self.commands_lost += 1
+            self._slot = (cmd_type, tuple(args))
+            return
+        self.handle_command(cmd_type, args)
+
+    def handle_command(self, cmd_type, args):
+        """Apply one command the way wifi_handle() does"""
+        self.commands_received += 1
+        try:
+            if cmd_type == 1:
+                self.onoff_face = args[0] == 1
+                if self.onoff_face:
+                    self.color_detec_flag = False
+                self.onoff_undef_obj = args[1] == 1
+                self.onoff_hit = args[2] == 1
+            elif cmd_type == 2:
+                self.color_detec_flag = args[0] == 1
+                if self.color_detec_flag:
+                    self.onoff_face = False
+            elif cmd_type == 3:
+                self.sensor_flag = args[0] == 1
+            elif cmd_type == 4:
+                self.rgb = tuple(args[:3])
+            elif cmd_type == 5:
+                self.buzzer_flag = args[0] == 1
+            elif cmd_type == 6:
+                self.actions.append((args[0], args[1]))
+            elif cmd_type == 7:
+                self.send_frame(7, self.esp32s3_type)
+            elif cmd_type == 8:
+                # Ack in the protocol being left, then switch
+                self.send_frame(8, args[0])
+                self.binary_mode = args[0] == 1
+        except IndexError:
+            pass
+        if self.on_command is not None:
+            self.on_command(cmd_type, args)
+
+    def _tick_sensors(self):
+        # Random walk around a target, with occasional sonar dropouts
+        self.distance = min(max(self.distance + self.random.gauss(0, 1.5), 3), 300)
+        if self.random.random() < 0.01:
+            self.color = self.random.choice((0, 1, 2, 3))
+
+    def _intake(self, now):
+        if self._last_intake is not None and now - self._last_intake < self.intake_interval:
+            return
+        self._last_intake = now
+        command, self._slot = self._slot, None
+        if command is None:
+            return
+        if command == self._last_command:
+            # wifi_main ignores a buffer identical to the previous one
+            self.commands_lost += 1
+            return
+        self._last_command = command
+        self.handle_command(command[0], list(command[1]))
+
+    def run(self):
+        """Device loop; runs until stop()"""
+        self._running = True
+        next_100ms = next_1000ms = time.monotonic()
+        while self._running:
+            now = time.monotonic()
+            due = min(next_100ms, next_1000ms)
+            if self._outgoing:
+                due = min(due, self._outgoing[0][0])
+            if self.intake_interval and self._last_intake is not None:
+                # Wake for the next poll, like wifi_main's sleep_ms(100) loop
+                due = min(due, self._last_intake + self.intake_interval)
+            readable, _, _ = select.select([self.master], [], [], max(0.0, min(due - now, 0.1)))
+            if readable:
+                try:
+                    data = os.read(self.master, 4096)
+                except OSError:
+                    data = b''
+                if data:
+                    self._receive(data)
+            now = time.monotonic()
+            if self.intake_interval:
+                self._intake(now)
+            if now >= next_100ms:
+                next_100ms += 0.1
+                self._tick_sensors()
+                if self.color_detec_flag:
+                    self.send_frame(2, self.color)
+                if self.sensor_flag:
+                    self.send_frame(3, 500 if self.random.random() < 0.02 else int(self.distance))
+            if now >= next_1000ms:
+                next_1000ms += 1.0
+                warn_face = self.onoff_face and self.random.random() < 0.3
+                warn_obj = self.onoff_undef_obj and self.distance < 15
+                self.send_frame(1, int(warn_face), int(warn_obj), 0)
+            while self._outgoing and self._outgoing[0][0] <= now:
+                _, _, data = heapq.heappop(self._outgoing)
+                try:
+                    os.write(self.master, data)
+                    self.frames_sent += 1
+                except OSError:
+                    pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PTY stand-in for a MechDog ESP32-C3")
+    parser.add_argument('--link', default='/tmp/mechdog0', help="symlink to the pty (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0.0, help="reply latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random latency in seconds")
+    parser.add_argument('--drop', type=float, default=0.0, help="drop probability per command/frame")
+    parser.add_argument('--camera', type=int, default=1, help="ESP32S3 type: 0=none, 1=face, 2=color")
+    parser.add_argument('--intake', type=float, default=0.0,
+                        help="model wifi_main's polling interval in seconds (e.g. 0.1)")
+    args = parser.parse_args()
+
+    dog = FakeDog(args.link, args.latency, args.jitter, args.drop, args.camera, args.intake)
+    print(f"Fake MechDog on {dog.port} (Ctrl+C to stop)...")
+    try:
+        dog.run()
+    except KeyboardInterrupt:
+        print(f"\nReceived {dog.commands_received} commands, sent {dog.frames_sent} frames "
+              f"(dropped {dog.commands_dropped} commands, {dog.frames_dropped} frames, "
+              f"{dog.parse_errors} unparsable)")
+    finally:
+        dog.stop()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+MechDog fleet controller
+Drives many ESP32-C3 modules (one serial port per dog) from a single
+selectors/epoll event loop instead of one IoT.py process per dog.
+"""
+
+import collections
+import os
+import selectors
+import time
+
+import serial
+
+from IoT import build_iot_command
+from decoder import RecordDecoder
+
+
+class _Device:
+    """Per-port state owned by the fleet loop"""
+
+    def __init__(self, device_id, port, ser):
+        self.device_id = device_id
+        self.port = port
+        self.serial = ser
+        self.fd = ser.fileno()
+        self.frames = RecordDecoder()
+        self.outgoing = bytearray()
+        self.writing = False
+        self.pending_commands = 0
+        self.pending_frames = 0
+        self.frames_received = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.last_frame = None
+
+
+class MechDogFleet:
+    def __init__(self, ports=(), baudrate=115200, telemetry_size=100000):
+        """
+        Open every port without the usual 2 s settle delay; commands are
+        queued per device and written as soon as the port accepts them.
+        """
+        self.baudrate = baudrate
+        self.selector = selectors.DefaultSelector()
+        self.devices = {}
+        # Merged telemetry of all devices: (device_id, record, timestamp), see decoder.py
+        self.telemetry = collections.deque()
+        self.telemetry_size = telemetry_size
+        self.telemetry_dropped = 0
+        self.on_frame = None
+        # Devices that were unplugged or closed their end: device_id -> reason.
+        # on_device_lost(device_id, reason) is called when it happens.
+        self.lost = {}
+        self.on_device_lost = None
+        for port in ports:
+            self.add_device(port)
+
+    def add_device(self, port, device_id=None):
+        """Open a port and add it to the event loop, returns the device ID"""
+        if device_id is None:
+            device_id = os.path.basename(port)
+        if device_id in self.devices:
+            raise ValueError(f"Duplicate device ID: {device_id}")
+        ser = serial.Serial(port, self.baudrate, timeout=0, write_timeout=0)
+        device = _Device(device_id, port, ser)
+        self.devices[device_id] = device
+        self.selector.register(device.fd, selectors.EVENT_READ, device)
+        return device_id
+
+    def remove_device(self, device_id):
+        """Close a device and drop its queued commands"""
+        device = self.devices.pop(device_id)
+        self.selector.unregister(device.fd)
+        try:
+            device.serial.close()
+        except OSError:
+            pass  # already gone with the USB adapter
+
+    def _lost(self, device, reason):
+        """Drop a device whose port failed, so the loop neither spins on it nor dies"""
+        if self.devices.get(device.device_id) is not device:
+            return
+        self.remove_device(device.device_id)
+        self.lost[device.device_id] = reason
+        if self.on_device_lost is not None:
+            self.on_device_lost(device.device_id, reason)
+
+    def send_command(self, cmd, device_ids=None):
+        """Queue a command string for some devices (None = broadcast)"""
+        if not cmd.endswith('\n'):
+            cmd += '\n'
+        data = cmd.encode('utf-8')
+        # A copy: a failed write removes its device from self.devices
+        targets = list(self.devices.values()) if device_ids is None else [self.devices[d] for d in device_ids]
+        for device in targets:
+            if self.devices.get(device.device_id) is not device:
+                continue  # lost earlier in this loop
+            device.pending_commands += 1
+            idle = not device.outgoing
+            device.outgoing += data
+            if idle:
+                self._flush(device)
+
+    def send_iot_command(self, cmd_type, *params, device_ids=None):
+        """Queue an IoT command (CMD|type|...|$) for some devices (None = broadcast)"""
+        self.send_command(build_iot_command(cmd_type, *params), device_ids)
+
+    def queue_depth(self, device_id=None):
+        """
+        Per-device queue depth: commands not yet written to the port and
+        frames waiting in the merged telemetry stream
+        """
+        if device_id is not None:
+            device = self.devices[device_id]
+            return {'tx': device.pending_commands, 'rx': device.pending_frames}
+        return {d: self.queue_depth(d) for d in self.devices}
+
+    def _flush(self, device):
+        try:
+            written = os.write(device.fd, device.outgoing)
+        except BlockingIOError:
+            written = 0
+        except OSError as e:
+            self._lost(device, f"write failed: {e}")
+            return
+        if written:
+            device.bytes_out += written
+            device.pending_commands -= device.outgoing.count(b'\n', 0, written)
+            del device.outgoing[:written]
+        # Only watch for writability while something is left to send
+        writing = bool(device.outgoing)
+        if writing != device.writing:
+            device.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self.selector.modify(device.fd, events, device)
+
+    def _read(self, device, now):
+        try:
+            data = os.read(device.fd, 4096)
+        except BlockingIOError:
+            return 0
+        except OSError as e:
+            self._lost(device, f"read failed: {e}")
+            return 0
+        if not data:
+            self._lost(device, "end of file")
+            return 0
+        device.bytes_in += len(data)
+        count = 0
+        for record in device.frames.feed(data):
+            count += 1
+            device.frames_received += 1
+            device.last_frame = now
+            if self.on_frame is not None:
+                self.on_frame(device.device_id, record, now)
+                continue
+            if len(self.telemetry) >= self.telemetry_size:
+                dropped = self.telemetry.popleft()
+                self.telemetry_dropped += 1
+                old = self.devices.get(dropped[0])
+                if old is not None:
+                    old.pending_frames -= 1
+            self.telemetry.append((device.device_id, record, now))
+            device.pending_frames += 1
+        return count
+
+    def poll(self, timeout=None):
+        """
+        Run one event loop iteration, returns the number of frames received
+        Other file objects can share the loop: register them on self.selector
+        with a callable as data, it is called with the event mask.
+        """
+        count = 0
+        events = self.selector.select(timeout)
+        now = time.monotonic()
+        for key, mask in events:
+            device = key.data
+            if not isinstance(device, _Device):
+                device(mask)
+                continue
+            if self.devices.get(device.device_id) is not device:
+                continue  # lost earlier in this iteration
+            if mask & selectors.EVENT_READ:
+                count += self._read(device, now)
+            if mask & selectors.EVENT_WRITE and self.devices.get(device.device_id) is device:
+                self._flush(device)
+        return count
+
+    def run(self, duration=None):
+        """Run the event loop for duration seconds (None = forever)"""
+        end = None if duration is None else time.monotonic() + duration
+        while end is None or time.monotonic() < end:
+            self.poll(0.1 if end is None else max(0, min(0.1, end - time.monotonic())))
+
+    def read_telemetry(self, max_frames=None):
+        """Pop frames from the merged stream: list of (device_id, record, timestamp)"""
+        frames = []
+        while self.telemetry and (max_frames is None or len(frames) < max_frames):
+            frame = self.telemetry.popleft()
+            device = self.devices.get(frame[0])
+            if device is not None:
+                device.pending_frames -= 1
+            frames.append(frame)
+        return frames
+
+    def close(self):
+        """Close every device"""
+        for device_id in list(self.devices):
+            self.remove_device(device_id)
+        self.selector.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    import discovery
+
+    ports = sys.argv[1:] or list(discovery.candidate_ports())
+    if not ports:
+        print("No serial ports found")
+        sys.exit(1)
+
+    fleet = MechDogFleet(ports)
+    fleet.on_device_lost = lambda device_id, reason: print(f"{device_id} lost: {reason}")
+    print(f"Controlling {len(fleet.devices)} dogs: {', '.join(fleet.devices)}")
+    fleet.send_iot_command(1, 1, 1, 1)
+    fleet.send_iot_command(3, 1)
+    try:
+        while True:
+            fleet.poll(0.5)
+            for device_id, record, timestamp in fleet.read_telemetry():
+                print(f"[{timestamp:.3f}] {device_id}: {record}")
+    except KeyboardInterrupt:
+        print("\nStopping fleet...")
+    finally:
+        fleet.send_iot_command(3, 0)
+        fleet.run(0.2)
+        fleet.close()
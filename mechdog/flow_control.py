@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Flow control for commands sent to a MechDog
+wifi_main reads the ESP32-C3 bridge over I2C only every 100 ms, one 20-byte
+buffer at a time, and ignores a buffer identical to the previous one; a
+command written before the last one was picked up overwrites it. SendQueue
+paces commands to that intake rate instead of losing them.
+"""
+
+import collections
+import threading
+import time
+
+# wifi_main's polling interval; its loop also spends time handling each
+# command, so commands are spaced a little further apart than this
+DEVICE_INTAKE_INTERVAL = 0.1
+PACING_INTERVAL = 0.12
+POLICIES = ('block', 'drop-oldest', 'coalesce')
+
+
+class TokenBucket:
+    """rate tokens per second, with up to burst tokens saved up"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp', 'clock', '_lock')
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.stamp = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, n=1):
+        """Take n tokens if they are there, returns whether it did"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= n:
+                self.tokens -= n
+                return True
+            return False
+
+    def refund(self, n=1):
+        """Give back n tokens that were taken but not used, up to burst"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.burst, self.tokens + n)
+
+    def delay(self, n=1):
+        """Seconds until n tokens are available (0 = now)"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (n - self.tokens) / self.rate)
+
+
+class SendQueue:
+    """
+    Bounded queue of encoded commands, written by a pacer thread no faster
+    than the device can take them in. Overflow policies:
+      block        put() waits for room (or until its timeout, then drops)
+      drop-oldest  the oldest waiting command makes room
+      coalesce     a command with the key of a waiting one replaces it in
+                   place (latest setter value wins), otherwise like block
+    With skip_repeats, a command identical to the previous one written is
+    skipped, since wifi_main would ignore it (last_receive). That only holds
+    while nothing else talks to the dog, so it is off by default.
+    """
+
+    def __init__(self, write, maxsize=32, policy='coalesce', interval=PACING_INTERVAL, metrics=None,
+                 skip_repeats=False):
+        """
+        write(data) does the I/O from the pacer thread
+        interval: seconds between commands (default: intake interval + margin)
+        metrics: optional metrics.DeviceMetrics for the queue counters
+        skip_repeats: don't write a command identical to the previous one
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+        self.write = write
+        self.maxsize = maxsize
+        self.policy = policy
+        self.skip_repeats = skip_repeats
+        self.bucket = TokenBucket(1.0 / interval, 1)
+        self.metrics = metrics
+        self.queue = collections.deque()  # [key, data]
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.duplicates = 0
+        self.max_depth = 0
+        self._last = None
+        self._writing = False
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, data, key=None, timeout=None):
+        """Queue one command, returns False if it was dropped"""
+        with self._cond:
+            if self._closed:
+                raise ValueError("send queue is closed")
+            if key is not None and self.policy == 'coalesce':
+                for entry in self.queue:
+                    if entry[0] == key:
+                        entry[1] = data
+                        self.coalesced += 1
+                        self._update_metrics()
+                        return True
+            if len(self.queue) >= self.maxsize:
+                if self.policy != 'drop-oldest':
+                    if not self._cond.wait_for(lambda: len(self.queue) < self.maxsize or self._closed, timeout) \
+                            or self._closed:
+                        self.dropped += 1
+                        self._update_metrics()
+                        return False
+                else:
+                    self.queue.popleft()
+                    self.dropped += 1
+            self.queue.append([key, data])
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self._update_metrics()
+            self._cond.notify_all()
+            return True
+
+    def __len__(self):
+        return len(self.queue)
+
+    def _update_metrics(self):
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.queue_depth = len(self.queue)
+            metrics.queue_dropped = self.dropped
+            metrics.queue_coalesced = self.coalesced
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.queue or self._closed)
+                if not self.queue:
+                    return  # closed and drained
+            # Sleep outside the lock so put() keeps coalescing into the queue
+            while not self.bucket.take():
+                time.sleep(self.bucket.delay())
+            with self._cond:
+                if not self.queue:
+                    self.bucket.refund()  # not used, give it back
+                    continue
+                key, data = self.queue.popleft()
+                self._writing = True
+                self._update_metrics()
+                self._cond.notify_all()
+            try:
+                if self.skip_repeats and data == self._last:
+                    self.duplicates += 1
+                    self.bucket.refund()
+                    continue
+                self.write(data)
+                self._last = data
+                self.sent += 1
+            finally:
+                self._writing = False
+
+    def join(self, timeout=None):
+        """Wait until everything queued has been written, returns whether it was"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue or self._writing:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.bucket.delay() or 0.005)
+        return True
+
+    def close(self, timeout=None):
+        """Stop the pacer once the queue is drained (or after timeout)"""
+        self.join(timeout)
+        with self._cond:
+            self._closed = True
+            self.dropped += len(self.queue)
+            self.queue.clear()
+            self._update_metrics()
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        return {'depth': len(self.queue), 'max_depth': self.max_depth, 'sent': self.sent,
+                'dropped': self.dropped, 'coalesced': self.coalesced, 'duplicates': self.duplicates}
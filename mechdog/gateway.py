@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+MechDog HTTP/WebSocket gateway
+Lets several operators and dashboards control and watch the same dogs at
+once. Every dog is an AsyncMechDogIoT on one asyncio loop; commands go
+through a per-device priority queue (motion and stop ahead of queries,
+sensor switches and LED/buzzer), paced to the rate wifi_main takes them
+in, and every client has a token-bucket rate limit. Telemetry is encoded once per frame and offered to a bounded queue
+per WebSocket subscriber, so a slow subscriber loses its oldest frames
+instead of stalling the serial reader.
+
+HTTP API (JSON bodies and replies, keep-alive supported):
+  GET  /devices                   devices with queue and fan-out counters
+  POST /devices/<id>/command      {"command": "set_rgb_led", "args": [255, 0, 0]}
+                                  or {"type": 4, "params": [255, 0, 0]}
+                                  add "wait": true to wait for the reply frame
+  GET  /devices/<id>/ws           WebSocket: telemetry records as JSON text
+                                  messages; commands can be sent on it too
+Rate limits are kept per client address (not a header the client could vary).
+
+Usage:
+  python3 gateway.py [ports...] [--listen 8080] [--rate 20] [--burst 10]
+  curl -d '{"command": "run_action", "args": [1, 3]}' localhost:8080/devices/ttyUSB0/command
+"""
+
+import asyncio
+import base64
+import collections
+import hashlib
+import itertools
+import json
+import os
+import struct
+import time
+
+import serial
+
+from IoT import build_iot_command
+from async_iot import AsyncMechDogIoT
+from flow_control import PACING_INTERVAL, TokenBucket
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_MESSAGE = 1 << 16
+# Lower is sent first: motion (and stop) > queries > sensor switches > LED/buzzer
+PRIORITIES = {6: 0, 7: 1, 1: 2, 2: 2, 3: 2, 4: 3, 5: 3}
+DEFAULT_PRIORITY = 3
+
+
+def _on(enable=True):
+    return 1 if enable else 0
+
+
+# MechDogIoT method name -> (cmd_type, params)
+COMMANDS = {
+    'enable_face_detection': lambda enable=True: (1, (_on(enable), 0, 0)),
+    'enable_object_detection': lambda enable=True: (1, (0, _on(enable), 0)),
+    'enable_impact_detection': lambda enable=True: (1, (0, 0, _on(enable))),
+    'enable_color_detection': lambda enable=True: (2, (_on(enable),)),
+    'enable_sensor_distance': lambda enable=True: (3, (_on(enable),)),
+    'set_rgb_led': lambda r, g, b: (4, (int(r), int(g), int(b))),
+    'set_buzzer': lambda enable=True: (5, (_on(enable),)),
+    'run_action': lambda action_type, action_num: (6, (int(action_type), int(action_num))),
+    'query_esp32s3_type': lambda: (7, ()),
+}
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           429: 'Too Many Requests', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+
+class GatewayError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_command(request):
+    """JSON command object -> (cmd_type, params)"""
+    if not isinstance(request, dict):
+        raise GatewayError(400, "expected a JSON object")
+    try:
+        if 'command' in request:
+            make = COMMANDS.get(request['command'])
+            if make is None:
+                raise GatewayError(400, f"unknown command {request['command']!r}")
+            cmd_type, params = make(*request.get('args', ()))
+        else:
+            cmd_type, params = int(request['type']), tuple(int(p) for p in request.get('params', ()))
+    except (KeyError, TypeError, ValueError):
+        raise GatewayError(400, "expected {\"command\": name, \"args\": [...]} or "
+                                "{\"type\": n, \"params\": [...]}") from None
+    if cmd_type == 8:
+        # Switching the protocol would break every other client of the dog
+        raise GatewayError(400, "protocol select (CMD|8) is not allowed through the gateway")
+    return cmd_type, params
+
+
+def record_json(record):
+    return {'type': record.cmd_type, 'record': type(record).__name__, 'values': list(record.values())}
+
+
+def ws_frame(payload, opcode=1):
+    """Unmasked, unfragmented server frame (opcode 1 = text)"""
+    n = len(payload)
+    if n < 126:
+        header = bytes((0x80 | opcode, n))
+    elif n < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + payload
+
+
+async def read_ws_frame(reader):
+    """Read one client frame -> (opcode, payload); fragments are not joined"""
+    head = await reader.readexactly(2)
+    opcode = head[0] & 0x0F
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > MAX_MESSAGE:
+        raise ConnectionError(f"WebSocket message of {length} bytes")
+    mask = await reader.readexactly(4) if head[1] & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask and length:
+        key = (mask * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+    return opcode, payload
+
+
+class _Subscriber:
+    """One WebSocket client of a device with its bounded send queue"""
+
+    def __init__(self, writer, size):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=size)
+        self.dropped = 0
+
+    def offer(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()  # the oldest frame is the least useful
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def send_loop(self):
+        while True:
+            self.writer.write(await self.queue.get())
+            await self.writer.drain()
+
+
+class _Device:
+    """Per-dog command queue and subscribers"""
+
+    def __init__(self, device_id, dog, queue_size, interval):
+        self.device_id = device_id
+        self.dog = dog
+        self.queue = asyncio.PriorityQueue(maxsize=queue_size)
+        self.pacer = TokenBucket(1.0 / interval, 1) if interval else None
+        self.sequence = itertools.count()  # keeps FIFO order within a priority
+        self.subscribers = set()
+        self.sent = 0
+        self.rejected = 0
+        self.frames = 0
+        self.dropped = 0  # frames dropped for subscribers that have gone
+
+
+class Gateway:
+    def __init__(self, ports=(), rate=20.0, burst=10, queue_size=256, subscriber_queue=256,
+                 reply_timeout=1.0, interval=PACING_INTERVAL, max_clients=1024):
+        """
+        rate/burst: commands per second each client may send, with bursts
+        max_clients: rate limits kept, the least recently seen client's goes first
+        queue_size: commands waiting per device before clients get 503
+        interval: seconds between commands written to a dog (0 = no pacing)
+        subscriber_queue: frames buffered per WebSocket subscriber
+        """
+        self.ports = list(ports)
+        self.rate = rate
+        self.burst = burst
+        self.queue_size = queue_size
+        self.subscriber_queue = subscriber_queue
+        self.reply_timeout = reply_timeout
+        self.interval = interval
+        self.devices = {}
+        self.max_clients = max_clients
+        self.buckets = collections.OrderedDict()  # client address -> TokenBucket, least recent first
+        self._connections = set()
+        self._tasks = []
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=8080, settle=2):
+        """Open every dog and start listening"""
+        dogs = [AsyncMechDogIoT(p) for p in self.ports]
+        await asyncio.gather(*(dog.connect(settle) for dog in dogs))
+        for dog in dogs:
+            device = _Device(os.path.basename(dog.port), dog, self.queue_size, self.interval)
+            self.devices[device.device_id] = device
+            self._tasks.append(asyncio.create_task(self._worker(device)))
+            self._tasks.append(asyncio.create_task(self._pump(device)))
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        for task in self._tasks:
+            task.cancel()
+        for writer in self._connections:
+            writer.close()
+        for device in self.devices.values():
+            device.dog.close()
+
+    def status(self):
+        return [{
+            'device': d.device_id,
+            'port': d.dog.port,
+            'queued': d.queue.qsize(),
+            'sent': d.sent,
+            'rejected': d.rejected,
+            'frames': d.frames,
+            'subscribers': len(d.subscribers),
+            'frames_dropped': d.dropped + sum(s.dropped for s in d.subscribers),
+            'telemetry_dropped': d.dog.telemetry_dropped,
+        } for d in self.devices.values()]
+
+    def _device(self, device_id):
+        device = self.devices.get(device_id)
+        if device is None:
+            raise GatewayError(404, f"no device {device_id!r}")
+        return device
+
+    def _bucket(self, client):
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                self.buckets.popitem(last=False)
+            bucket = self.buckets[client] = TokenBucket(self.rate, self.burst)
+        else:
+            self.buckets.move_to_end(client)
+        return bucket
+
+    async def command(self, device_id, client, request):
+        """Queue one command and wait until it is written (and its reply, with "wait")"""
+        device = self._device(device_id)
+        cmd_type, params = parse_command(request)
+        bucket = self._bucket(client)
+        if not bucket.take():
+            device.rejected += 1
+            raise GatewayError(429, f"rate limit of {self.rate:g} commands/s exceeded", bucket.delay())
+
+        dog = device.dog
+        # Registered before the command can be sent so the reply can't be missed
+        reply = dog.expect_reply(cmd_type) if request.get('wait') else None
+        try:
+            written = asyncio.get_running_loop().create_future()
+            try:
+                device.queue.put_nowait((PRIORITIES.get(cmd_type, DEFAULT_PRIORITY), next(device.sequence),
+                                         cmd_type, params, written))
+            except asyncio.QueueFull:
+                device.rejected += 1
+                raise GatewayError(503, f"command queue of {device_id} is full") from None
+            await written
+
+            result = {'device': device_id, 'sent': build_iot_command(cmd_type, *params)}
+            if reply is not None:
+                try:
+                    result['reply'] = record_json(await dog.wait_reply(cmd_type, reply, self.reply_timeout))
+                except asyncio.TimeoutError:
+                    raise GatewayError(504, f"no reply from {device_id} in {self.reply_timeout:g} s") from None
+            return result
+        finally:
+            # A failed write or a cancelled request must not leave the waiter behind
+            if reply is not None and not reply.done():
+                dog.cancel_reply(cmd_type, reply)
+
+    async def _worker(self, device):
+        """Write queued commands to the dog, highest priority first"""
+        dog = device.dog
+        pacer = device.pacer
+        while True:
+            # Wait for the slot before picking, so the most urgent command gets it
+            if pacer is not None:
+                delay = pacer.delay()
+                if delay:
+                    await asyncio.sleep(delay)
+            priority, sequence, cmd_type, params, written = await device.queue.get()
+            if pacer is not None:
+                pacer.take()
+            try:
+                dog.send_iot_command(cmd_type, *params)
+            except (serial.SerialException, OSError) as e:
+                if not written.done():
+                    written.set_exception(GatewayError(503, f"{device.device_id}: {e}"))
+                continue
+            device.sent += 1
+            if not written.done():
+                written.set_result(None)
+
+    async def _pump(self, device):
+        """Fan telemetry out to the subscribers without ever waiting on one"""
+        telemetry = device.dog.telemetry
+        while True:
+            record = await telemetry.get()
+            device.frames += 1
+            if not device.subscribers:
+                continue
+            message = record_json(record)
+            message['device'] = device.device_id
+            message['t'] = time.time()
+            frame = ws_frame(json.dumps(message).encode('utf-8'))
+            for subscriber in device.subscribers:
+                subscriber.offer(frame)
+
+    async def _handle(self, reader, writer):
+        """One HTTP connection, kept open between requests unless asked not to"""
+        peer = writer.get_extra_info('peername')
+        address = peer[0] if isinstance(peer, tuple) else 'local'
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    self._respond(writer, 400, {'error': "bad request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length') or 0))
+                parts = path.split('?', 1)[0].strip('/').split('/')
+
+                if headers.get('upgrade', '').lower() == 'websocket':
+                    await self._websocket(parts, headers, reader, writer, address)
+                    break
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    status, payload = 200, await self._route(method, parts, body, address)
+                    extra = None
+                except GatewayError as e:
+                    status, payload = e.status, {'error': str(e)}
+                    extra = {'Retry-After': f"{e.retry_after:.3f}"} if e.retry_after is not None else None
+                self._respond(writer, status, payload, keep_alive, extra)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _route(self, method, parts, body, address):
+        if parts == ['devices']:
+            if method != 'GET':
+                raise GatewayError(405, "use GET")
+            return self.status()
+        if len(parts) == 3 and parts[0] == 'devices' and parts[2] == 'command':
+            if method != 'POST':
+                raise GatewayError(405, "use POST")
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                raise GatewayError(400, "body is not JSON") from None
+            return await self.command(parts[1], address, request)
+        raise GatewayError(404, "not found")
+
+    @staticmethod
+    def _respond(writer, status, payload, keep_alive, extra=None):
+        body = json.dumps(payload).encode('utf-8')
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        for name, value in (extra or {}).items():
+            head.append(f"{name}: {value}")
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+
+    async def _websocket(self, parts, headers, reader, writer, address):
+        key = headers.get('sec-websocket-key')
+        if len(parts) != 3 or parts[0] != 'devices' or parts[2] != 'ws' or parts[1] not in self.devices:
+            self._respond(writer, 404, {'error': "not found"}, False)
+            return
+        if not key:
+            self._respond(writer, 400, {'error': "missing Sec-WebSocket-Key"}, False)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode('ascii'))
+
+        device = self.devices[parts[1]]
+        subscriber = _Subscriber(writer, self.subscriber_queue)
+        device.subscribers.add(subscriber)
+        sender = asyncio.create_task(subscriber.send_loop())
+        try:
+            while True:
+                opcode, payload = await read_ws_frame(reader)
+                if opcode == 8:  # close
+                    writer.write(ws_frame(payload[:2], 8))
+                    break
+                if opcode == 9:  # ping
+                    writer.write(ws_frame(payload, 10))
+                    continue
+                if opcode != 1:
+                    continue
+                # Replies skip the telemetry queue so they are never dropped
+                try:
+                    reply = await self.command(device.device_id, address, json.loads(payload))
+                except GatewayError as e:
+                    reply = {'error': str(e), 'status': e.status}
+                except ValueError:
+                    reply = {'error': "message is not JSON", 'status': 400}
+                writer.write(ws_frame(json.dumps(reply).encode('utf-8')))
+        finally:
+            sender.cancel()
+            device.subscribers.discard(subscriber)
+            device.dropped += subscriber.dropped
+
+
+async def _main(args):
+    import discovery
+
+    ports = args.ports or list(discovery.candidate_ports())
+    if not ports:
+        print("No serial ports found")
+        raise SystemExit(1)
+    gateway = Gateway(ports, rate=args.rate, burst=args.burst, interval=args.interval)
+    await gateway.start(args.host, args.listen)
+    print(f"Gateway for {', '.join(gateway.devices)} on http://{args.host}:{args.listen} (Ctrl+C to stop)")
+    try:
+        await gateway.serve_forever()
+    finally:
+        gateway.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Share MechDogs over HTTP and WebSocket")
+    parser.add_argument('ports', nargs='*', help="serial ports (default: every USB serial port)")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: %(default)s)")
+    parser.add_argument('--listen', type=int, default=8080, help="HTTP port (default: %(default)s)")
+    parser.add_argument('--rate', type=float, default=20.0, help="commands/s per client (default: %(default)s)")
+    parser.add_argument('--burst', type=int, default=10, help="command burst per client (default: %(default)s)")
+    parser.add_argument('--interval', type=float, default=PACING_INTERVAL,
+                        help="seconds between commands to a dog, 0 = no pacing (default: %(default)s)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        print("\nStopping gateway...")
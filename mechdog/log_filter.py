@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Rule-based suppression and summarization of serial log lines
+Rules come from a small text file, one per line, first matching rule wins:
+
+  keep      NIOT                        # always show
+  drop      ^Checking _ARM_ACTION       # never show
+  ratelimit 5    ^Servo \\d+ position    # at most 5 lines/s, then count
+  collapse  1.0  ARM_ACTION             # first line, then "N repeats in last 1 s"
+
+Patterns are Python regular expressions searched anywhere in the line
+(anchor with ^), each compiled on its own so inline flags, alternation and
+backreferences mean what they say. Rules are tried in order; lines matching
+no rule are shown.
+"""
+
+import re
+import sys
+import time
+
+ACTIONS = ('keep', 'drop', 'ratelimit', 'collapse')
+
+
+class Rule:
+    """One filter rule and its counters"""
+
+    def __init__(self, action, pattern, arg=None):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action: {action}")
+        if action in ('ratelimit', 'collapse') and arg is None:
+            raise ValueError(f"{action} needs a limit/window argument")
+        self.action = action
+        self.pattern = pattern
+        self.arg = arg
+        self.regex = re.compile(pattern)  # fails early with the offending pattern
+        self.hits = 0
+        self.suppressed = 0
+        # Current window: lines shown (ratelimit) and lines held back
+        self.window_start = None
+        self.window_shown = 0
+        self.window_suppressed = 0
+        self.last_line = None
+
+    def __repr__(self):
+        arg = f" {self.arg:g}" if self.arg is not None else ""
+        return f"{self.action}{arg} {self.pattern}"
+
+
+def parse_rules(text):
+    """Parse rules file text into a list of Rules"""
+    rules = []
+    for number, raw in enumerate(text.splitlines(), 1):
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        action, _, rest = line.partition(' ')
+        try:
+            if action in ('ratelimit', 'collapse'):
+                arg, pattern = rest.split(None, 1)
+                rules.append(Rule(action, pattern.strip(), float(arg)))
+            else:
+                rules.append(Rule(action, rest.strip()))
+        except (IndexError, ValueError, re.error) as e:
+            raise ValueError(f"Rule {number} ({line!r}): {e}") from None
+    return rules
+
+
+class LogFilter:
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.lines = 0
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(parse_rules(f.read()))
+
+    def process(self, line, now=None):
+        """Return the lines to show for one input line (may include summaries)"""
+        self.lines += 1
+        if now is None:
+            now = time.monotonic()
+        output = self.flush(now)
+        for rule in self.rules:
+            if rule.regex.search(line):
+                break
+        else:
+            output.append(line)
+            return output
+        rule.hits += 1
+        if rule.action == 'keep':
+            output.append(line)
+        elif rule.action == 'drop':
+            rule.suppressed += 1
+        else:
+            if rule.window_start is None:
+                rule.window_start = now
+            if rule.action == 'ratelimit' and rule.window_shown < rule.arg:
+                rule.window_shown += 1
+                output.append(line)
+            elif rule.action == 'collapse' and rule.window_shown == 0:
+                # First occurrence is shown as is, repeats are summarized
+                rule.window_shown = 1
+                output.append(line)
+            else:
+                rule.window_suppressed += 1
+                rule.suppressed += 1
+                rule.last_line = line
+        return output
+
+    def flush(self, now=None):
+        """Summaries of windows that have ended (call periodically when idle)"""
+        if now is None:
+            now = time.monotonic()
+        output = []
+        for rule in self.rules:
+            if rule.window_start is None:
+                continue
+            window = rule.arg if rule.action == 'collapse' else 1.0
+            if now - rule.window_start < window:
+                continue
+            if rule.window_suppressed:
+                if rule.action == 'collapse':
+                    output.append(f"{rule.last_line}  [{rule.window_suppressed} repeats in last {window:g} s]")
+                else:
+                    output.append(f"{rule.last_line}  [{rule.window_suppressed} more suppressed in last 1 s]")
+            rule.window_start = None
+            rule.window_shown = 0
+            rule.window_suppressed = 0
+            rule.last_line = None
+        return output
+
+    def stats(self):
+        """Per-rule counters: (rule, hits, suppressed)"""
+        return [(rule, rule.hits, rule.suppressed) for rule in self.rules]
+
+    def print_stats(self, file=sys.stdout):
+        print(f"Filter: {self.lines} lines", file=file)
+        for rule, hits, suppressed in self.stats():
+            print(f"  {hits:8d} hits {suppressed:8d} suppressed  {rule}", file=file)
+
+
+if __name__ == "__main__":
+    # Filter stdin, e.g. python3 -m serial.tools.miniterm ... | python3 log_filter.py rules.txt
+    log_filter = LogFilter.from_file(sys.argv[1])
+    try:
+        for raw in sys.stdin:
+            output = log_filter.process(raw.rstrip('\r\n'))
+            if output:
+                sys.stdout.write('\n'.join(output) + '\n')
+        output = log_filter.flush(float('inf'))
+        if output:
+            sys.stdout.write('\n'.join(output) + '\n')
+    except KeyboardInterrupt:
+        pass
+    log_filter.print_stats(sys.stderr)
@@ -9,17 +9,17 @@ import Hiwonder_IIC
 from Hiwonder_BLE import BLE
 from HW_MechDog import MechDog
 import machine
+import _thread
 import struct
+try:
+  import binframe  # optional: enables the compact binary protocol
+except ImportError:
+  binframe = None
 
 # Bluetooth variables
-_BLE_REC_DATA = 0
-_COMMAND = 0
-_SEND_DATA = 0
-_DATA = 0
-_distance = 0
+_DIR_FLAG = 1
 _SONER_DISTANCE = 0
 _self_balancing_flag = 0
-_RUN_STEP = 0
 _obstacle_avoidance_flag = 0
 _Pitch_angle = 0
 _Roll_angle = 0
@@ -29,6 +29,7 @@ _RUN_DIR = 0
 _REC_PARSE_VALUE = []
 _High_mm = 0
 _ARM_ACTION = 0
+_ARM_DIR = None
 arm_step = 0
 arm_tick = 0
 sonar_tick = 0
@@ -62,8 +63,7 @@ sensor_distance = 0
 buzzer_flag = False
 buzzer_on = False
 
-action_type = 0
-action_num = 0
+binary_mode = False
 
 # Initialize hardware
 mac = machine.unique_id()
@@ -119,22 +119,96 @@ def wifi_read():
   except:
     return None
 
+def wifi_send_frame(cmd_type, *values):
+  if binary_mode:
+    wifi_send(binframe.encode(cmd_type, values, binframe.REPLIES))
+  else:
+    wifi_send("CMD|{}|{}|$".format(cmd_type, "|".join([str(v) for v in values])))
+
+def wifi_parse(receive_data):
+  # Returns (type, [int params]) of a received command, or None
+  if binary_mode:
+    start, end = binframe.next_frame(receive_data)
+    if end > 0:
+      return binframe.decode(receive_data[start:end], binframe.COMMANDS)
+  receive_data = bytes([x for x in receive_data if x != 0xd3])
+  rec = receive_data.decode('utf-8')
+  start = rec.find("CMD|")
+  if start == -1:
+    return None
+  end = rec.find("$", start)
+  if end == -1:
+    end = len(rec)
+  cmd = rec[start + 4:end].split('|')
+  return int(cmd[0]), [int(x) for x in cmd[1:] if x]
+
+
+def wifi_handle(cmd_type, args):
+  global color_detec_flag
+  global sensor_flag
+  global buzzer_flag
+  global onoff_face
+  global onoff_undef_obj
+  global onoff_hit
+  global warn_hit
+  global binary_mode
+
+  if cmd_type == 0x01: # warn
+    if args[0] == 1:
+      onoff_face = True
+      color_detec_flag = False
+    else:
+      onoff_face = False
+    if args[1] == 1:
+      onoff_undef_obj = True
+    else:
+      onoff_undef_obj = False
+
+    if args[2] == 1:
+      onoff_hit = True
+      warn_hit = False
+    else:
+      onoff_hit = False
+
+  elif cmd_type == 0x02: # color detect
+    if args[0] == 0x01:
+      color_detec_flag = True
+      onoff_face = False
+    else:
+      color_detec_flag = False
+
+  elif cmd_type == 0x03: # sensor distance
+    if args[0] == 0x01:
+      sensor_flag = True
+    else:
+      sensor_flag = False
+
+  elif cmd_type == 0x04: # rgb
+    i2csonar.setRGB(0, args[0], args[1], args[2])
+
+  elif cmd_type == 0x05: # buzzer
+    if args[0] == 0x01:
+      buzzer_flag = True
+    else:
+      buzzer_flag = False
+  elif cmd_type == 0x06:
+    mail_put(MAIL_IOT_ACTION, args[0], args[1])
+
+  elif cmd_type == 0x07: # esp32s3 type
+    wifi_send_frame(7, esp32s3_type)
+
+  elif cmd_type == 0x08 and binframe: # protocol select, acked in the old protocol
+    wifi_send_frame(8, args[0])
+    binary_mode = args[0] == 1
+
 
 # WiFi IoT main thread
 def wifi_main():
   global warn_face
   global warn_undef_obj
   global warn_hit
-  global color_detec_flag
   global color_detec_num
-  global sensor_flag
   global sensor_distance
-  global buzzer_flag
-  global action_type
-  global action_num
-  global onoff_face
-  global onoff_undef_obj
-  global onoff_hit
   global esp32s3_type
   
   last_time_1000ms = 0
@@ -150,65 +224,19 @@ def wifi_main():
         last_time_50ms += 100
         receive_data = wifi_read()
         if receive_data != None:
-          receive_data = bytes([x for x in receive_data if x != 0xd3])
           if last_receive != receive_data:
             last_receive = receive_data
-            rec = receive_data.decode('utf-8')
-            if rec.find("CMD") != -1 and rec.find("$"):
-              cmd = rec.split('|')[1:]
-          
-              if int(cmd[0]) == 1: # warn
-                if int(cmd[1]) == 1:
-                  onoff_face = True
-                  color_detec_flag = False
-                else:
-                  onoff_face = False
-                if int(cmd[2]) == 1:
-                  onoff_undef_obj = True
-                else:
-                  onoff_undef_obj = False
-                  
-                if int(cmd[3]) == 1:
-                  onoff_hit = True
-                  warn_hit = False
-                else:
-                  onoff_hit = False
-                  
-              elif int(cmd[0]) == 0x02: # color detect
-                if int(cmd[1]) == 0x01:
-                  color_detec_flag = True
-                  onoff_face = False
-                else:
-                  color_detec_flag = False
-                  
-              elif int(cmd[0]) == 0x03: # sensor distance
-                if int(cmd[1]) == 0x01:
-                  sensor_flag = True
-                else:
-                  sensor_flag = False
-                  
-              elif int(cmd[0]) == 0x04: # rgb
-                i2csonar.setRGB(0, int(cmd[1]), int(cmd[2]), int(cmd[3]))
-                
-              elif int(cmd[0]) == 0x05: # buzzer
-                if int(cmd[1]) == 0x01:
-                  buzzer_flag = True
-                else:
-                  buzzer_flag = False
-              elif int(cmd[0]) == 0x06:
-                action_type = int(cmd[1])
-                action_num = int(cmd[2])
-                
-              elif int(cmd[0]) == 0x07: # esp32s3 type
-                wifi_send("CMD|7|{}|$".format(esp32s3_type))
+            cmd = wifi_parse(receive_data)
+            if cmd:
+              wifi_handle(cmd[0], cmd[1])
                 
       if time.ticks_ms() > last_time_100ms:
         last_time_100ms += 100
         if color_detec_flag == True:
-          wifi_send("CMD|2|{}|$".format(color_detec_num))
+          wifi_send_frame(2, color_detec_num)
 
         if sensor_flag == True:
-          wifi_send("CMD|3|{}|$".format(sensor_distance))
+          wifi_send_frame(3, sensor_distance)
           
       if time.ticks_ms() > last_time_1000ms:
         last_time_1000ms += 1000
@@ -219,8 +247,7 @@ def wifi_main():
           flags[1] = 1
         if warn_hit == True:
           flags[2] = 1
-        buf = "CMD|1|{}|{}|{}|$".format(flags[0],flags[1],flags[2])
-        wifi_send(buf)
+        wifi_send_frame(1, flags[0], flags[1], flags[2])
     except:
       sleep_ms(100)
 
@@ -277,142 +304,290 @@ def esp32s3_main():
 
 
 # Bluetooth APP control thread
-def start_main():
-  global ble
-  global _BLE_REC_DATA
-  global _COMMAND
-  global _SEND_DATA
-  global _DATA
-  global _distance
-  global _SONER_DISTANCE
-  global _self_balancing_flag
-  global _RUN_STEP
-  global _obstacle_avoidance_flag
+# Commands for start_main1 go through a mailbox instead of single slots,
+# so one arriving before the last is picked up no longer overwrites it.
+MAIL_SIZE = 16
+MAIL_DRIVE = 1      # direction
+MAIL_AVOID = 2      # obstacle avoidance on/off
+MAIL_BALANCE = 3    # self-balancing on/off
+MAIL_ACTION = 4     # action type, number
+MAIL_ARM = 5        # arm action, direction (None if not given)
+MAIL_IOT_ACTION = 6 # WiFi IoT action type, number
+# Only the latest of these matters: a new one replaces the queued one
+MAIL_LATEST = (MAIL_DRIVE, MAIL_AVOID, MAIL_BALANCE)
+MAIL_STEPS = (MAIL_DRIVE, MAIL_AVOID, MAIL_BALANCE, MAIL_ACTION, MAIL_IOT_ACTION)
+MAIL_ANY = MAIL_STEPS + (MAIL_ARM,)
+
+class Mailbox:
+  # Lock-protected [kind, a, b, sequence] entries. Arm and action commands
+  # queue in a ring buffer and are never replaced or dropped: when the ring
+  # is full put() refuses them and counts an overflow. Drive, avoidance
+  # and self-balancing each have a latest-value slot outside the ring, so
+  # a stop is never refused however many commands are waiting.
+  def __init__(self, size):
+    self.ring = [None] * size
+    self.head = 0
+    self.count = 0
+    self.latest = {}    # kind -> entry, for MAIL_LATEST kinds
+    self.sequence = 0
+    self.coalesced = 0
+    self.overflows = 0
+    self.lock = _thread.allocate_lock()
+
+  def put(self, kind, a=0, b=0):
+    self.lock.acquire()
+    try:
+      self.sequence += 1
+      if kind in MAIL_LATEST:
+        entry = self.latest.get(kind)
+        if entry is None:
+          self.latest[kind] = [kind, a, b, self.sequence]
+        else:
+          # Keeps its place in line, with the new value
+          entry[1] = a
+          entry[2] = b
+          self.coalesced += 1
+        return True
+      size = len(self.ring)
+      if self.count == size:
+        self.overflows += 1
+        return False
+      self.ring[(self.head + self.count) % size] = [kind, a, b, self.sequence]
+      self.count += 1
+      return True
+    finally:
+      self.lock.release()
+
+  def take(self, kinds):
+    # Remove and return the oldest entry of one of kinds, or None
+    self.lock.acquire()
+    try:
+      oldest = None
+      for kind in kinds:
+        entry = self.latest.get(kind)
+        if entry is not None and (oldest is None or entry[3] < oldest[3]):
+          oldest = entry
+      size = len(self.ring)
+      for i in range(self.count):
+        entry = self.ring[(self.head + i) % size]
+        if entry[0] in kinds:
+          if oldest is not None and oldest[3] < entry[3]:
+            break
+          # Close the gap by moving the older entries up one slot
+          while i > 0:
+            self.ring[(self.head + i) % size] = self.ring[(self.head + i - 1) % size]
+            i -= 1
+          self.ring[self.head] = None
+          self.head = (self.head + 1) % size
+          self.count -= 1
+          return entry
+      if oldest is not None:
+        del self.latest[oldest[0]]
+      return oldest
+    finally:
+      self.lock.release()
+
+  def wait(self, kinds, ms):
+    # take(), polling every 1 ms for up to ms until a matching entry
+    # arrives; MicroPython's lock.acquire() has no timeout, so it can't block
+    deadline = time.ticks_add(time.ticks_ms(), ms)
+    while True:
+      entry = self.take(kinds)
+      if entry is not None or time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+        return entry
+      time.sleep_ms(1)
+
+mail = Mailbox(MAIL_SIZE)
+
+def mail_put(kind, a=0, b=0):
+  if not mail.put(kind, a, b):
+    print("Mailbox full, command refused")
+
+def mail_off(kind):
+  # True if an 'off' for the running behaviour arrived; a repeated 'on' is ignored
+  entry = mail.take((kind,))
+  return entry is not None and entry[1] == 0
+
+# Bluetooth command handlers, looked up by (command, subcommand) in
+# BLE_HANDLERS. Each gets the frame's integer fields after its key;
+# (command, None) handlers take every field after the command.
+def ble_idle():
+  return _obstacle_avoidance_flag == 0 and _self_balancing_flag == 0
+
+def reset_pose():
   global _Pitch_angle
   global _Roll_angle
-  global mechdog
-  global _ACTION_TYPE
-  global _ACTION_NUM
-  global _RUN_DIR
-  global _REC_PARSE_VALUE
   global _High_mm
-  global _ARM_ACTION
-  
-  dir_flag = 1
+  mechdog.set_default_pose()
+  _Pitch_angle = 0
+  _Roll_angle = 0
+  _High_mm = 0
+  time.sleep(1)
+
+def ble_battery(args):
+  ble.send_data("CMD|6|{}|$".format(Hiwonder.Battery_power()))
+
+def ble_distance(args):
+  ble.send_data("CMD|4|{}|$".format(min(round(_SONER_DISTANCE * 10), 5000)))
+
+def ble_obstacle_avoidance(args):
+  if _self_balancing_flag == 0:
+    if args[0] == 1:
+      reset_pose()
+    mail_put(MAIL_AVOID, args[0])
+
+def ble_rgb(args):
+  i2csonar.setRGB(0, args[0], args[1], args[2])
+
+def ble_arm(args):
+  print("ARM COMMAND RECEIVED! Action:", args[0], "Full data:", _REC_PARSE_VALUE)
+  mail_put(MAIL_ARM, args[0], args[1] if len(args) > 1 else None)
+
+def ble_self_balancing(args):
+  if _obstacle_avoidance_flag == 0:
+    if args[0] == 1:
+      reset_pose()
+    mail_put(MAIL_BALANCE, args[0])
+
+def ble_roll(args):
+  global _Roll_angle
+  if ble_idle():
+    if args[0] == 1:
+      if _Roll_angle < 17:
+        _Roll_angle += 1
+        mechdog.transform([0, 0, 0], [-1, 0, 0], 80)
+    else:
+      if _Roll_angle > -17:
+        _Roll_angle -= 1
+        mechdog.transform([0, 0, 0], [1, 0, 0], 80)
+
+def ble_pitch(args):
+  global _Pitch_angle
+  if ble_idle():
+    if args[0] == 1:
+      if _Pitch_angle < 17:
+        _Pitch_angle += 1
+        mechdog.transform([0, 0, 0], [0, 1, 0], 80)
+    else:
+      if _Pitch_angle > -17:
+        _Pitch_angle -= 1
+        mechdog.transform([0, 0, 0], [0, -1, 0], 80)
+
+def ble_height(args):
+  global _High_mm
+  if ble_idle():
+    if args[0] == 1:
+      if _High_mm < 15:
+        _High_mm += 1
+        mechdog.transform([0, 0, 1], [0, 0, 0], 80)
+    else:
+      if _High_mm > -25:
+        _High_mm -= 1
+        mechdog.transform([0, 0, -1], [0, 0, 0], 80)
+
+def ble_default_pose(args):
+  if ble_idle():
+    reset_pose()
+
+def ble_action(args):
+  if ble_idle():
+    mail_put(MAIL_ACTION, args[0], args[1])
+
+def ble_drive(args):
+  global _DIR_FLAG
+  if ble_idle():
+    mail_put(MAIL_DRIVE, args[0])
+    if args[0] < 6:
+      if _DIR_FLAG != 1:
+        _DIR_FLAG = 1
+        mechdog.transform([10 , 0 , 0] , [0 , 0 , 0] , 100)
+    else:
+      if _DIR_FLAG != -1:
+        _DIR_FLAG = -1
+        mechdog.transform([-10 , 0 , 0] , [0 , 0 , 0] , 100)
+
+BLE_HANDLERS = {
+  (6, None): ble_battery,
+  (4, 1): ble_distance,
+  (4, 2): ble_obstacle_avoidance,
+  (4, 3): ble_rgb,
+  (7, None): ble_arm,
+  (1, 1): ble_roll,
+  (1, 2): ble_pitch,
+  (1, 3): ble_self_balancing,
+  (1, 4): ble_height,
+  (1, 5): ble_default_pose,
+  (2, None): ble_action,
+  (3, None): ble_drive,
+}
+BLE_STATS = {}  # handler -> [calls, total us, longest us]
+
+def ble_dispatch(data):
+  global _REC_PARSE_VALUE
+  _REC_PARSE_VALUE = ble.parse_uart_cmd(data)
+  try:
+    values = [int(v) for v in _REC_PARSE_VALUE]
+  except ValueError:
+    return
+  if not values:
+    return
+  print("BLE Received command:", values[0], "Data:", _REC_PARSE_VALUE)
+  handler = BLE_HANDLERS.get((values[0], values[1] if len(values) > 1 else None))
+  args = values[2:]
+  if handler is None:
+    handler = BLE_HANDLERS.get((values[0], None))
+    args = values[1:]
+    if handler is None:
+      return
+  start = time.ticks_us()
+  try:
+    handler(args)
+  except IndexError:
+    print("BLE command too short:", data)
+  elapsed = time.ticks_diff(time.ticks_us(), start)
+  stats = BLE_STATS.get(handler)
+  if stats is None:
+    stats = BLE_STATS[handler] = [0, 0, 0]
+  stats[0] += 1
+  stats[1] += elapsed
+  if elapsed > stats[2]:
+    stats[2] = elapsed
+
+def ble_stats():
+  # Handler execution times so far; call from the REPL
+  for handler, stats in BLE_STATS.items():
+    print("{:24} {:6} calls  avg {:8} us  max {:8} us".format(
+      handler.__name__, stats[0], stats[1] // stats[0], stats[2]))
+  print("mailbox: {} queued, {} coalesced, {} overflows".format(mail.count + len(mail.latest), mail.coalesced, mail.overflows))
+
+def start_main():
   while True:
     if ble.is_connected():
       if ble.contains_data("CMD"):
-        _BLE_REC_DATA = ble.read_uart_cmd()
-        if not _BLE_REC_DATA:
-          continue
-        _REC_PARSE_VALUE = ble.parse_uart_cmd(_BLE_REC_DATA)
-        _COMMAND = _REC_PARSE_VALUE[0]
-        _COMMAND = int(_COMMAND)
-        print("BLE Received command:", _COMMAND, "Data:", _REC_PARSE_VALUE)
-        if (_COMMAND==6):
-          _SEND_DATA = "CMD|6|{}|$".format(Hiwonder.Battery_power())
-          ble.send_data(_SEND_DATA)
-          continue
-        if (_COMMAND==4):
-          _DATA = int(_REC_PARSE_VALUE[1])
-          if (_DATA==1):
-            _distance = round((_SONER_DISTANCE*10))
-            if (_distance>5000):
-              _distance = 5000
-            _SEND_DATA = "CMD|4|{}|$".format(_distance)
-            ble.send_data(_SEND_DATA)
-          elif ((_DATA==2) and (_self_balancing_flag==0)):
-            if ((int(_REC_PARSE_VALUE[2]))==1):
-              mechdog.set_default_pose()
-              _Pitch_angle = 0
-              _Roll_angle = 0
-              _High_mm = 0
-              time.sleep(1)
-              _RUN_STEP = 41
-            else:
-              _RUN_STEP = 40
-          elif (_DATA==3):
-            i2csonar.setRGB(0,(int(_REC_PARSE_VALUE[2])),(int(_REC_PARSE_VALUE[3])),(int(_REC_PARSE_VALUE[4])))
-          continue
-        if (_COMMAND==7):
-          print("ARM COMMAND RECEIVED! Action:", _REC_PARSE_VALUE[1], "Full data:", _REC_PARSE_VALUE)
-          _ARM_ACTION = int(_REC_PARSE_VALUE[1])
-        if ((_COMMAND==1) and (_obstacle_avoidance_flag==0)):
-          _DATA = int(_REC_PARSE_VALUE[1])
-          if (_DATA==3):
-            _DATA = int(_REC_PARSE_VALUE[2])
-            if (_DATA==1):
-              mechdog.set_default_pose()
-              _Pitch_angle = 0
-              _Roll_angle = 0
-              _High_mm = 0
-              time.sleep(1)
-              _RUN_STEP = 131
-            else:
-              _RUN_STEP = 130
-          if ((_obstacle_avoidance_flag==0) and (_self_balancing_flag==0)):
-            if (_DATA==1):
-              _DATA = int(_REC_PARSE_VALUE[2])
-              if (_DATA==1):
-                if (_Roll_angle<17):
-                  _Roll_angle+=1
-                  mechdog.transform([0, 0, 0], [-1, 0, 0], 80)
-              else:
-                if (_Roll_angle>-17):
-                  _Roll_angle-=1
-                  mechdog.transform([0, 0, 0], [1, 0, 0], 80)
-            if (_DATA==2):
-              _DATA = int(_REC_PARSE_VALUE[2])
-              if (_DATA==1):
-                if (_Pitch_angle<17):
-                  _Pitch_angle+=1
-                  mechdog.transform([0, 0, 0], [0, 1, 0], 80)
-              else:
-                if (_Pitch_angle>-17):
-                  _Pitch_angle-=1
-                  mechdog.transform([0, 0, 0], [0, -1, 0], 80)
-            if (_DATA==4):
-              _DATA = int(_REC_PARSE_VALUE[2])
-              if (_DATA==1):
-                if (_High_mm < 15):
-                  _High_mm += 1
-                  mechdog.transform([0, 0, 1], [0, 0, 0], 80)
-              else:
-                if _High_mm > -25:
-                  _High_mm -= 1
-                  mechdog.transform([0, 0, -1], [0, 0, 0], 80)
-            if (_DATA==5):
-              mechdog.set_default_pose()
-              _Pitch_angle = 0
-              _Roll_angle = 0
-              _High_mm = 0
-              time.sleep(1)
-            continue
-        if (_COMMAND==2) and (_obstacle_avoidance_flag==0) and (_self_balancing_flag==0):
-          _RUN_STEP = 2
-          _ACTION_TYPE = int(_REC_PARSE_VALUE[1])
-          _ACTION_NUM = int(_REC_PARSE_VALUE[2])
-        if (_COMMAND==3) and (_obstacle_avoidance_flag==0) and (_self_balancing_flag==0):
-          _RUN_STEP = 3
-          _RUN_DIR = int(_REC_PARSE_VALUE[1])
-          if _RUN_DIR < 6:
-            if dir_flag != 1:
-              dir_flag = 1
-              mechdog.transform([10 , 0 , 0] , [0 , 0 , 0] , 100)
-          else:
-            if dir_flag != -1:
-              dir_flag = -1
-              mechdog.transform([-10 , 0 , 0] , [0 , 0 , 0] , 100)
-      else:
-        time.sleep(0.03)
-
+        data = ble.read_uart_cmd()
+        if data:
+          ble_dispatch(data)
+    else:
+      time.sleep(0.03)
+
+
+# WiFi IoT action control, run by start_main1
+def iot_action(action_type, action_num):
+  if action_type == 1:
+    dong_zuo_zu_yun_xing(action_num)
+  elif action_type == 2:
+    if action_num == 100:
+      mechdog.move(90,0)
+      time.sleep(2)
+      mechdog.move(0,0)
+    else:
+      mechdog.action_run(str(action_num))
 
 # Motion and sensor processing thread
 def start_main1():
   global ble
   global _SONER_DISTANCE
   global _self_balancing_flag
-  global _RUN_STEP
   global _obstacle_avoidance_flag
   global mechdog
   global _ACTION_TYPE
@@ -423,17 +598,15 @@ def start_main1():
   global _Roll_angle
   global _High_mm
   global _ARM_ACTION
+  global _ARM_DIR
   global arm_step
   global arm_tick
   global sonar_tick
   global servo9_pos
   global servo10_pos
   global servo11_pos
-  global _REC_PARSE_VALUE
   global sensor_distance
   global warn_undef_obj
-  global action_type
-  global action_num
   global warn_hit
   global onoff_hit
   global sensor_flag
@@ -481,19 +654,6 @@ def start_main1():
       
       if sensor_flag == True:
         sensor_distance = int(distance)
-      
-      # WiFi IoT action control
-      if action_type == 1:
-        dong_zuo_zu_yun_xing(action_num)
-        action_type = 0
-      elif action_type == 2:
-        if action_num == 100:
-          mechdog.move(90,0)
-          time.sleep(2)
-          mechdog.move(0,0)
-        else:
-          mechdog.action_run(str(action_num))
-        action_type = 0
     
     if time.ticks_ms() > last_time_1000ms:
       last_time_1000ms += 1000
@@ -508,22 +668,20 @@ def start_main1():
     if time.ticks_ms() > arm_tick:
       if arm_step == 0:
         if _ARM_ACTION == 3:
-          if len(_REC_PARSE_VALUE) > 2:
-            direction = int(_REC_PARSE_VALUE[2])
-            if direction == 1:
+          if _ARM_DIR is not None:
+            if _ARM_DIR == 1:
               servo9_pos = min(servo9_pos + 100, 2500)
-            elif direction == -1:
+            elif _ARM_DIR == -1:
               servo9_pos = max(servo9_pos - 100, 500)
             mechdog.set_servo(9, servo9_pos, 200)
             print("Servo 9 position:", servo9_pos)
           arm_tick = time.ticks_ms() + 100
           _ARM_ACTION = 0
         elif _ARM_ACTION == 4:
-          if len(_REC_PARSE_VALUE) > 2:
-            direction = int(_REC_PARSE_VALUE[2])
-            if direction == 1:
+          if _ARM_DIR is not None:
+            if _ARM_DIR == 1:
               servo10_pos = min(servo10_pos + 100, 2500)
-            elif direction == -1:
+            elif _ARM_DIR == -1:
               servo10_pos = max(servo10_pos - 100, 500)
             mechdog.set_servo(10, servo10_pos, 200)
             print("Servo 10 position:", servo10_pos)
@@ -541,17 +699,38 @@ def start_main1():
           print("Gripper closed - Servo 11 position:", servo11_pos)
           arm_tick = time.ticks_ms() + 600
           _ARM_ACTION = 0
+        else:
+          _ARM_ACTION = 0
           
     if (step==0):
-      step = _RUN_STEP
-      _RUN_STEP = 0
-      time.sleep(0.05)
+      # Poll for the next command (1 ms granularity); arm commands wait until the arm is free
+      entry = mail.wait(MAIL_ANY if arm_step == 0 and _ARM_ACTION == 0 else MAIL_STEPS, 50)
+      if entry is None:
+        pass
+      elif entry[0] == MAIL_ARM:
+        _ARM_ACTION = entry[1]
+        _ARM_DIR = entry[2]
+      elif entry[0] == MAIL_DRIVE:
+        _RUN_DIR = entry[1]
+        step = 3
+      elif entry[0] == MAIL_ACTION:
+        _ACTION_TYPE = entry[1]
+        _ACTION_NUM = entry[2]
+        step = 2
+      elif entry[0] == MAIL_AVOID:
+        if entry[1] == 1:
+          step = 41
+      elif entry[0] == MAIL_BALANCE:
+        if entry[1] == 1:
+          step = 131
+      elif entry[0] == MAIL_IOT_ACTION:
+        iot_action(entry[1], entry[2])
     else:
       if (step==41):
         _obstacle_avoidance_flag = 1
         forward_flag = 1
         while True:
-          if ((_RUN_STEP==40) or (_obstacle_avoidance_flag==0)):
+          if (_obstacle_avoidance_flag==0) or mail_off(MAIL_AVOID):
             _obstacle_avoidance_flag = 0
             mechdog.move(0,0)
             i2csonar.setRGB(0,0x33,0x33,0xff)
@@ -567,7 +746,8 @@ def start_main1():
               mechdog.transform([-10 , 0 , 0] , [0 , 0 , 0] , 100)
             mechdog.move(-40,0)
             for count in range(30):
-              if (_RUN_STEP==40):
+              if mail_off(MAIL_AVOID):
+                _obstacle_avoidance_flag = 0
                 break
               time.sleep(0.1)
           else:
@@ -578,7 +758,8 @@ def start_main1():
               i2csonar.setRGB(0,0xff,0xcc,0x00)
               mechdog.move(80,-50)
               for count in range(50):
-                if (_RUN_STEP==40):
+                if mail_off(MAIL_AVOID):
+                  _obstacle_avoidance_flag = 0
                   break
                 time.sleep(0.1)
             else:
@@ -590,7 +771,7 @@ def start_main1():
         mechdog.homeostasis(True)
         time.sleep(2)
         while True:
-          if (_RUN_STEP==130):
+          if mail_off(MAIL_BALANCE):
             _self_balancing_flag = 0
             mechdog.homeostasis(False)
             time.sleep(2)
@@ -616,6 +797,9 @@ def start_main1():
           mechdog.action_run(str(_ACTION_NUM))
       if (step==3):
         while True:
+          entry = mail.take((MAIL_DRIVE,))
+          if entry is not None:
+            _RUN_DIR = entry[1]
           if (_RUN_DIR==0):
             mechdog.move(0,0)
             break
@@ -5,6 +5,10 @@ import Hiwonder_IIC
 from HW_MechDog import MechDog
 from Hiwonder_BLE import BLE
 import struct
+try:
+  import binframe
+except ImportError:
+  binframe = None
 
 
 mechdog = MechDog()
@@ -48,6 +52,8 @@ buzzer_on = False
 action_type = 0
 action_num = 0
 
+binary_mode = False
+
 
 try:
   for i in range(5):
@@ -78,21 +84,97 @@ def wifi_read():
   except:
     return None
 
-#wifi receive and send
-def wifi_main():
-  global warn_face
-  global warn_undef_obj
-  global warn_hit
+def wifi_send_frame(cmd_type , *values):
+  if binary_mode:
+    wifi_send(binframe.encode(cmd_type , values , binframe.REPLIES))
+  else:
+    wifi_send("CMD|{}|{}|$".format(cmd_type , "|".join([str(v) for v in values])))
+
+# (type, [int params]) of a received command, or None
+def wifi_parse(receive_data):
+  if binary_mode:
+    start , end = binframe.next_frame(receive_data)
+    if end > 0:
+      return binframe.decode(receive_data[start:end] , binframe.COMMANDS)
+  receive_data = bytes([x for x in receive_data if x != 0xd3])
+  rec = receive_data.decode('utf-8')
+  start = rec.find("CMD|")
+  if start == -1:
+    return None
+  end = rec.find("$" , start)
+  if end == -1:
+    end = len(rec)
+  cmd = rec[start + 4:end].split('|')
+  return int(cmd[0]) , [int(x) for x in cmd[1:] if x]
+
+def wifi_handle(cmd_type , args):
   global color_detec_flag
-  global color_detec_num
   global sensor_flag
-  global sensor_distance
   global buzzer_flag
   global action_type
   global action_num
   global onoff_face
   global onoff_undef_obj
   global onoff_hit
+  global warn_hit
+  global binary_mode
+
+  if cmd_type == 1: # warn
+    if args[0] == 1:
+      onoff_face = True
+      color_detec_flag = False
+    else:
+      onoff_face = False
+    if args[1] == 1:
+      onoff_undef_obj = True
+    else:
+      onoff_undef_obj = False
+      
+    if args[2] == 1:
+      onoff_hit = True
+      warn_hit = False
+    else:
+      onoff_hit = False
+      
+  elif cmd_type == 0x02: # color detect
+    if args[0] == 0x01:
+      color_detec_flag = True
+      onoff_face = False
+    else:
+      color_detec_flag = False
+      
+  elif cmd_type == 0x03: # sensor distance
+    if args[0] == 0x01:
+      sensor_flag = True
+    else:
+      sensor_flag = False
+      
+  elif cmd_type == 0x04: # rgb
+    i2csonar.setRGB(0 , args[0] , args[1] , args[2])
+    
+  elif cmd_type == 0x05: # buzzer
+    if args[0] == 0x01:
+      buzzer_flag = True
+    else:
+      buzzer_flag = False
+  elif cmd_type == 0x06:
+    action_type = args[0]
+    action_num = args[1]
+    
+  elif cmd_type == 0x07: # esp32s3 type
+    wifi_send_frame(7 , esp32s3_type)
+
+  elif cmd_type == 0x08 and binframe: # protocol select, acked in the old protocol
+    wifi_send_frame(8 , args[0])
+    binary_mode = args[0] == 1
+
+#wifi receive and send
+def wifi_main():
+  global warn_face
+  global warn_undef_obj
+  global warn_hit
+  global color_detec_num
+  global sensor_distance
   global esp32s3_type
   
   last_time_1000ms = 0
@@ -108,66 +190,20 @@ def wifi_main():
         last_time_50ms += 100
         receive_data = wifi_read()
         if receive_data != None:
-          receive_data = bytes([x for x in receive_data if x != 0xd3])
           if last_receive != receive_data:
             last_receive = receive_data
-            rec = receive_data.decode('utf-8')
-            if rec.find("CMD") != -1 and rec.find("$"):
-              cmd = rec.split('|')[1:]
-          
-              if int(cmd[0]) == 1: # warn
-                if int(cmd[1]) == 1:
-                  onoff_face = True
-                  color_detec_flag = False
-                else:
-                  onoff_face = False
-                if int(cmd[2]) == 1:
-                  onoff_undef_obj = True
-                else:
-                  onoff_undef_obj = False
-                  
-                if int(cmd[3]) == 1:
-                  onoff_hit = True
-                  warn_hit = False
-                else:
-                  onoff_hit = False
-                  
-              elif int(cmd[0]) == 0x02: # color detect
-                if int(cmd[1]) == 0x01:
-                  color_detec_flag = True
-                  onoff_face = False
-                else:
-                  color_detec_flag = False
-                  
-              elif int(cmd[0]) == 0x03: # sensor distance
-                if int(cmd[1]) == 0x01:
-                  sensor_flag = True
-                else:
-                  sensor_flag = False
-                  
-              elif int(cmd[0]) == 0x04: # rgb
-                i2csonar.setRGB(0 , int(cmd[1]) , int(cmd[2]) , int(cmd[3]))
-                
-              elif int(cmd[0]) == 0x05: # buzzer
-                if int(cmd[1]) == 0x01:
-                  buzzer_flag = True
-                else:
-                  buzzer_flag = False
-              elif int(cmd[0]) == 0x06:
-                action_type = int(cmd[1])
-                action_num = int(cmd[2])
-                
-              elif int(cmd[0]) == 0x07: # esp32s3 type
-                wifi_send("CMD|7|{}|$".format(esp32s3_type))
+            cmd = wifi_parse(receive_data)
+            if cmd:
+              wifi_handle(cmd[0] , cmd[1])
 
       if time.ticks_ms() > last_time_100ms:
         last_time_100ms += 100
         if color_detec_flag == True:
-          wifi_send("CMD|2|{}|$".format(color_detec_num))
+          wifi_send_frame(2 , color_detec_num)
           print("co:{}".format(color_detec_num))
 
         if sensor_flag == True:
-          wifi_send("CMD|3|{}|$".format(sensor_distance))
+          wifi_send_frame(3 , sensor_distance)
 
       if time.ticks_ms() > last_time_1000ms:
         last_time_1000ms += 1000
@@ -180,8 +216,7 @@ def wifi_main():
           flags[1] = 1
         if warn_hit == True:
           flags[2] = 1
-        buf = "CMD|1|{}|{}|{}|$".format(flags[0],flags[1],flags[2])
-        wifi_send(buf)
+        wifi_send_frame(1 , flags[0] , flags[1] , flags[2])
     except:
       print("wifi fail.")
       sleep_ms(100)
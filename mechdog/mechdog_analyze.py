@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Offline analysis of recorded MechDog telemetry (see telemetry_recorder.py)
+All statistics are computed with vectorized NumPy operations over the
+memory-mapped columns, so a day of fleet data takes seconds.
+
+Usage:
+  python3 mechdog_analyze.py telemetry/ttyUSB0 [more recordings or roots...]
+  python3 mechdog_analyze.py telemetry --json
+  python3 mechdog_analyze.py telemetry/ttyUSB0 --downsample 2000 --output dist.npz
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from telemetry_recorder import RX, TX, load
+
+TYPE_WARNING = 1
+TYPE_DISTANCE = 3
+# start_main1 substitutes 500 after five out-of-range sonar reads
+DISTANCE_SENTINEL = 500
+# Command types the MechDog answers with a reply of the same type
+REPLY_TYPES = (7, 8)
+WARNING_NAMES = ('face', 'object', 'impact')
+
+
+def _select(columns, direction, cmd_type):
+    mask = (columns['dir'] == direction) & (columns['type'] == cmd_type)
+    return np.flatnonzero(mask)
+
+
+def _run_lengths(flags):
+    """Lengths of the runs of True in a boolean array"""
+    if not flags.size:
+        return np.zeros(0, dtype=np.int64)
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[1::2] - edges[::2]
+
+
+def sonar_stats(columns):
+    """Noise statistics and dropout rate of the distance stream"""
+    rows = _select(columns, RX, TYPE_DISTANCE)
+    values = np.asarray(columns['v0'][rows], dtype=np.float64)
+    if not values.size:
+        return None
+    dropout = values >= DISTANCE_SENTINEL
+    valid = values[~dropout]
+    stats = {
+        'samples': int(values.size),
+        'dropout_rate': float(dropout.mean()),
+        'longest_dropout': int(_run_lengths(dropout).max(initial=0)),
+    }
+    if valid.size:
+        median = np.median(valid)
+        # Sample-to-sample jitter: std of first differences / sqrt(2) removes
+        # slow motion of the target from the noise estimate
+        jitter = np.diff(valid).std() / np.sqrt(2) if valid.size > 1 else 0.0
+        stats.update({
+            'mean_cm': float(valid.mean()),
+            'median_cm': float(median),
+            'std_cm': float(valid.std()),
+            'mad_cm': float(np.median(np.abs(valid - median))),
+            'jitter_cm': float(jitter),
+            'min_cm': float(valid.min()),
+            'max_cm': float(valid.max()),
+        })
+    return stats
+
+
+def warning_duty_cycles(columns):
+    """Time-weighted fraction each warning flag was raised"""
+    rows = _select(columns, RX, TYPE_WARNING)
+    if rows.size < 2:
+        return None
+    t = columns['t_ns'][rows]
+    # Each report holds until the next one
+    dt = np.diff(t).astype(np.float64)
+    total = dt.sum()
+    duty = {}
+    for name, column in zip(WARNING_NAMES, ('v0', 'v1', 'v2')):
+        flags = columns[column][rows[:-1]] == 1
+        duty[name] = float(dt[flags].sum() / total) if total else 0.0
+    return duty
+
+
+def round_trips(columns):
+    """
+    Round-trip percentiles (ms) per reply type: each command is paired with
+    the first reply of the same type that arrives before the next command
+    """
+    result = {}
+    t = columns['t_ns']
+    for cmd_type in REPLY_TYPES:
+        tx = t[_select(columns, TX, cmd_type)]
+        rx = t[_select(columns, RX, cmd_type)]
+        if not tx.size:
+            continue
+        answered = np.zeros(tx.size, dtype=bool)
+        reply_t = tx
+        if rx.size:
+            first_reply = np.searchsorted(rx, tx, side='left')
+            reply_t = rx[np.minimum(first_reply, rx.size - 1)]
+            next_tx = np.append(tx[1:], np.iinfo(np.int64).max)
+            answered = (first_reply < rx.size) & (reply_t >= tx) & (reply_t < next_tx)
+        rtt_ms = (reply_t[answered] - tx[answered]) / 1e6
+        entry = {'sent': int(tx.size), 'answered': int(answered.sum())}
+        if rtt_ms.size:
+            p50, p95, p99 = np.percentile(rtt_ms, (50, 95, 99))
+            entry.update({'p50_ms': float(p50), 'p95_ms': float(p95),
+                          'p99_ms': float(p99), 'max_ms': float(rtt_ms.max())})
+        result[cmd_type] = entry
+    return result
+
+
+def downsample(t, values, buckets):
+    """
+    Min/max decimation for plotting: split the series into equal-count
+    buckets and keep each bucket's first timestamp, minimum and maximum
+    """
+    if values.size <= buckets:
+        return t, values, values
+    starts = np.linspace(0, values.size, buckets, endpoint=False).astype(np.int64)
+    return t[starts], np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts)
+
+
+def analyze(path):
+    columns = load(path)
+    t = columns['t_ns']
+    return {
+        'recording': path,
+        'rows': int(t.size),
+        'duration_s': float((t[-1] - t[0]) / 1e9) if t.size else 0.0,
+        'sonar': sonar_stats(columns),
+        'warnings': warning_duty_cycles(columns),
+        'round_trip': round_trips(columns),
+    }
+
+
+def find_recordings(paths):
+    """Expand roots (directories of recordings) into recording directories"""
+    recordings = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            recordings.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            if os.path.exists(os.path.join(path, name, 'meta.json')):
+                recordings.append(os.path.join(path, name))
+    return recordings
+
+
+def print_report(report):
+    print(f"== {report['recording']}: {report['rows']} rows, {report['duration_s']:.1f} s")
+    sonar = report['sonar']
+    if sonar:
+        print(f"  sonar: {sonar['samples']} samples, dropout {sonar['dropout_rate'] * 100:.2f}% "
+              f"(longest run {sonar['longest_dropout']})")
+        if 'median_cm' in sonar:
+            print(f"         median {sonar['median_cm']:.1f} cm, std {sonar['std_cm']:.2f}, "
+                  f"MAD {sonar['mad_cm']:.2f}, jitter {sonar['jitter_cm']:.2f}, "
+                  f"range {sonar['min_cm']:.0f}-{sonar['max_cm']:.0f} cm")
+    warnings = report['warnings']
+    if warnings:
+        print("  warnings duty: " + ", ".join(f"{name} {value * 100:.1f}%" for name, value in warnings.items()))
+    for cmd_type, entry in report['round_trip'].items():
+        line = f"  CMD|{cmd_type} round trip: {entry['answered']}/{entry['sent']} answered"
+        if 'p50_ms' in entry:
+            line += (f", p50 {entry['p50_ms']:.2f} ms, p95 {entry['p95_ms']:.2f} ms, "
+                     f"p99 {entry['p99_ms']:.2f} ms, max {entry['max_ms']:.2f} ms")
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze recorded MechDog telemetry")
+    parser.add_argument('paths', nargs='+', help="recording directories or roots containing them")
+    parser.add_argument('--json', action='store_true', help="print machine-readable JSON")
+    parser.add_argument('--downsample', type=int, metavar='N',
+                        help="min/max-decimate the distance series to N points (single recording)")
+    parser.add_argument('--output', default='distance_downsampled.npz',
+                        help="output file for --downsample (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    recordings = find_recordings(args.paths)
+    if not recordings:
+        print("No recordings found")
+        return 1
+
+    if args.downsample:
+        columns = load(recordings[0])
+        rows = _select(columns, RX, TYPE_DISTANCE)
+        t, low, high = downsample(columns['t_ns'][rows], columns['v0'][rows], args.downsample)
+        np.savez(args.output, t_ns=t, min=low, max=high)
+        print(f"Wrote {t.size} points from {rows.size} samples to {args.output}")
+        return 0
+
+    reports = [analyze(path) for path in recordings]
+    if args.json:
+        json.dump(reports, sys.stdout, indent=2)
+        print()
+    else:
+        for report in reports:
+            print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
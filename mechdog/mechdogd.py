@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+MechDog device daemon
+Owns the serial ports (one MechDogFleet event loop) and lets any number of
+clients share each dog over a local Unix socket. A device is ready as soon
+as its first valid frame arrives (it is sent CMD|7 queries until then), so
+clients attach in milliseconds instead of opening the port and sleeping.
+
+Socket protocol (one line each way, then the plain serial protocol):
+  client: ATTACH [device_id]   daemon: OK <device_id> <port> | ERR <reason>
+  client: LIST                 daemon: one JSON line describing the devices
+After OK, every line the client sends is written to the dog (commands of
+all clients are interleaved line by line) and every frame the dog sends is
+copied to all clients attached to it.
+
+Usage:
+  python3 mechdogd.py [ports...]          # default: every USB serial port
+  python3 mechdogd.py --attach [device]   # interactive_mode through the daemon
+  python3 mechdogd.py --list
+"""
+
+import json
+import os
+import select
+import selectors
+import socket
+import time
+
+import serial
+
+from IoT import MechDogIoT
+from fleet import MechDogFleet
+
+SOCKET_PATH = os.environ.get('MECHDOGD_SOCKET',
+                             os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'), 'mechdogd.sock'))
+
+
+class _Client:
+    """One connected client"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.incoming = bytearray()
+        self.outgoing = bytearray()
+        self.writing = False
+        self.device_id = None
+        self.attached = False
+        self.commands = 0
+        self.frames_dropped = 0
+
+
+class MechDogDaemon:
+    def __init__(self, ports=(), socket_path=SOCKET_PATH, baudrate=115200,
+                 probe_interval=0.5, max_client_buffer=1 << 20):
+        """
+        max_client_buffer: frames for a client that stops reading are
+        dropped (and counted) beyond this many pending bytes
+        """
+        # Check for a running daemon before any port is opened
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+                raise RuntimeError(f"mechdogd is already running on {socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(socket_path)  # left over from a daemon that died
+            finally:
+                probe.close()
+        self.fleet = MechDogFleet(baudrate=baudrate)
+        self.fleet.on_frame = self._on_frame
+        self.fleet.on_device_lost = self._on_device_lost
+        self.socket_path = socket_path
+        self.probe_interval = probe_interval
+        self.max_client_buffer = max_client_buffer
+        self.started = time.monotonic()
+        self.ready = {}        # device_id -> time of the first frame
+        self.subscribers = {}  # device_id -> set of attached clients
+        self.clients = set()
+        self._next_probe = {}
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(socket_path)
+        self.listener.listen(16)
+        self.listener.setblocking(False)
+        self.fleet.selector.register(self.listener, selectors.EVENT_READ, self._accept)
+        try:
+            for port in ports:
+                self.add_device(port)
+        except Exception:
+            self.close()
+            raise
+
+    def add_device(self, port, device_id=None):
+        device_id = self.fleet.add_device(port, device_id)
+        self.subscribers[device_id] = set()
+        self._next_probe[device_id] = 0.0
+        return device_id
+
+    def _probe(self, now):
+        """Ask devices that have not sent a frame yet for their type"""
+        # A failed write drops the device (and its entry) from inside the loop
+        for device_id, due in list(self._next_probe.items()):
+            if device_id not in self.ready and now >= due:
+                self.fleet.send_iot_command(7, device_ids=[device_id])
+                if device_id in self.fleet.devices:
+                    self._next_probe[device_id] = now + self.probe_interval
+
+    def _on_frame(self, device_id, record, now):
+        if device_id not in self.ready:
+            self.ready[device_id] = now
+            print(f"{device_id} ready after {(now - self.started) * 1000:.0f} ms")
+            for client in list(self.subscribers[device_id]):
+                self._attach_ok(client)
+        data = (record.encode() + '\n').encode('utf-8')
+        for client in list(self.subscribers[device_id]):
+            if client.attached:
+                self._queue(client, data)
+
+    def _on_device_lost(self, device_id, reason):
+        """An unplugged dog: disconnect its clients, the other dogs are unaffected"""
+        print(f"{device_id} lost: {reason}")
+        self.ready.pop(device_id, None)
+        self._next_probe.pop(device_id, None)
+        for client in list(self.subscribers.pop(device_id, ())):
+            self._drop_client(client)
+
+    def _accept(self, mask):
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = _Client(sock)
+        self.clients.add(client)
+        self.fleet.selector.register(sock, selectors.EVENT_READ, lambda mask: self._client_event(client, mask))
+
+    def _client_event(self, client, mask):
+        if mask & selectors.EVENT_READ:
+            try:
+                data = client.sock.recv(65536)
+            except BlockingIOError:
+                data = None
+            except OSError:
+                data = b''
+            if data == b'':
+                self._drop_client(client)
+                return
+            if data:
+                client.incoming += data
+                while client in self.clients:
+                    end = client.incoming.find(b'\n')
+                    if end < 0:
+                        break
+                    line = bytes(client.incoming[:end]).rstrip(b'\r')
+                    del client.incoming[:end + 1]
+                    self._client_line(client, line)
+                if len(client.incoming) > self.max_client_buffer:
+                    self._drop_client(client)
+                    return
+        if mask & selectors.EVENT_WRITE:
+            self._flush_client(client)
+
+    def _client_line(self, client, line):
+        if client.device_id is None:
+            command, _, arg = line.decode('utf-8', errors='replace').partition(' ')
+            if command == 'LIST':
+                self._queue(client, (json.dumps(self.status()) + '\n').encode('utf-8'))
+            elif command == 'ATTACH':
+                device_id = arg.strip() or next(iter(sorted(self.fleet.devices)), None)
+                if device_id not in self.fleet.devices:
+                    self._queue(client, f"ERR unknown device {device_id}\n".encode('utf-8'))
+                    return
+                client.device_id = device_id
+                self.subscribers[device_id].add(client)
+                if device_id in self.ready:
+                    self._attach_ok(client)
+            else:
+                self._queue(client, b"ERR expected ATTACH or LIST\n")
+            return
+        if not client.attached or not line:
+            return
+        if line.startswith(b'CMD|8|'):
+            # A protocol switch would change the framing under every other
+            # client; without an ack the client stays on the text protocol
+            return
+        client.commands += 1
+        self.fleet.send_command(line.decode('utf-8', errors='replace'), [client.device_id])
+
+    def _attach_ok(self, client):
+        client.attached = True
+        port = self.fleet.devices[client.device_id].port
+        self._queue(client, f"OK {client.device_id} {port}\n".encode('utf-8'))
+
+    def _queue(self, client, data):
+        if len(client.outgoing) > self.max_client_buffer:
+            client.frames_dropped += 1
+            return
+        idle = not client.outgoing
+        client.outgoing += data
+        if idle:
+            self._flush_client(client)
+
+    def _flush_client(self, client):
+        try:
+            written = client.sock.send(client.outgoing)
+        except BlockingIOError:
+            written = 0
+        except OSError:
+            self._drop_client(client)
+            return
+        del client.outgoing[:written]
+        writing = bool(client.outgoing)
+        if writing != client.writing:
+            client.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self.fleet.selector.modify(client.sock, events, lambda mask: self._client_event(client, mask))
+
+    def _drop_client(self, client):
+        if client not in self.clients:
+            return
+        self.clients.discard(client)
+        if client.device_id in self.subscribers:
+            self.subscribers[client.device_id].discard(client)
+        self.fleet.selector.unregister(client.sock)
+        client.sock.close()
+
+    def status(self):
+        """Devices, readiness and client counts"""
+        return {
+            device_id: {
+                'port': device.port,
+                'ready': device_id in self.ready,
+                'clients': len(self.subscribers[device_id]),
+                'frames_received': device.frames_received,
+                'bytes_in': device.bytes_in,
+                'bytes_out': device.bytes_out,
+            }
+            for device_id, device in self.fleet.devices.items()
+        }
+
+    def run(self, duration=None):
+        """Serve until duration seconds have passed (None = forever)"""
+        end = None if duration is None else time.monotonic() + duration
+        while end is None or time.monotonic() < end:
+            now = time.monotonic()
+            self._probe(now)
+            timeout = 0.1 if end is None else max(0.0, min(0.1, end - now))
+            self.fleet.poll(timeout)
+
+    def close(self):
+        for client in list(self.clients):
+            self._drop_client(client)
+        self.fleet.selector.unregister(self.listener)
+        self.listener.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.fleet.close()
+
+
+class SocketSerial:
+    """The parts of serial.Serial that MechDogIoT uses, over a mechdogd socket"""
+
+    def __init__(self, sock, port, timeout=1):
+        self.sock = sock
+        self.port = port
+        self.timeout = timeout
+        self.buffer = bytearray()
+        self.is_open = True
+        self._wake_r, self._wake_w = socket.socketpair()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def _recv(self, timeout):
+        """Move what arrives within timeout into the buffer, False if cancelled"""
+        readable, _, _ = select.select([self.sock, self._wake_r], [], [], timeout)
+        if self._wake_r in readable:
+            self._wake_r.recv(64)
+            return False
+        if readable:
+            data = self.sock.recv(65536)
+            if not data:
+                raise serial.SerialException("mechdogd closed the connection")
+            self.buffer += data
+        return True
+
+    @property
+    def in_waiting(self):
+        if select.select([self.sock], [], [], 0)[0]:
+            self.buffer += self.sock.recv(65536)
+        return len(self.buffer)
+
+    def read_until(self, expected=b'\n', size=None):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            end = self.buffer.find(expected)
+            if end >= 0:
+                size = end + len(expected)
+                break
+            if size is not None and len(self.buffer) >= size:
+                break
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if (remaining is not None and remaining <= 0) or not self._recv(remaining):
+                return b''
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(self.buffer) < size:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if (remaining is not None and remaining <= 0) or not self._recv(remaining):
+                break
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self.sock.sendall(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.in_waiting
+        self.buffer.clear()
+
+    def cancel_read(self):
+        self._wake_w.send(b'x')
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.sock.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+
+class MechDogClient(MechDogIoT):
+    def __init__(self, device=None, socket_path=SOCKET_PATH, verbose=True, timeout=5.0):
+        """
+        MechDogIoT on a dog owned by mechdogd (device=None: the first one)
+        Waits up to timeout for the daemon to report the device ready.
+        """
+        self.socket_path = socket_path
+        self.attach_timeout = timeout
+        self.device_id = None
+        super().__init__(port=device, verbose=verbose)
+
+    def _open(self, device, baudrate):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise serial.SerialException(f"Cannot reach mechdogd at {self.socket_path}: {e}")
+        ser = SocketSerial(sock, f"mechdogd:{device or ''}", timeout=self.attach_timeout)
+        ser.write(f"ATTACH {device or ''}\n".encode('utf-8'))
+        reply = ser.read_until(b'\n').decode('utf-8', errors='replace').split()
+        if not reply or reply[0] != 'OK':
+            ser.close()
+            reason = ' '.join(reply[1:]) if reply else "device not ready"
+            raise serial.SerialException(f"mechdogd: {reason}")
+        self.device_id = reply[1]
+        ser.port = f"mechdogd:{reply[1]} ({reply[2]})"
+        ser.timeout = 1
+        return ser
+
+
+def list_devices(socket_path=SOCKET_PATH, timeout=1.0):
+    """Ask a running daemon for its status()"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(b"LIST\n")
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import discovery
+
+    parser = argparse.ArgumentParser(description="Share MechDogs between processes over a Unix socket")
+    parser.add_argument('ports', nargs='*', help="serial ports (default: every USB serial port)")
+    parser.add_argument('--socket', default=SOCKET_PATH, help="socket path (default: %(default)s)")
+    parser.add_argument('--attach', nargs='?', const='', metavar='DEVICE',
+                        help="run interactive mode on a device of the running daemon")
+    parser.add_argument('--list', action='store_true', help="show the devices of the running daemon")
+    args = parser.parse_args()
+
+    if args.list:
+        for device_id, info in list_devices(args.socket).items():
+            print(f"  {device_id:<12} {info['port']:<20} {'ready' if info['ready'] else 'waiting':<8} "
+                  f"{info['clients']} client(s), {info['frames_received']} frames")
+    elif args.attach is not None:
+        MechDogClient(args.attach or None, args.socket).interactive_mode()
+    else:
+        ports = args.ports or list(discovery.candidate_ports())
+        if not ports:
+            print("No serial ports found")
+            raise SystemExit(1)
+        daemon = MechDogDaemon(ports, args.socket)
+        print(f"mechdogd serving {', '.join(daemon.fleet.devices)} on {args.socket} (Ctrl+C to stop)")
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            print("\nStopping mechdogd...")
+        finally:
+            daemon.close()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Host-side serial and protocol metrics in Prometheus text format
+MechDogIoT.enable_metrics() hooks a DeviceMetrics into the send and read
+paths. Every counter and histogram bucket is allocated up front, so the
+instrumentation is a few attribute increments per event and can stay on.
+
+Usage:
+  python3 metrics.py /dev/ttyUSB0 [--listen 9108]
+  curl http://127.0.0.1:9108/metrics
+"""
+
+import bisect
+import http.server
+import threading
+import time
+
+# Round-trip buckets in seconds
+RTT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Command types with a reply of the same type (query, protocol select)
+REPLY_TYPES = (7, 8)
+MAX_TYPE = 16
+
+
+class Histogram:
+    """Fixed-bucket histogram, one preallocated count per bucket"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=RTT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class DeviceMetrics:
+    """Counters of one serial connection"""
+
+    __slots__ = ('device', 'bytes_in', 'bytes_out', 'frames', 'parse_errors', 'frames_dropped',
+                 'reconnects', 'commands', 'round_trip', 'pending', 'last_frame',
+                 'queue_depth', 'queue_dropped', 'queue_coalesced')
+
+    def __init__(self, device):
+        self.device = device
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.frames = 0
+        self.parse_errors = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.commands = [0] * MAX_TYPE
+        self.round_trip = {cmd_type: Histogram() for cmd_type in REPLY_TYPES}
+        # Send time of the outstanding query per reply type, 0.0 = none
+        self.pending = {cmd_type: 0.0 for cmd_type in REPLY_TYPES}
+        self.last_frame = 0.0
+        # Send queue (flow_control.SendQueue), when flow control is on
+        self.queue_depth = 0
+        self.queue_dropped = 0
+        self.queue_coalesced = 0
+
+    def command_sent(self, cmd_type):
+        if 0 <= cmd_type < MAX_TYPE:
+            self.commands[cmd_type] += 1
+        if cmd_type in self.pending:
+            self.pending[cmd_type] = time.perf_counter()
+
+    def frame_received(self, cmd_type):
+        now = time.perf_counter()
+        self.frames += 1
+        self.last_frame = now
+        sent = self.pending.get(cmd_type)
+        if sent:
+            self.round_trip[cmd_type].observe(now - sent)
+            self.pending[cmd_type] = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.devices = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def device(self, name):
+        """DeviceMetrics for name, created on first use"""
+        with self._lock:
+            metrics = self.devices.get(name)
+            if metrics is None:
+                metrics = self.devices[name] = DeviceMetrics(name)
+            return metrics
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        now = time.perf_counter()
+        devices = list(self.devices.values())
+        lines = []
+
+        def counter(name, help_text, attr):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for m in devices:
+                lines.append(f'{name}{{device="{m.device}"}} {getattr(m, attr)}')
+
+        counter('mechdog_bytes_received_total', "Bytes read from the serial port", 'bytes_in')
+        counter('mechdog_bytes_sent_total', "Bytes written to the serial port", 'bytes_out')
+        counter('mechdog_frames_received_total', "Frames parsed", 'frames')
+        counter('mechdog_parse_errors_total', "Frames that failed to parse", 'parse_errors')
+        counter('mechdog_frames_dropped_total', "Frames dropped on full subscriber queues", 'frames_dropped')
+        counter('mechdog_reconnects_total', "Serial reconnects", 'reconnects')
+        counter('mechdog_send_queue_dropped_total', "Commands dropped by the send queue policy", 'queue_dropped')
+        counter('mechdog_send_queue_coalesced_total', "Commands replaced by a newer one in the send queue",
+                'queue_coalesced')
+
+        lines.append("# HELP mechdog_send_queue_depth Commands waiting in the send queue")
+        lines.append("# TYPE mechdog_send_queue_depth gauge")
+        for m in devices:
+            lines.append(f'mechdog_send_queue_depth{{device="{m.device}"}} {m.queue_depth}')
+
+        lines.append("# HELP mechdog_commands_sent_total IoT commands sent per type")
+        lines.append("# TYPE mechdog_commands_sent_total counter")
+        for m in devices:
+            for cmd_type, count in enumerate(m.commands):
+                if count:
+                    lines.append(f'mechdog_commands_sent_total{{device="{m.device}",type="{cmd_type}"}} {count}')
+
+        lines.append("# HELP mechdog_round_trip_seconds Query to reply time per command type")
+        lines.append("# TYPE mechdog_round_trip_seconds histogram")
+        for m in devices:
+            for cmd_type, h in m.round_trip.items():
+                labels = f'device="{m.device}",type="{cmd_type}"'
+                cumulative = 0
+                for bound, count in zip(h.bounds + (float('inf'),), h.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'mechdog_round_trip_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'mechdog_round_trip_seconds_sum{{{labels}}} {h.sum:.6f}')
+                lines.append(f'mechdog_round_trip_seconds_count{{{labels}}} {h.count}')
+
+        lines.append("# HELP mechdog_last_frame_age_seconds Time since the last frame (-1 = none yet)")
+        lines.append("# TYPE mechdog_last_frame_age_seconds gauge")
+        for m in devices:
+            age = now - m.last_frame if m.last_frame else -1
+            lines.append(f'mechdog_last_frame_age_seconds{{device="{m.device}"}} {age:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9108, host='127.0.0.1'):
+        """Serve /metrics from a background thread, returns the server"""
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+# Default registry shared by every MechDogIoT in the process
+REGISTRY = MetricsRegistry()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from IoT import MechDogIoT
+
+    parser = argparse.ArgumentParser(description="Expose MechDogIoT metrics over HTTP")
+    parser.add_argument('port', help="serial port")
+    parser.add_argument('--listen', type=int, default=9108, help="HTTP port (default: %(default)s)")
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between CMD|7 queries")
+    args = parser.parse_args()
+
+    iot = MechDogIoT(args.port, verbose=False)
+    iot.enable_metrics()
+    iot.start_reader()
+    iot.enable_sensor_distance(True)
+    REGISTRY.serve(args.listen)
+    print(f"Metrics for {args.port} on http://127.0.0.1:{args.listen}/metrics (Ctrl+C to stop)")
+    try:
+        while True:
+            iot.query_esp32s3_type()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        iot.close()
+        REGISTRY.stop()
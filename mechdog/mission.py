@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Timed mission runner
+Plays a script of timestamped MechDog commands, e.g.
+
+  t=0.00 rgb 255 0 0; t=0.25 action 1 3
+  t=4.0 distance on     # steps are separated by ';' or newlines
+
+All commands are parsed and encoded before the run starts. Every step is
+scheduled against its absolute offset from the start on the monotonic clock
+(sleep until just before, then spin), so lateness never accumulates, and
+per-step lateness statistics are reported at the end.
+
+Usage:
+  python3 mission.py mission.txt [--port /dev/ttyUSB0] [--repeat 10] [--json report.json]
+  python3 mission.py mission.txt --dry-run      # time the schedule without a dog
+"""
+
+import argparse
+import gc
+import json
+import os
+import re
+import sys
+import time
+
+from IoT import VERBS, build_iot_command
+
+STEP = re.compile(r'^t\s*=\s*([0-9]*\.?[0-9]+)\s+(.+)$')
+# Time left before a step at which the runner stops sleeping and spins
+SPIN = 0.002
+
+
+def parse_mission(text):
+    """Script text -> sorted list of (t, command) with command (cmd_type, params) or raw text"""
+    steps = []
+    for number, raw in enumerate(re.split(r'[;\n]', text), 1):
+        entry = raw.split('#', 1)[0].strip()
+        if not entry:
+            continue
+        match = STEP.match(entry)
+        if not match:
+            raise ValueError(f"Step {number}: expected 't=<seconds> <command>', got {entry!r}")
+        words = match.group(2).split()
+        verb = VERBS.get(words[0].lower())
+        if verb is None:
+            raise ValueError(f"Step {number}: unknown command {words[0]!r}")
+        try:
+            command = verb(words[1:])
+        except (IndexError, ValueError):
+            raise ValueError(f"Step {number}: bad arguments in {entry!r}") from None
+        steps.append((float(match.group(1)), command))
+    # Stable sort keeps the script order of steps with the same time
+    steps.sort(key=lambda step: step[0])
+    return steps
+
+
+def compile_mission(steps, iot=None):
+    """Encode every step up front: list of (t, bytes, label)"""
+    compiled = []
+    for t, command in steps:
+        if isinstance(command, str):
+            data, label = (command + '\n').encode('utf-8'), command
+        elif iot is not None:
+            data, label = iot.encode_iot_command(*command), build_iot_command(command[0], *command[1])
+        else:
+            label = build_iot_command(command[0], *command[1])
+            data = (label + '\n').encode('utf-8')
+        compiled.append((t, data, label))
+    return compiled
+
+
+def default_period(compiled):
+    """
+    Seconds between repeats when none is given: the last step's time plus
+    the median gap between steps, so the next cycle's first step does not
+    land on the last step of this one
+    """
+    if not compiled:
+        return 0.0
+    times = [t for t, data, label in compiled]
+    gaps = sorted(b - a for a, b in zip(times, times[1:]) if b > a)
+    if not gaps:
+        raise ValueError("all steps share one time, give the period between repeats")
+    return times[-1] + gaps[len(gaps) // 2]
+
+
+def run_mission(compiled, send, repeat=1, period=None, clock=time.perf_counter, sleep=time.sleep):
+    """
+    Send each step at start + repeat_index * period + t
+    send(data, label) does the I/O. Returns one (t_target, lateness_s,
+    send_s) tuple per step, with lateness measured when send() is called.
+    period defaults to default_period(compiled) when repeating.
+    """
+    if period is None:
+        period = default_period(compiled) if repeat > 1 else 0.0
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()  # a collection in the middle of a spin costs milliseconds
+    try:
+        start = clock()
+        for cycle in range(repeat):
+            base = start + cycle * period
+            for t, data, label in compiled:
+                target = base + t
+                delay = target - clock() - SPIN
+                if delay > 0:
+                    sleep(delay)
+                while True:
+                    now = clock()
+                    if now >= target:
+                        break
+                send(data, label)
+                timings.append((target - start, now - target, clock() - now))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return timings
+
+
+def lateness_stats(timings):
+    """Lateness and send-time percentiles in milliseconds"""
+    if not timings:
+        return None
+
+    def percentiles(values):
+        ordered = sorted(values)
+
+        def pick(p):
+            return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+        return {'mean_ms': sum(ordered) / len(ordered) * 1000, 'p50_ms': pick(50), 'p95_ms': pick(95),
+                'p99_ms': pick(99), 'max_ms': ordered[-1] * 1000}
+
+    late = [lateness for t, lateness, send_time in timings]
+    tenth = max(1, len(late) // 10)
+    return {
+        'steps': len(timings),
+        'duration_s': timings[-1][0],
+        'lateness': percentiles(late),
+        'send': percentiles([send_time for t, lateness, send_time in timings]),
+        # Lateness of the last tenth against the first tenth shows drift
+        'drift_ms': (sum(late[-tenth:]) - sum(late[:tenth])) / tenth * 1000,
+    }
+
+
+def print_stats(stats):
+    if stats is None:
+        print("No steps")
+        return
+    late, send = stats['lateness'], stats['send']
+    print(f"{stats['steps']} steps over {stats['duration_s']:.2f} s")
+    print(f"  lateness: mean {late['mean_ms']:.3f} / p50 {late['p50_ms']:.3f} / p95 {late['p95_ms']:.3f} / "
+          f"p99 {late['p99_ms']:.3f} / max {late['max_ms']:.3f} ms")
+    print(f"  send:     mean {send['mean_ms']:.3f} / p99 {send['p99_ms']:.3f} / max {send['max_ms']:.3f} ms")
+    print(f"  drift (last vs first tenth): {stats['drift_ms']:+.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a timed MechDog mission script")
+    parser.add_argument('script', help="mission file ('-' for stdin)")
+    parser.add_argument('--port', default=os.environ.get('MECHDOG_PORT', '/dev/ttyUSB0'),
+                        help="serial port (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=1, help="play the script this many times")
+    parser.add_argument('--period', type=float, help="seconds between repeats (default: last step time + median step gap)")
+    parser.add_argument('--dry-run', action='store_true', help="schedule without a dog, nothing is sent")
+    parser.add_argument('--json', metavar='FILE', help="write per-step timings and statistics here")
+    args = parser.parse_args()
+
+    with (sys.stdin if args.script == '-' else open(args.script)) as f:
+        try:
+            steps = parse_mission(f.read())
+        except ValueError as e:
+            parser.error(str(e))
+    if args.repeat > 1 and args.period is None:
+        try:
+            args.period = default_period(compile_mission(steps))
+        except ValueError as e:
+            parser.error(str(e))
+
+    iot = None
+    if not args.dry_run:
+        from IoT import MechDogIoT
+        iot = MechDogIoT(port=args.port, verbose=False)
+    compiled = compile_mission(steps, iot)
+    print(f"Running {len(compiled)} steps x {args.repeat}...")
+    try:
+        send = iot.send_encoded if iot is not None else (lambda data, label: None)
+        timings = run_mission(compiled, send, args.repeat, args.period)
+    except KeyboardInterrupt:
+        print("\nMission aborted")
+        sys.exit(1)
+    finally:
+        if iot is not None:
+            iot.close()
+
+    stats = lateness_stats(timings)
+    print_stats(stats)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'stats': stats, 'timings': timings}, f, indent=2)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Provision the WiFi hotspot of every attached MechDog at once
+Each port gets its own thread running stable_hotspot.provision(), so the
+batch takes as long as the slowest dog rather than the sum. Every dog gets
+its own SSID, <prefix>_XX, where XX is the last byte of the USB serial
+number (the same format as the firmware's BLE name MechDog_{mac[5]:02X}).
+On the ESP32-C3's built-in USB port that serial number is the chip's MAC,
+so the SSID follows the dog; through a USB-serial adapter it names the
+adapter (or, without a serial number, the port). The IoT protocol has no
+command to read the board's own ID, so two ports that would get the same
+SSID are refused instead; name them with --ssid PORT=SSID.
+
+Usage:
+  python3 provision_fleet.py                       # all USB serial ports
+  python3 provision_fleet.py /dev/ttyUSB0 /dev/ttyUSB1 --password 12345678
+  python3 provision_fleet.py --ssid /dev/ttyUSB1=MechDog_Lab2
+"""
+
+import argparse
+import concurrent.futures
+import os
+import re
+import sys
+import time
+import zlib
+
+import serial
+
+from discovery import candidate_ports
+from stable_hotspot import provision
+
+
+def device_ssid(port, serial_number, prefix="MechDog"):
+    """<prefix>_XX from the serial number's last byte, or from a hash of the port path"""
+    digits = re.sub(r'[^0-9A-Fa-f]', '', serial_number or '')
+    if len(digits) >= 2:
+        last = int(digits[-2:], 16)
+    else:
+        last = zlib.crc32(os.path.realpath(port).encode()) & 0xFF
+    return f"{prefix}_{last:02X}"
+
+
+def assign_ssids(ports, prefix="MechDog", overrides=None):
+    """
+    {port: serial_number} -> {port: ssid}, overrides is {port: ssid}
+    Raises ValueError when two ports would get the same SSID.
+    """
+    overrides = overrides or {}
+    ssids = {port: overrides.get(port) or device_ssid(port, serial_number, prefix)
+             for port, serial_number in ports.items()}
+    by_ssid = {}
+    for port, ssid in ssids.items():
+        by_ssid.setdefault(ssid, []).append(port)
+    clashes = [f"{ssid} ({', '.join(clash)})" for ssid, clash in by_ssid.items() if len(clash) > 1]
+    if clashes:
+        raise ValueError(f"Duplicate SSIDs: {'; '.join(clashes)}")
+    return ssids
+
+
+def provision_port(port, ssid, password, baudrate=115200, **kwargs):
+    """Open one port and provision it; never raises, errors go in the result"""
+    start = time.monotonic()
+    try:
+        with serial.Serial(port, baudrate, timeout=1) as ser:
+            ser.reset_input_buffer()
+            result = provision(ser, ssid, password, **kwargs)
+    except (serial.SerialException, OSError) as e:
+        result = {'acked': False, 'attempts': 0, 'time_to_ack': None, 'response': '', 'error': str(e)}
+    result.update({'port': port, 'ssid': ssid, 'elapsed': time.monotonic() - start})
+    return result
+
+
+def provision_fleet(ports, password, prefix="MechDog", overrides=None, **kwargs):
+    """
+    Provision {port: serial_number} concurrently
+    Returns the per-port results in port order. Raises ValueError before
+    touching any port if two of them would get the same SSID.
+    """
+    ssids = assign_ssids(ports, prefix, overrides)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(ports))) as pool:
+        futures = [pool.submit(provision_port, port, ssid, password, **kwargs) for port, ssid in ssids.items()]
+        return [future.result() for future in futures]
+
+
+def print_summary(results, elapsed):
+    print(f"\n{'Port':<20} {'SSID':<16} {'Result':<10} {'Attempts':>8} {'Ack ms':>8}")
+    print("-" * 66)
+    for r in results:
+        if r['acked']:
+            status, ack = "ok", f"{r['time_to_ack'] * 1000:.0f}"
+        else:
+            status, ack = ("error" if 'error' in r else "no ack"), "-"
+        print(f"{r['port']:<20} NIOT_{r['ssid']:<11} {status:<10} {r['attempts']:>8} {ack:>8}")
+        if 'error' in r:
+            print(f"{'':<20} {r['error']}")
+    acked = sum(r['acked'] for r in results)
+    slowest = max((r['elapsed'] for r in results), default=0.0)
+    print("-" * 66)
+    print(f"{acked}/{len(results)} acknowledged in {elapsed:.2f} s (slowest device {slowest:.2f} s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Provision the hotspots of all attached MechDogs concurrently")
+    parser.add_argument('ports', nargs='*', help="serial ports (default: every USB serial port)")
+    parser.add_argument('--password', default="12345678", help="hotspot password (default: %(default)s)")
+    parser.add_argument('--prefix', default="MechDog", help="SSID prefix before _XX (default: %(default)s)")
+    parser.add_argument('--attempts', type=int, default=6, help="attempts per dog (default: %(default)s)")
+    parser.add_argument('--ssid', action='append', default=[], metavar='PORT=SSID',
+                        help="SSID for one port instead of <prefix>_XX (repeatable)")
+    args = parser.parse_args()
+
+    overrides = {}
+    for item in args.ssid:
+        port, sep, ssid = item.partition('=')
+        if not sep or not ssid:
+            parser.error(f"--ssid expects PORT=SSID, got {item!r}")
+        overrides[port] = ssid
+
+    if args.ports:
+        known = candidate_ports()
+        ports = {port: known.get(port) for port in args.ports}
+    else:
+        ports = candidate_ports()
+    if not ports:
+        print("No serial ports found")
+        sys.exit(1)
+
+    print(f"Provisioning {len(ports)} dog(s)...")
+    start = time.monotonic()
+    try:
+        results = provision_fleet(ports, args.password, args.prefix, overrides, max_attempts=args.attempts)
+    except ValueError as e:
+        print(f"Error: {e}; set one of them with --ssid PORT=SSID")
+        sys.exit(1)
+    print_summary(results, time.monotonic() - start)
+    sys.exit(0 if all(r['acked'] for r in results) else 1)
@@ -1,40 +1,37 @@
 #!/usr/bin/env python3
 """Quick script to setup MechDog WiFi hotspot"""
 
+import os
 import serial
-import time
 
-# Connect to ESP32-C3-Mini-1
-port = '/dev/ttyUSB0'
+from stable_hotspot import provision
+
+# Connect to ESP32-C3-Mini-1 (MECHDOG_PORT overrides, e.g. a fake_dog.py pty)
+port = os.environ.get('MECHDOG_PORT', '/dev/ttyUSB0')
 baudrate = 115200
 
 print(f"Connecting to {port}...")
 ser = serial.Serial(port, baudrate, timeout=1)
-time.sleep(2)
 
 # Configure WiFi hotspot
 ssid = "MechDog"
 password = "12345678"
-config_str = f"NIOT_{ssid}|||{password}$$$\n"
-
 print(f"Setting up WiFi hotspot...")
 print(f"  SSID: NIOT_{ssid}")
 print(f"  Password: {password}")
 
-ser.write(config_str.encode('utf-8'))
-ser.flush()
-
-print("\nWiFi hotspot configured!")
-print("Waiting for hotspot to activate...")
-time.sleep(3)
-
-print("\nYou should now see 'NIOT_MechDog' when searching for WiFi networks on your phone.")
-print("Password: 12345678")
-
-# Read any response
-if ser.in_waiting > 0:
-    response = ser.read(ser.in_waiting)
-    print(f"\nResponse: {response.decode('utf-8', errors='ignore')}")
+# Resend with growing waits until the module echoes the configuration
+result = provision(ser, ssid, password)
+
+if result['acked']:
+    print(f"\nWiFi hotspot configured! (acknowledged in {result['time_to_ack'] * 1000:.0f} ms, "
+          f"{result['attempts']} attempt(s))")
+    print("\nYou should now see 'NIOT_MechDog' when searching for WiFi networks on your phone.")
+    print("Password: 12345678")
+else:
+    print(f"\nNo acknowledgement after {result['attempts']} attempts")
+    if result['response']:
+        print(f"\nResponse: {result['response']}")
 
 ser.close()
 print("\nDone!")
@@ -0,0 +1,38 @@
+"""Stand-in for HW_MechDog: motion calls update the World and are recorded"""
+
+from .core import active
+
+
+class MechDog:
+    def __init__(self):
+        active().recorder.record('MechDog', '__init__', ())
+
+    def move(self, speed, turn):
+        sim = active()
+        sim.world.set_motion(speed, turn)
+        sim.recorder.record('MechDog', 'move', (speed, turn))
+
+    def transform(self, position, euler, duration):
+        active().recorder.record('MechDog', 'transform', (list(position), list(euler), duration))
+
+    def set_servo(self, servo, pulse, duration):
+        sim = active()
+        sim.world.servos[servo] = pulse
+        sim.recorder.record('MechDog', 'set_servo', (servo, pulse, duration))
+
+    def action_run(self, name):
+        active().recorder.record('MechDog', 'action_run', (name,))
+
+    def set_default_pose(self, duration=1000):
+        sim = active()
+        sim.world.set_motion(0, 0)
+        sim.recorder.record('MechDog', 'set_default_pose', (duration,))
+
+    def homeostasis(self, enable):
+        active().recorder.record('MechDog', 'homeostasis', (enable,))
+
+    def read_homeostasis_status(self):
+        sim = active()
+        status = sim.world.balanced
+        sim.recorder.record('MechDog', 'read_homeostasis_status', (), status)
+        return status
@@ -0,0 +1,26 @@
+"""Stand-in for the Hiwonder firmware module"""
+
+from .core import active
+
+
+def startMain(target):
+    """Run target as its own firmware thread"""
+    sim = active()
+    sim.recorder.record('Hiwonder', 'startMain', (target.__name__,))
+    sim.start_thread(target)
+
+
+def Battery_power():
+    sim = active()
+    value = sim.world.battery
+    sim.recorder.record('Hiwonder', 'Battery_power', (), value)
+    return value
+
+
+class Buzzer:
+    def playTone(self, frequency, duration, block=True):
+        """duration in ms; block=True returns when the tone ends"""
+        sim = active()
+        sim.recorder.record('Buzzer', 'playTone', (frequency, duration, block))
+        if block:
+            sim.clock.sleep(duration / 1000)
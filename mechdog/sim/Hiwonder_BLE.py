@@ -0,0 +1,44 @@
+"""Stand-in for Hiwonder_BLE: app commands come from Simulation.ble_command()"""
+
+from .core import active
+
+
+class BLE:
+    MODE_BLE_SLAVE = 0
+    MODE_BLE_MASTER = 1
+
+    def __init__(self, mode, name):
+        self.mode = mode
+        self.name = name
+        active().recorder.record('BLE', '__init__', (mode, name))
+
+    def is_connected(self):
+        sim = active()
+        connected = sim.world.ble_connected
+        sim.recorder.record('BLE', 'is_connected', (), connected)
+        return connected
+
+    def contains_data(self, prefix):
+        sim = active()
+        inbox = sim.world.ble_inbox
+        found = bool(inbox) and inbox[0].startswith(prefix)
+        sim.recorder.record('BLE', 'contains_data', (prefix,), found)
+        return found
+
+    def read_uart_cmd(self):
+        sim = active()
+        data = sim.world.ble_inbox.popleft() if sim.world.ble_inbox else ''
+        sim.recorder.record('BLE', 'read_uart_cmd', (), data)
+        return data
+
+    def parse_uart_cmd(self, data):
+        """'CMD|3|2|$' -> ['3', '2']"""
+        fields = data.strip()
+        if fields.startswith('CMD|'):
+            fields = fields[4:]
+        return [f for f in fields.rstrip('$').split('|') if f]
+
+    def send_data(self, data):
+        sim = active()
+        sim.world.ble_outbox.append(data)
+        sim.recorder.record('BLE', 'send_data', (data,))
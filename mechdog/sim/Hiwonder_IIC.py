@@ -0,0 +1,84 @@
+"""
+Stand-in for Hiwonder_IIC
+Bus devices: the ESP32-C3 WiFi bridge (0x69) and the ESP32-S3 camera
+(0x52, present when World.camera is set); other addresses raise OSError
+like a missing device.
+"""
+
+from .core import active
+
+BRIDGE_ADDR = 0x69
+CAMERA_ADDR = 0x52
+# Color id per camera register, as in esp32s3_main's color_list
+CAMERA_COLORS = (3, 1, 2)
+
+
+class IIC:
+    def __init__(self, bus):
+        self.bus = bus
+
+    def writeto(self, addr, buf):
+        sim = active()
+        data = buf.encode('utf-8') if isinstance(buf, str) else bytes(buf)
+        sim.recorder.record(f'IIC{self.bus}', 'writeto', (addr, data))
+        if addr != BRIDGE_ADDR:
+            raise OSError(19, "ENODEV")
+        sim.world.bridge_tx.append(data)
+
+    def readfrom(self, addr, n):
+        sim = active()
+        if addr != BRIDGE_ADDR:
+            raise OSError(19, "ENODEV")
+        # The bridge keeps returning the last host command until a new one comes
+        data = sim.world.bridge_rx[:n].ljust(n, b'\x00')
+        sim.recorder.record(f'IIC{self.bus}', 'readfrom', (addr, n), data)
+        return data
+
+    def readfrom_mem(self, addr, reg, n):
+        sim = active()
+        world = sim.world
+        if addr != CAMERA_ADDR or world.camera is None:
+            raise OSError(19, "ENODEV")
+        if world.camera == 'face':
+            if reg == 2:
+                data = bytes((255, 255, 0, 0))  # face module signature
+            else:
+                data = bytes((0, 0, 1 if world.face else 0, 0))
+        else:
+            hit = reg < len(CAMERA_COLORS) and CAMERA_COLORS[reg] == world.color
+            data = bytes((0, 0, 1 if hit else 0, 0))
+        data = data[:n]
+        sim.recorder.record(f'IIC{self.bus}', 'readfrom_mem', (addr, reg, n), data)
+        return data
+
+
+class I2CSonar:
+    def __init__(self, iic):
+        self.iic = iic
+
+    def getDistance(self):
+        sim = active()
+        distance = sim.world.distance()
+        sim.recorder.record('I2CSonar', 'getDistance', (), distance)
+        return distance
+
+    def setRGB(self, index, r, g, b):
+        sim = active()
+        sim.world.rgb = (r, g, b)
+        sim.recorder.record('I2CSonar', 'setRGB', (index, r, g, b))
+
+
+class ESP32S3Cam:
+    def __init__(self, iic):
+        self.iic = iic
+
+
+class MPU:
+    def __init__(self, iic=None):
+        self.iic = iic
+
+    def read_angle(self):
+        sim = active()
+        angle = list(sim.world.angle)
+        sim.recorder.record('MPU', 'read_angle', (), angle)
+        return angle
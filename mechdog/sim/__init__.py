@@ -0,0 +1,16 @@
+"""
+Run the MechDog firmware under CPython
+Stand-ins for the Hiwonder modules (Hiwonder, Hiwonder_IIC, Hiwonder_BLE,
+HW_MechDog, machine, MicroPython's time) record every call with its time
+and thread, so main.py & co. run unmodified on the desktop. Time is
+virtual by default: sleeps take no wall time and runs are reproducible.
+
+    from sim import Simulation
+    sim = Simulation()
+    sim.ble_command(1.0, 'CMD|3|3|$')
+    sim.load('main.py')
+    sim.run(5)
+    sim.recorder.select('MechDog')
+"""
+
+from .core import Call, RealClock, Recorder, Simulation, VirtualClock, World, active
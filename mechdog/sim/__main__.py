@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Run a firmware file in the simulator and print what it did
+
+Usage:
+  python3 -m sim main_bluetooth_wifi.py [--duration 10] [--ble 1.0:CMD|3|3|$]
+                 [--wifi 5.0:CMD|4|255|0|0|$] [--obstacle 60] [--camera face] [--log calls.jsonl]
+                 [--cost 0.001 | --realtime]
+"""
+
+import argparse
+import sys
+import time
+
+from .core import RealClock, Simulation, VirtualClock
+
+# Calls that move or show something, for the timeline
+ACTUATION = {('MechDog', m) for m in ('move', 'transform', 'set_servo', 'action_run', 'set_default_pose',
+                                      'homeostasis')}
+ACTUATION |= {('I2CSonar', 'setRGB'), ('Buzzer', 'playTone'), ('BLE', 'send_data')}
+
+
+def timed(text):
+    """'1.5:CMD|3|3|$' -> (1.5, 'CMD|3|3|$')"""
+    t, sep, command = text.partition(':')
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected TIME:COMMAND, got {text!r}")
+    return float(t), command
+
+
+def collapse(calls):
+    """
+    [first call, count] per run of identical calls to one method from one
+    thread; calls to other methods may come in between
+    """
+    runs, last = [], {}
+    for call in calls:
+        key = (call.thread, call.device, call.method)
+        index = last.get(key)
+        if index is not None and runs[index][0].args == call.args:
+            runs[index][1] += 1
+        else:
+            last[key] = len(runs)
+            runs.append([call, 1])
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run MechDog firmware under CPython")
+    parser.add_argument('firmware', help="firmware file, e.g. main.py")
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help="seconds to run after the file's top level (default: %(default)s)")
+    parser.add_argument('--ble', type=timed, action='append', default=[], metavar='T:CMD',
+                        help="BLE app command at T seconds (repeatable)")
+    parser.add_argument('--wifi', type=timed, action='append', default=[], metavar='T:CMD',
+                        help="host command through the WiFi bridge at T seconds (repeatable)")
+    parser.add_argument('--obstacle', type=float, default=100.0,
+                        help="sonar distance to the obstacle ahead in cm (default: %(default)s)")
+    parser.add_argument('--camera', choices=('face', 'color'), help="ESP32-S3 camera module fitted")
+    parser.add_argument('--log', help="write every recorded call to this file as JSON lines")
+    parser.add_argument('--cost', type=float, default=0.001,
+                        help="virtual seconds per device call or clock read (default: %(default)s)")
+    parser.add_argument('--realtime', action='store_true', help="run at wall-clock speed instead")
+    args = parser.parse_args()
+
+    sim = Simulation(RealClock() if args.realtime else VirtualClock(args.cost))
+    started = time.perf_counter()
+    sim.world.obstacle_cm = args.obstacle
+    sim.world.camera = args.camera
+    for t, command in args.ble:
+        sim.ble_command(t, command)
+    for t, command in args.wifi:
+        sim.wifi_command(t, command)
+
+    try:
+        sim.load(args.firmware)
+        sim.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    recorder = sim.recorder
+    calls = list(recorder.calls)
+
+    print(f"\n=== {len(calls)} calls in {sim.clock.now():.2f} s "
+          f"({time.perf_counter() - started:.2f} s wall) ===")
+    for (device, method), (count, first, last) in sorted(recorder.summary().items()):
+        print(f"  {device + '.' + method:28} {count:6}  {first:8.3f} .. {last:8.3f} s")
+    print("\n=== Actuation ===")
+    for call, count in collapse(c for c in calls if (c.device, c.method) in ACTUATION):
+        args_text = ', '.join(repr(a) for a in call.args)
+        repeat = f"  x{count}" if count > 1 else ""
+        print(f"  {call.t:8.3f}  {call.thread:14} {call.device}.{call.method}({args_text}){repeat}")
+    if sim.world.bridge_tx:
+        print(f"\n{len(sim.world.bridge_tx)} frames written to the WiFi bridge, last: {sim.world.bridge_tx[-1]!r}")
+    if args.log:
+        recorder.dump(args.log)
+        print(f"Calls written to {args.log}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
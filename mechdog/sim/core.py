@@ -0,0 +1,317 @@
+"""
+Simulation state shared by the firmware stand-in modules
+A Simulation owns the clock, the world the sensors read and the recorder.
+The stand-in modules (Hiwonder, HW_MechDog, ...) find it through active().
+Time is virtual by default (VirtualClock); RealClock runs at wall-clock speed.
+"""
+
+import builtins
+import collections
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import types
+
+_active = None
+
+
+def active():
+    """The running Simulation"""
+    if _active is None:
+        raise RuntimeError("no simulation is running (see sim.Simulation)")
+    return _active
+
+
+class RealClock:
+    """Wall-clock time since boot; startMain threads are OS threads"""
+
+    def __init__(self):
+        self.start = time.monotonic()
+
+    def now(self):
+        return time.monotonic() - self.start
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def tick(self):
+        """A device call or clock read; takes as long as it takes"""
+
+    def start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def run_until(self, t):
+        self.sleep(t - self.now())
+
+
+class VirtualClock:
+    """
+    Simulated time: deterministic and as fast as the host allows
+    Threads take turns, one at a time. sleep() hands the turn to the thread
+    due first (ties in the order they went to sleep) and the clock jumps to
+    its wake-up time. The firmware's busy loops never sleep, so every device
+    call and clock read (tick) costs `cost` seconds and is a turn too.
+    Time is kept in whole microseconds so ticks_ms() deadlines come out the
+    same on every run.
+    """
+
+    def __init__(self, cost=0.001):
+        self.us = 0
+        self.cost_us = round(cost * 1000000)
+        self._queue = []                 # (wake-up us, sequence, event)
+        self._sequence = itertools.count()
+        self._turns = {}                 # thread ident -> its turn event
+
+    def now(self):
+        return self.us / 1000000
+
+    def sleep(self, seconds):
+        self._switch(self.us + max(0, round(seconds * 1000000)))
+
+    def tick(self):
+        self._switch(self.us + self.cost_us)
+
+    def _switch(self, wake):
+        """Queue the calling thread for wake and run whoever is due first"""
+        ident = threading.get_ident()
+        turn = self._turns.get(ident)
+        if turn is None:  # the thread that created the clock
+            turn = self._turns[ident] = threading.Event()
+        heapq.heappush(self._queue, (wake, next(self._sequence), turn))
+        self._next()
+        turn.wait()
+        turn.clear()
+
+    def _next(self):
+        if self._queue:
+            wake, _, turn = heapq.heappop(self._queue)
+            self.us = max(self.us, wake)
+            turn.set()
+
+    def start_thread(self, target, name):
+        turn = threading.Event()
+
+        def run():
+            turn.wait()
+            turn.clear()
+            try:
+                target()
+            finally:
+                del self._turns[threading.get_ident()]
+                self._next()
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        self._turns[thread.ident] = turn
+        heapq.heappush(self._queue, (self.us, next(self._sequence), turn))
+        return thread
+
+    def run_until(self, t):
+        self.sleep(t - self.now())
+
+
+Call = collections.namedtuple('Call', 't thread device method args result')
+
+
+class Recorder:
+    """Timestamped log of every call the firmware makes into the stand-in modules"""
+
+    # Polled in tight loops on the device, they would only flood the log
+    IGNORED = frozenset({'is_connected', 'contains_data'})
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.calls = []
+
+    def record(self, device, method, args, result=None):
+        self.clock.tick()
+        if method in self.IGNORED:
+            return
+        # list.append is atomic, so the startMain threads need no lock
+        self.calls.append(Call(self.clock.now(), threading.current_thread().name, device, method,
+                               args, result))
+
+    def select(self, device=None, method=None):
+        return [c for c in self.calls if (device is None or c.device == device)
+                and (method is None or c.method == method)]
+
+    def summary(self):
+        """(device, method) -> (count, first t, last t)"""
+        counts = {}
+        for call in self.calls:
+            key = (call.device, call.method)
+            count, first, last = counts.get(key, (0, call.t, call.t))
+            counts[key] = (count + 1, first, call.t)
+        return counts
+
+    def dump(self, path):
+        """Write the calls as JSON lines"""
+        with open(path, 'w') as f:
+            for call in self.calls:
+                f.write(json.dumps(call._asdict(), default=repr) + '\n')
+
+
+class World:
+    """
+    What the simulated sensors see, driven by the simulated actuators
+    The sonar model is a corridor: walking forward closes on an obstacle
+    obstacle_cm ahead, and turning more than 45 degrees away from it opens
+    the view to open_cm. Speeds from MechDog.move() are taken as mm/s and
+    deg/s. Set sonar to a function of time to replace the model.
+    """
+
+    def __init__(self, clock, obstacle_cm=100.0, open_cm=200.0):
+        self.clock = clock
+        self.obstacle_cm = obstacle_cm
+        self.open_cm = open_cm
+        self.sonar = None
+        self.speed = 0
+        self.turn = 0
+        self.heading = 0.0
+        self._last = clock.now()
+        self.angle = [0.0, 0.0]          # MPU pitch, roll in degrees
+        self.battery = 8000              # Hiwonder.Battery_power()
+        self.balanced = True             # MechDog.read_homeostasis_status()
+        self.camera = None               # None, 'face' or 'color'
+        self.face = False                # a face is in view
+        self.color = 0                   # color id in view (1-3), 0 = none
+        self.rgb = (0, 0, 0)
+        self.servos = {}
+        self.ble_connected = False
+        self.ble_inbox = collections.deque()
+        self.ble_outbox = []
+        self.bridge_rx = b''             # ESP32-C3 buffer read over I2C (sticky)
+        self.bridge_tx = []              # frames the firmware wrote to the bridge
+
+    def _advance(self):
+        now = self.clock.now()
+        dt, self._last = now - self._last, now
+        if self.turn:
+            self.heading += self.turn * dt
+            if abs(self.heading) > 45:
+                self.heading = 0.0
+                self.obstacle_cm = self.open_cm
+        elif self.speed:
+            self.obstacle_cm = max(2.0, self.obstacle_cm - self.speed / 10 * dt)
+
+    def set_motion(self, speed, turn):
+        self._advance()
+        self.speed, self.turn = speed, turn
+
+    def distance(self):
+        if self.sonar is not None:
+            return self.sonar(self.clock.now())
+        self._advance()
+        return round(self.obstacle_cm, 1)
+
+
+class Simulation:
+    def __init__(self, clock=None, world=None):
+        self.clock = clock or VirtualClock()
+        self.world = world or World(self.clock)
+        self.recorder = Recorder(self.clock)
+        self.threads = []
+        self._events = []
+        self._sequence = itertools.count()
+        self._delivery = None
+        self._loaded = {}
+        from . import Hiwonder, Hiwonder_IIC, Hiwonder_BLE, HW_MechDog, machine
+        # Firmware import name -> stand-in
+        self.modules = {'Hiwonder': Hiwonder, 'Hiwonder_IIC': Hiwonder_IIC, 'Hiwonder_BLE': Hiwonder_BLE,
+                        'HW_MechDog': HW_MechDog, 'machine': machine, 'time': self._time_module()}
+
+    def _time_module(self):
+        """MicroPython's time: ticks_ms()/sleep_ms() and friends on the simulation clock"""
+        clock = self.clock
+        module = types.ModuleType('time')
+
+        def now():
+            clock.tick()
+            return clock.now()
+
+        module.time = now
+        module.sleep = clock.sleep
+        module.sleep_ms = lambda ms: clock.sleep(ms / 1000)
+        module.sleep_us = lambda us: clock.sleep(us / 1000000)
+        module.ticks_ms = lambda: int(now() * 1000)
+        module.ticks_us = lambda: int(now() * 1000000)
+        module.ticks_add = lambda ticks, delta: ticks + delta
+        module.ticks_diff = lambda new, old: new - old
+        return module
+
+    def start_thread(self, target):
+        thread = self.clock.start_thread(target, getattr(target, '__name__', 'thread'))
+        self.threads.append(thread)
+        return thread
+
+    def load(self, path, name='__main__'):
+        """
+        Run a firmware file with its imports mapped to the stand-in modules
+        Other firmware files it imports (boot.py -> main) load the same way.
+        """
+        global _active
+        _active = self
+        self._start_delivery()
+        path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+
+        def _import(module, globals=None, locals=None, fromlist=(), level=0):
+            if module in self.modules:
+                return self.modules[module]
+            if level == 0 and os.path.exists(os.path.join(directory, module + '.py')):
+                loaded = self._loaded.get(module)
+                if loaded is None:
+                    loaded = self.load(os.path.join(directory, module + '.py'), module)
+                return loaded
+            return builtins.__import__(module, globals, locals, fromlist, level)
+
+        module = types.ModuleType(name)
+        module.__file__ = path
+        module.__builtins__ = dict(builtins.__dict__, __import__=_import)
+        self._loaded[name] = module
+        with open(path) as f:
+            code = compile(f.read(), path, 'exec')
+        exec(code, module.__dict__)
+        return module
+
+    def at(self, t, action):
+        """Call action() at simulation time t (seconds since boot)"""
+        heapq.heappush(self._events, (t, next(self._sequence), action))
+
+    def ble_command(self, t, text):
+        """Deliver a BLE app command (e.g. 'CMD|3|3|$') at time t"""
+        def deliver():
+            self.world.ble_connected = True
+            self.world.ble_inbox.append(text)
+        self.at(t, deliver)
+
+    def wifi_command(self, t, text):
+        """Put a host command in the ESP32-C3 bridge buffer at time t (20 bytes, like the bridge)"""
+        def deliver():
+            self.world.bridge_rx = text.encode('utf-8')[:20]
+        self.at(t, deliver)
+
+    def _start_delivery(self):
+        """Scheduled events run on time from a thread of their own, even during a file's top level"""
+        if self._delivery is None:
+            self._delivery = self.clock.start_thread(self._deliver, 'events')
+
+    def _deliver(self):
+        clock, events = self.clock, self._events
+        while True:
+            if events and events[0][0] <= clock.now():
+                heapq.heappop(events)[2]()
+            else:
+                # Wake up now and then for events added later
+                clock.sleep(min(events[0][0] - clock.now(), 0.1) if events else 0.1)
+
+    def run(self, duration):
+        """Run the started threads for duration seconds"""
+        self._start_delivery()
+        self.clock.run_until(self.clock.now() + duration)
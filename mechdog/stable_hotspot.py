@@ -1,20 +1,80 @@
 #!/usr/bin/env python3
 """
 Stable WiFi hotspot setup for MechDog ESP32-C3
-Sends configuration multiple times and monitors stability
+Sends the configuration until the module acknowledges it and monitors stability
 """
 
+import codecs
+import collections
+import os
+import re
 import serial
 import time
 import sys
 
-def setup_stable_hotspot(port='/dev/ttyUSB0', ssid="MechDog", password="12345678"):
-    """Setup WiFi hotspot with stability checks"""
+from log_filter import LogFilter
+
+# MECHDOG_PORT overrides the default port, e.g. a fake_dog.py pty
+DEFAULT_PORT = os.environ.get('MECHDOG_PORT', '/dev/ttyUSB0')
+# Noise suppression rules for the monitors, see log_filter.py
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'monitor_rules.txt')
+
+def provision(ser, ssid, password, max_attempts=6, ack_timeout=0.25, max_timeout=4.0, on_attempt=None):
+    """
+    Send the hotspot configuration until the ESP32-C3 echoes it back
+    Each attempt waits twice as long as the previous one for the echo
+    (ack_timeout, capped at max_timeout); an echo of an earlier attempt that
+    arrives late counts too. Returns a dict with acked, attempts,
+    time_to_ack (seconds from the first send, None without ack) and
+    response (everything read, decoded).
+    """
+    config = f"NIOT_{ssid}|||{password}$$$".encode('utf-8')
+    ack = f"NIOT_{ssid}|||".encode('utf-8')
+    received = bytearray()
+    old_timeout = ser.timeout
+    start = time.monotonic()
+    result = {'acked': False, 'attempts': 0, 'time_to_ack': None}
+    try:
+        timeout = ack_timeout
+        for attempt in range(1, max_attempts + 1):
+            result['attempts'] = attempt
+            if on_attempt is not None:
+                on_attempt(attempt, timeout)
+            ser.write(config + b'\n')
+            ser.flush()
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                ser.timeout = remaining
+                received += ser.read(max(1, ser.in_waiting))
+                if ack in received:
+                    result['acked'] = True
+                    result['time_to_ack'] = time.monotonic() - start
+                    return result
+            timeout = min(timeout * 2, max_timeout)
+        return result
+    finally:
+        ser.timeout = old_timeout
+        result['response'] = received.decode('utf-8', errors='replace')
+
+
+def setup_stable_hotspot(port=DEFAULT_PORT, ssid="MechDog", password="12345678", rules=DEFAULT_RULES,
+                         monitor_seconds=10, details=None):
+    """
+    Setup WiFi hotspot, stopping at the first acknowledged attempt
+    Without an acknowledgement the port is monitored for monitor_seconds to
+    show what the module is saying. Returns whether the module acknowledged;
+    pass a dict as details to get provision()'s result in it.
+    """
     
+    log_filter = LogFilter.from_file(rules)
+    splitter = LineSplitter()
+
     print(f"Connecting to {port}...")
     try:
         ser = serial.Serial(port, 115200, timeout=1)
-        time.sleep(2)
         print("Connected!")
     except serial.SerialException as e:
         print(f"Error: {e}")
@@ -24,51 +84,41 @@ def setup_stable_hotspot(port='/dev/ttyUSB0', ssid="MechDog", password="12345678
     if ser.in_waiting > 0:
         ser.read(ser.in_waiting)
     
-    config_str = f"NIOT_{ssid}|||{password}$$$"
-    
-    print(f"\nConfiguring WiFi hotspot (sending {len(config_str)} bytes):")
+    print(f"\nConfiguring WiFi hotspot:")
     print(f"  SSID: NIOT_{ssid}")
     print(f"  Password: {password}")
-    print("\nSending configuration commands...")
-    
-    # Send configuration multiple times for stability
-    for i in range(5):
-        print(f"  Attempt {i+1}/5...", end='', flush=True)
-        
-        # Send the configuration
-        ser.write(config_str.encode('utf-8'))
-        ser.write(b'\n')
-        ser.flush()
-        
-        # Wait and check for response
-        time.sleep(0.5)
-        
-        if ser.in_waiting > 0:
-            response = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-            if config_str in response or 'NIOT' in response:
-                print(" ✓ Acknowledged")
-            else:
-                print(" Sent")
-        else:
-            print(" Sent")
-        
-        time.sleep(1)
+    print("\nSending configuration...")
     
-    print("\n✓ Configuration commands sent!")
-    print("\nMonitoring for 10 seconds...")
+    # The module may still be booting after the port opened; the retries
+    # with growing waits cover that instead of a fixed sleep
+    result = provision(ser, ssid, password,
+                       on_attempt=lambda attempt, timeout: print(f"  Attempt {attempt} (waiting {timeout:.2f} s for ack)"))
+    if details is not None:
+        details.update(result)
     
-    # Monitor for 10 seconds
-    start_time = time.time()
-    while time.time() - start_time < 10:
-        if ser.in_waiting > 0:
-            data = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-            # Filter out repetitive ARM_ACTION messages
-            if 'ARM_ACTION' not in data and data.strip():
-                print(f"Response: {data.strip()}")
-        time.sleep(0.1)
+    if result['acked']:
+        print(f"\n✓ Acknowledged after {result['attempts']} attempt(s), {result['time_to_ack'] * 1000:.0f} ms")
+    else:
+        print(f"\n✗ No acknowledgement after {result['attempts']} attempts")
+        print(f"\nMonitoring for {monitor_seconds} seconds...")
+        output = []
+        for record in splitter.feed(result['response'].encode('utf-8')):
+            output += log_filter.process(record)
+        start_time = time.time()
+        while time.time() - start_time < monitor_seconds:
+            output += log_filter.flush()
+            if ser.in_waiting > 0:
+                for record in splitter.feed(ser.read(ser.in_waiting)):
+                    output += log_filter.process(record)
+            if output:
+                print("\n".join(f"Response: {line}" for line in output))
+                output = []
+            time.sleep(0.1)
+        for line in log_filter.flush(float('inf')):
+            print(f"Response: {line}")
     
     print("\n" + "="*50)
-    print("Setup complete!")
+    print("Setup complete!" if result['acked'] else "Setup not confirmed")
     print("="*50)
     print(f"\nLook for WiFi network: NIOT_{ssid}")
     print(f"Password: {password}")
@@ -79,27 +129,91 @@ def setup_stable_hotspot(port='/dev/ttyUSB0', ssid="MechDog", password="12345678
     print("4. Check for loose wiring connections")
     
     ser.close()
-    return True
+    return result['acked']
+
+class LineSplitter:
+    """
+    Turn a serial byte stream into complete records: text lines and
+    CMD|...|$ frames. UTF-8 is decoded incrementally, so multibyte
+    characters and frames split across reads come out whole.
+    """
+
+    TERMINATOR = re.compile(r'\r?\n|\|\$')
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.pending = ''
+
+    def feed(self, data):
+        text = self.pending + self.decoder.decode(data)
+        records = []
+        start = 0
+        for match in self.TERMINATOR.finditer(text):
+            end = match.end() if match.group() == '|$' else match.start()
+            record = text[start:end].strip()
+            if record:
+                records.append(record)
+            start = match.end()
+        self.pending = text[start:]
+        return records
 
-def monitor_mode(port='/dev/ttyUSB0'):
-    """Continuously monitor the serial connection"""
+
+def monitor_mode(port=DEFAULT_PORT, stats_interval=10, rules=DEFAULT_RULES):
+    """
+    Continuously monitor the serial connection
+    Blocks in read() until data arrives (no polling), prints one line per
+    record with a monotonic millisecond timestamp and keeps per-second
+    line/byte rates (summary every stats_interval seconds, 0 = off).
+    Records pass through the rules file filter; everything read in one go
+    is written to the terminal with a single write.
+    """
     print(f"Monitoring {port} (Ctrl+C to stop)...")
-    
+
+    log_filter = LogFilter.from_file(rules)
+    splitter = LineSplitter()
+    start = time.monotonic()
+    second = 0
+    lines_this_second = bytes_this_second = 0
+    rates = collections.deque(maxlen=60)  # (lines/s, bytes/s) for the last minute
+    total_lines = total_bytes = 0
+    next_stats = stats_interval
+
     try:
-        ser = serial.Serial(port, 115200, timeout=1)
-        time.sleep(1)
+        ser = serial.Serial(port, 115200, timeout=0.5)
         
         while True:
-            if ser.in_waiting > 0:
-                data = ser.read(ser.in_waiting).decode('utf-8', errors='ignore')
-                # Filter repetitive messages
-                if 'ARM_ACTION' not in data or 'NIOT' in data:
-                    timestamp = time.strftime('%H:%M:%S')
-                    print(f"[{timestamp}] {data.strip()}")
-            time.sleep(0.05)
+            # Block for the first byte (up to the timeout), then take the rest
+            data = ser.read(1)
+            if data and ser.in_waiting:
+                data += ser.read(ser.in_waiting)
+            now = time.monotonic() - start
+            while int(now) > second:
+                rates.append((lines_this_second, bytes_this_second))
+                lines_this_second = bytes_this_second = 0
+                second += 1
+            output = log_filter.flush()
+            bytes_this_second += len(data)
+            total_bytes += len(data)
+            for record in splitter.feed(data):
+                lines_this_second += 1
+                total_lines += 1
+                output += log_filter.process(record)
+            if output:
+                sys.stdout.write("".join(f"[{now:10.3f}] {line}\n" for line in output))
+                sys.stdout.flush()
+            if stats_interval and now >= next_stats and rates:
+                next_stats += stats_interval
+                recent = list(rates)[-stats_interval:]
+                print(f"[{now:10.3f}] -- {sum(r[0] for r in recent) / len(recent):.1f} lines/s, "
+                      f"{sum(r[1] for r in recent) / len(recent):.0f} B/s "
+                      f"(peak {max(r[0] for r in recent)} lines/s)")
             
     except KeyboardInterrupt:
-        print("\nMonitoring stopped.")
+        elapsed = time.monotonic() - start
+        print(f"\nMonitoring stopped: {total_lines} lines, {total_bytes} bytes in {elapsed:.1f} s")
+        if rates:
+            print(f"Peak {max(r[0] for r in rates)} lines/s, {max(r[1] for r in rates)} B/s in the last minute")
+        log_filter.print_stats()
     except serial.SerialException as e:
         print(f"Error: {e}")
     finally:
@@ -108,7 +222,7 @@ def monitor_mode(port='/dev/ttyUSB0'):
 
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == 'monitor':
-        monitor_mode()
+        monitor_mode(rules=sys.argv[2] if len(sys.argv) > 2 else DEFAULT_RULES)
     else:
         ssid = sys.argv[1] if len(sys.argv) > 1 else "MechDog"
         password = sys.argv[2] if len(sys.argv) > 2 else "12345678"
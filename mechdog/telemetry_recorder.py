@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Columnar telemetry recorder for MechDog frames
+Every frame (and optionally every command sent) is appended to one
+memory-mapped file per column in <root>/<device_id>/, so recordings can be
+opened with NumPy without copying (see load()). Only one window of each
+column is mapped at a time, keeping memory bounded on long runs.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+RX = 0  # MechDog -> host
+TX = 1  # host -> MechDog
+MISSING = -1
+
+# name -> (struct format, NumPy dtype)
+COLUMNS = {
+    't_ns': ('<q', '<i8'),   # time.monotonic_ns() on the host
+    'dir': ('<B', 'u1'),     # RX / TX
+    'type': ('<B', 'u1'),    # command type
+    'v0': ('<i', '<i4'),     # first field (warning face / color / distance / battery / ...)
+    'v1': ('<i', '<i4'),
+    'v2': ('<i', '<i4'),
+}
+
+
+class _Column:
+    """One append-only column file, mapped one window at a time"""
+
+    def __init__(self, path, fmt, rows, window_rows):
+        self.fmt = fmt
+        self.itemsize = struct.calcsize(fmt)
+        self.window_bytes = window_rows * self.itemsize
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.map = None
+        self.window = -1
+        self._map_window(rows)
+
+    def _map_window(self, row):
+        window = row * self.itemsize // self.window_bytes
+        if window == self.window:
+            return
+        if self.map is not None:
+            self.map.close()
+        end = (window + 1) * self.window_bytes
+        if os.fstat(self.fd).st_size < end:
+            os.ftruncate(self.fd, end)
+        self.map = mmap.mmap(self.fd, self.window_bytes, offset=window * self.window_bytes)
+        self.window = window
+
+    def put(self, row, value):
+        offset = row * self.itemsize - self.window * self.window_bytes
+        if offset >= self.window_bytes:
+            self._map_window(row)
+            offset -= self.window_bytes
+        struct.pack_into(self.fmt, self.map, offset, value)
+
+    def flush(self):
+        self.map.flush()
+        os.fsync(self.fd)
+
+    def close(self, rows):
+        self.map.flush()
+        self.map.close()
+        os.ftruncate(self.fd, rows * self.itemsize)
+        os.fsync(self.fd)
+        os.close(self.fd)
+
+
+class TelemetryRecorder:
+    def __init__(self, root, device_id, window_rows=65536, fsync_interval=5.0):
+        """
+        Open (or continue) the recording of one device
+        window_rows must keep each window a multiple of the mmap granularity
+        """
+        self.path = os.path.join(root, device_id)
+        os.makedirs(self.path, exist_ok=True)
+        self.meta_path = os.path.join(self.path, 'meta.json')
+        self.rows = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.rows = json.load(f)['rows']
+        self.device_id = device_id
+        self.fsync_interval = fsync_interval
+        self._columns = [_Column(os.path.join(self.path, name), fmt, self.rows, window_rows)
+                         for name, (fmt, dtype) in COLUMNS.items()]
+        self._lock = threading.Lock()
+        self._next_sync = time.monotonic() + fsync_interval
+        self._write_meta()
+
+    def record(self, cmd_type, values=(), direction=RX, t_ns=None):
+        """Append one frame; values are ints (or numeric strings), missing ones become -1"""
+        if t_ns is None:
+            t_ns = time.monotonic_ns()
+        row_values = [MISSING, MISSING, MISSING]
+        for i, value in enumerate(values[:3]):
+            try:
+                row_values[i] = int(value)
+            except ValueError:
+                pass
+        with self._lock:
+            row = self.rows
+            t, d, ty, v0, v1, v2 = self._columns
+            t.put(row, t_ns)
+            d.put(row, direction)
+            ty.put(row, cmd_type)
+            v0.put(row, row_values[0])
+            v1.put(row, row_values[1])
+            v2.put(row, row_values[2])
+            self.rows = row + 1
+            if time.monotonic() >= self._next_sync:
+                self._sync()
+
+    def on_frame(self, cmd_type, fields, frame):
+        """MechDogIoT.subscribe() callback"""
+        self.record(cmd_type, fields)
+
+    def on_command(self, cmd_type, params):
+        """Called by MechDogIoT for every IoT command sent"""
+        self.record(cmd_type, params, TX)
+
+    def _sync(self):
+        for column in self._columns:
+            column.flush()
+        self._write_meta()
+        self._next_sync = time.monotonic() + self.fsync_interval
+
+    def _write_meta(self):
+        meta = {
+            'device': self.device_id,
+            'rows': self.rows,
+            'columns': {name: dtype for name, (fmt, dtype) in COLUMNS.items()},
+        }
+        tmp = self.meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def flush(self):
+        """Force everything recorded so far to disk"""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        """Trim the column files to the recorded rows and close them"""
+        with self._lock:
+            for column in self._columns:
+                column.close(self.rows)
+            self._write_meta()
+
+
+def load(path):
+    """
+    Open a recording directory as a dict of read-only NumPy arrays (zero copy)
+    Rows beyond meta.json's count (not yet synced) are left out.
+    """
+    import numpy as np
+
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    rows = meta['rows']
+    arrays = {}
+    for name, dtype in meta['columns'].items():
+        if rows == 0:
+            arrays[name] = np.zeros(0, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(os.path.join(path, name), dtype=dtype, mode='r', shape=(rows,))
+    return arrays
+
+
+if __name__ == "__main__":
+    import sys
+
+    from IoT import MechDogIoT
+
+    port = sys.argv[1] if len(sys.argv) > 1 else '/dev/ttyUSB0'
+    root = sys.argv[2] if len(sys.argv) > 2 else 'telemetry'
+
+    iot = MechDogIoT(port=port, verbose=False)
+    recorder = TelemetryRecorder(root, os.path.basename(port))
+    iot.attach_recorder(recorder)
+    iot.enable_sensor_distance(True)
+    print(f"Recording {port} to {recorder.path} (Ctrl+C to stop)...")
+    try:
+        while True:
+            time.sleep(1)
+            print(f"\r{recorder.rows} rows", end='', flush=True)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        iot.close()
+        recorder.close()